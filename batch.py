@@ -0,0 +1,328 @@
+"""
+FitPose batch processing - reprocess a directory or manifest of videos to Parquet
+
+Usage:
+    python batch.py videos/ --output out/ --workers 4
+    python batch.py manifest.txt --output out/ --exercise squat
+    python batch.py videos/ --output out/ --pose-backend onnx --pose-batch-size 16
+
+Writes one per-frame track per video to <output>/tracks/<video_id>.parquet and
+all per-video summaries to <output>/summaries.parquet. Progress is appended to
+<output>/checkpoint.jsonl, so re-running the same command resumes where an
+interrupted run stopped.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import pandas as pd
+    import pyarrow  # noqa: F401  (Parquet engine for pandas)
+except ImportError as e:
+    print(f"Missing dependencies: {e}")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+from src.backend.core.config import settings
+from src.cv.pose_backends import POSE_BACKENDS
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+# Per-process processor, created once by the pool initializer
+_processor = None
+
+# A video running when the pool breaks this many times is marked failed. After
+# the first break the videos that were running are retried one per pool, so the
+# second break is always the video's own.
+MAX_POOL_BREAKS_PER_VIDEO = 2
+
+
+def _init_worker(pose_backend: Optional[str] = None, pose_batch_size: Optional[int] = None) -> None:
+    global _processor
+    import cv2
+    from src.cv.video_processor import VideoProcessor
+
+    # Parallelism comes from processes; keep each one single-threaded
+    cv2.setNumThreads(1)
+    _processor = VideoProcessor(pose_backend, pose_batch_size)
+
+
+def video_id_for(path: str, root: str) -> str:
+    """Stable, readable id from the path relative to the input root"""
+    relative = os.path.relpath(path, root)
+    digest = hashlib.sha1(relative.encode('utf-8')).hexdigest()[:10]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{digest}"
+
+
+def collect_videos(source: str) -> Tuple[List[str], str]:
+    """Video paths from a directory (recursive) or a manifest file, plus the root for ids"""
+    if os.path.isdir(source):
+        paths = []
+        for dirpath, _, filenames in os.walk(source):
+            for name in filenames:
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    paths.append(os.path.join(dirpath, name))
+        return sorted(paths), source
+
+    root = os.path.dirname(os.path.abspath(source))
+    if source.endswith('.csv'):
+        entries = pd.read_csv(source)['path'].astype(str).tolist()
+    else:
+        with open(source, encoding='utf-8') as f:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [entry if os.path.isabs(entry) else os.path.join(root, entry) for entry in entries], root
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest checkpoint entry per video id; a torn last line from a crash is ignored"""
+    entries: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry['video_id']] = entry
+    return entries
+
+
+def is_done(entry: Optional[Dict[str, Any]], path: str, retry_failed: bool) -> bool:
+    """Whether a checkpointed video can be skipped (unchanged on disk since it was processed)"""
+    if not entry:
+        return False
+    if entry['status'] != 'ok' and retry_failed:
+        return False
+    stat = os.stat(path)
+    return entry['size'] == stat.st_size and entry['mtime'] == int(stat.st_mtime)
+
+
+def write_parquet_atomic(frame: 'pd.DataFrame', path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def failed_entry(path: str, video_id: str, error: str, seconds: float = 0.0) -> Dict[str, Any]:
+    """Checkpoint entry for a video whose worker did not return one"""
+    try:
+        stat = os.stat(path)
+        size, mtime = stat.st_size, int(stat.st_mtime)
+    except OSError:
+        size, mtime = None, None
+    return {'video_id': video_id, 'path': path, 'size': size, 'mtime': mtime,
+            'status': 'failed', 'seconds': round(seconds, 3), 'error': error}
+
+
+def process_one(path: str, video_id: str, tracks_dir: str, expected_exercise: Optional[str],
+                store_tracks: bool = False) -> Dict[str, Any]:
+    """Runs in a worker: processes one video, writes its track and returns the checkpoint entry"""
+    stat = os.stat(path)
+    entry: Dict[str, Any] = {
+        'video_id': video_id,
+        'path': path,
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+    }
+    started = time.perf_counter()
+    try:
+        if store_tracks:
+            # Keep the raw pose track for re-analysis and threshold sweeps (sweep.py)
+            from src.cv.landmark_store import LandmarkStore, content_sha256
+            result = None
+            pose_track = asyncio.run(_processor.extract_track(path))
+            if pose_track:
+                entry['track_id'] = content_sha256(path)
+                LandmarkStore(settings.landmark_store_dir).save(entry['track_id'], pose_track)
+                result = _processor.analyze_track(pose_track, expected_exercise)
+        else:
+            result = asyncio.run(_processor.process_video(path, expected_exercise))
+    except Exception as e:
+        result = None
+        entry['error'] = str(e)
+    elapsed = time.perf_counter() - started
+
+    if not result or not result.get('frames_data'):
+        entry.update(status='failed', seconds=round(elapsed, 3))
+        entry.setdefault('error', 'no pose detected or video unreadable')
+        return entry
+
+    try:
+        track = pd.DataFrame(result['frames_data'])
+        if 'interpolated' in track:
+            track['interpolated'] = track['interpolated'].fillna(False).astype(bool)
+        write_parquet_atomic(track, os.path.join(tracks_dir, f"{video_id}.parquet"))
+    except Exception as e:
+        entry.update(status='failed', seconds=round(elapsed, 3), error=f"track write failed: {e}")
+        return entry
+
+    movement = result.get('movement_analysis', {})
+    processing = result.get('processing_info', {})
+    classifier = movement.get('classifier') or {}
+    entry.update(
+        status='ok',
+        seconds=round(elapsed, 3),
+        summary={
+            'track_id': entry.get('track_id'),
+            'exercise_type': movement.get('exercise_type'),
+            'confidence': movement.get('confidence'),
+            'classifier_label': classifier.get('label'),
+            'rep_count': result.get('rep_count'),
+            'sets': len(result.get('sets') or []),
+            'duration': result.get('duration'),
+            'fps': result.get('fps'),
+            'source_total_frames': result.get('source_total_frames'),
+            'processed_frames': processing.get('processed_frames'),
+            'inference_calls': processing.get('inference_calls'),
+            'elbow_range': movement.get('elbow_range'),
+            'knee_range': movement.get('knee_range'),
+        },
+    )
+    return entry
+
+
+def write_summaries(entries: Dict[str, Dict[str, Any]], path: str) -> int:
+    rows = [
+        {'video_id': entry['video_id'], 'path': entry['path'], 'seconds': entry['seconds'], **entry['summary']}
+        for entry in entries.values() if entry['status'] == 'ok'
+    ]
+    if rows:
+        write_parquet_atomic(pd.DataFrame(rows), path)
+    return len(rows)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Process a directory or manifest of videos to Parquet")
+    parser.add_argument('source', help="directory of videos, or a manifest (.txt with one path per line, .csv with a 'path' column)")
+    parser.add_argument('--output', '-o', required=True, help="output directory")
+    parser.add_argument('--workers', '-w', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="worker processes (default: CPU count - 1)")
+    parser.add_argument('--exercise', default=None, help="expected exercise passed to the processor")
+    parser.add_argument('--retry-failed', action='store_true', help="reprocess videos that failed in a previous run")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and process everything")
+    parser.add_argument('--store-tracks', action='store_true',
+                        help="also save raw landmark tracks to LANDMARK_STORE_DIR (input for sweep.py)")
+    parser.add_argument('--pose-backend', choices=POSE_BACKENDS, default=None,
+                        help="pose estimation backend (default: POSE_BACKEND)")
+    parser.add_argument('--pose-batch-size', type=int, default=None,
+                        help="frames per inference call for batching backends (default: POSE_BATCH_SIZE)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    tracks_dir = os.path.join(args.output, 'tracks')
+    os.makedirs(tracks_dir, exist_ok=True)
+    checkpoint_path = os.path.join(args.output, 'checkpoint.jsonl')
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    videos, root = collect_videos(args.source)
+    checkpoint = load_checkpoint(checkpoint_path)
+    pending = []
+    for path in videos:
+        video_id = video_id_for(path, root)
+        if not os.path.exists(path):
+            print(f"Warning: missing video skipped: {path}")
+        elif not is_done(checkpoint.get(video_id), path, args.retry_failed):
+            pending.append((path, video_id))
+
+    print(f"{len(videos)} videos found, {len(videos) - len(pending)} already done, "
+          f"{len(pending)} to process with {args.workers} workers")
+
+    processed, failed, source_frames, processed_frames = 0, 0, 0, 0
+    started = time.perf_counter()
+    # spawn: MediaPipe graphs do not survive fork reliably
+    context = multiprocessing.get_context('spawn')
+    total = len(pending)
+    queue = deque(pending)
+    # Videos that were running when a worker died; retried alone to find the culprit
+    suspects: deque = deque()
+    pool_breaks: Dict[str, int] = {}
+    executor = None
+    try:
+        with open(checkpoint_path, 'a', encoding='utf-8') as log:
+            def record(entry: Dict[str, Any]) -> None:
+                nonlocal processed, failed, source_frames, processed_frames
+                log.write(json.dumps(entry) + '\n')
+                log.flush()
+                os.fsync(log.fileno())
+                checkpoint[entry['video_id']] = entry
+
+                if entry['status'] == 'ok':
+                    processed += 1
+                    source_frames += entry['summary'].get('source_total_frames') or 0
+                    processed_frames += entry['summary'].get('processed_frames') or 0
+                else:
+                    failed += 1
+                print(f"[{processed + failed}/{total}] {entry['status']:6} {entry['seconds']:7.2f}s {entry['path']}")
+
+            while queue or suspects:
+                isolated = bool(suspects)
+                source = suspects if isolated else queue
+                slots = 1 if isolated else args.workers
+                executor = ProcessPoolExecutor(max_workers=slots, mp_context=context,
+                                               initializer=_init_worker,
+                                               initargs=(args.pose_backend, args.pose_batch_size))
+                # No more futures than workers: only videos actually running are charged for a break
+                running: Dict[Any, Tuple[str, str]] = {}
+                broken = False
+                while source or running:
+                    while source and len(running) < slots and not broken:
+                        path, video_id = source.popleft()
+                        future = executor.submit(process_one, path, video_id, tracks_dir, args.exercise,
+                                                 args.store_tracks)
+                        running[future] = (path, video_id)
+                    if not running:
+                        break
+                    # After a break every running future fails too; collect them all
+                    done, _ = wait(running, return_when=ALL_COMPLETED if broken else FIRST_COMPLETED)
+                    for future in done:
+                        path, video_id = running.pop(future)
+                        try:
+                            entry = future.result()
+                        except BrokenProcessPool:
+                            # A worker died (crash, OOM kill); any running video may have caused it
+                            broken = True
+                            pool_breaks[video_id] = pool_breaks.get(video_id, 0) + 1
+                            if pool_breaks[video_id] < MAX_POOL_BREAKS_PER_VIDEO:
+                                suspects.append((path, video_id))
+                                continue
+                            entry = failed_entry(path, video_id, "worker process died while processing this video")
+                        except Exception as e:
+                            entry = failed_entry(path, video_id, f"worker error: {e}")
+                        record(entry)
+                    if broken and not running:
+                        break
+                executor.shutdown(wait=not broken)
+                if broken and suspects:
+                    print(f"Worker pool broke; retrying {len(suspects)} videos that were running, one at a time")
+    except KeyboardInterrupt:
+        print("Interrupted; progress is checkpointed, re-run the same command to resume")
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    summaries = write_summaries(checkpoint, os.path.join(args.output, 'summaries.parquet'))
+    print(f"Done: {processed} ok, {failed} failed in {elapsed:.1f}s; {summaries} summaries written")
+    if processed or failed:
+        print(f"Throughput ({args.pose_backend or settings.pose_backend} backend): "
+              f"{(processed + failed) / elapsed * 60:.1f} videos/min, "
+              f"{source_frames / elapsed:.1f} source frames/s, {processed_frames / elapsed:.1f} processed frames/s")
+    return 0 if not failed else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+"""
+FitPose load test - concurrent uploads against the full app with a local LLM stub
+
+Usage:
+    python loadtest.py --concurrency 8 --duration 60
+    python loadtest.py --mix exercise=1,vectors=3 --llm-latency 2.0 --llm-error-rate 0.1
+    python loadtest.py --videos clips/ --server inprocess --output report.json
+    python loadtest.py --url http://staging:8000 --concurrency 4   # existing server, no stub
+
+Starts the API (uvicorn running main:app, as a subprocess by default), points
+it at a local OpenAI-compatible stub with configurable latency and error rate,
+and keeps `--concurrency` clients busy with analyze-exercise uploads and
+analyze-vectors calls. Reports throughput, p50/p95/p99 latency in total and per
+server stage (from the Server-Timing header), response codes and the server's
+CPU and RSS over time.
+
+Without --videos, a corpus of synthetic clips (a moving block, no person) is
+generated: these exercise decoding and pose inference at realistic cost but
+end in 422 NO_PERSON, so the LLM path is covered by analyze-vectors. Use
+recorded exercise clips to load the whole pipeline.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+try:
+    import numpy as np
+    import requests
+except ImportError as e:
+    print(f"Missing dependencies: {e}")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+PERCENTILES = (50, 95, 99)
+
+STUB_FEEDBACK = {
+    'overall_score': 7,
+    'exercise_detected': 'Squat',
+    'technique_analysis': {
+        'form_quality': 'good',
+        'symmetry': 'balanced',
+        'range_of_motion': 'full',
+        'tempo': 'steady',
+    },
+    'feedback': {
+        'positive': ['Consistent depth'],
+        'improvements': ['Keep the chest up at the bottom'],
+        'specific_tips': ['Drive through the heels'],
+    },
+    'rep_count_accuracy': 'approximate',
+    'safety_concerns': [],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LLMStub:
+    """OpenAI-compatible /chat/completions that sleeps `latency` +- `jitter`
+    seconds and fails `error_rate` of the calls with 500 or 429"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.counts = {'requests': 0, 'errors': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.api_base = f"http://127.0.0.1:{self.port}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with stub._lock:
+                    stub.counts['requests'] += 1
+                    delay = max(0.0, stub._random.gauss(stub.latency, stub.jitter))
+                    fail = stub._random.random() < stub.error_rate
+                    status = stub._random.choice((500, 429)) if fail else 200
+                    if fail:
+                        stub.counts['errors'] += 1
+                time.sleep(delay)
+                body = {'error': {'message': 'injected failure'}} if fail else {
+                    'choices': [{'message': {'role': 'assistant', 'content': json.dumps(STUB_FEEDBACK)}}],
+                    'usage': {'prompt_tokens': 300, 'completion_tokens': 120},
+                }
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+
+def make_corpus(directory: str, count: int, seed: int = 0) -> List[str]:
+    """Synthetic 640x480 clips of 4-12 s at 24-60 fps: a block moving up and down"""
+    import cv2
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        fps = rng.choice((24, 30, 30, 60))
+        frames = int(rng.uniform(4, 12) * fps)
+        path = os.path.join(directory, f"synthetic_{i:02d}.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (640, 480))
+        period = rng.uniform(1.5, 3.0) * fps
+        for f in range(frames):
+            frame = np.full((480, 640, 3), 40, dtype=np.uint8)
+            y = int(240 + 120 * np.sin(2 * np.pi * f / period))
+            cv2.rectangle(frame, (280, y - 60), (360, y + 60), (230, 230, 230), -1)
+            writer.write(frame)
+        writer.release()
+        paths.append(path)
+    return paths
+
+
+def make_vectors(rng: random.Random) -> Dict[str, Any]:
+    """analyze-vectors payload: a squat-like knee angle track"""
+    fps, frames = 30.0, rng.randint(150, 450)
+    reps = rng.randint(3, 12)
+    frames_data = []
+    for i in range(frames):
+        knee = 125 + 45 * np.cos(2 * np.pi * reps * i / frames)
+        frames_data.append({
+            'frame_id': i,
+            'timestamp': i / fps,
+            'left_knee_angle': float(knee),
+            'right_knee_angle': float(knee + rng.uniform(-4, 4)),
+            'left_elbow_angle': 165.0,
+            'right_elbow_angle': 165.0,
+        })
+    return {
+        'total_frames': frames,
+        'duration': frames / fps,
+        'fps': fps,
+        'rep_count': reps,
+        'frames_data': frames_data,
+        'movement_analysis': {
+            'exercise_type': 'squat',
+            'confidence': 0.9,
+            'estimated_reps': reps,
+            'knee_range': 90.0,
+            'elbow_range': 5.0,
+            'avg_left_knee_angle': 125.0,
+            'avg_right_knee_angle': 125.0,
+            'avg_left_elbow_angle': 165.0,
+            'avg_right_elbow_angle': 165.0,
+        },
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """`name;dur=12.3, ...` -> {name: seconds}"""
+    timings = {}
+    for entry in (header or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        if name and params.startswith('dur='):
+            try:
+                timings[name] = float(params[4:]) / 1000.0
+            except ValueError:
+                pass
+    return timings
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ('exercise', 'vectors'):
+            raise ValueError(f"Unknown request kind '{name}' (expected exercise, vectors)")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ResourceSampler:
+    """CPU% and RSS of one process from /proc, every `interval` seconds"""
+
+    def __init__(self, pid: int, interval: float):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[Dict[str, float]] = []
+        self._stop = threading.Event()
+        self._ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def _read(self) -> Optional[Dict[str, float]]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f"/proc/{self.pid}/status") as f:
+                rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration, IndexError, ValueError):
+            return None
+        return {'cpu_seconds': (int(fields[11]) + int(fields[12])) / self._ticks, 'rss_mb': rss_kb / 1024}
+
+    def _run(self, started: float) -> None:
+        previous, previous_at = self._read(), time.perf_counter()
+        while not self._stop.wait(self.interval):
+            current, now = self._read(), time.perf_counter()
+            if current is None or previous is None:
+                break
+            self.samples.append({
+                't': round(now - started, 2),
+                'cpu_percent': round(100 * (current['cpu_seconds'] - previous['cpu_seconds']) / (now - previous_at), 1),
+                'rss_mb': round(current['rss_mb'], 1),
+            })
+            previous, previous_at = current, now
+
+    def start(self, started: float) -> bool:
+        if self._read() is None:
+            print("Warning: /proc not readable; CPU and RSS are not sampled")
+            return False
+        threading.Thread(target=self._run, args=(started,), daemon=True).start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def server_env(stub: Optional[LLMStub], args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'HISTORY_ENABLED': 'false',
+        # Every upload pays for decoding and inference, as first uploads do
+        'LANDMARK_STORE_ENABLED': 'true' if args.reuse_tracks else 'false',
+        'FEEDBACK_POLICY': args.feedback_policy,
+        'DEBUG': 'false',
+    })
+    if stub is not None:
+        env.update({'OPENAI_API_BASE': stub.api_base, 'OPENAI_API_KEY': 'loadtest', 'LLM_PROVIDERS': ''})
+    return env
+
+
+def start_subprocess_server(env: Dict[str, str], port: int, workers: int) -> subprocess.Popen:
+    command = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(workers), '--log-level', 'warning']
+    return subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_inprocess_server(env: Dict[str, str], port: int):
+    """uvicorn in a thread of this process; settings are read from the environment at import"""
+    os.environ.update(env)
+    import uvicorn
+    from main import create_app
+
+    server = uvicorn.Server(uvicorn.Config(create_app(), host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def wait_ready(url: str, timeout: float) -> bool:
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def error_code(response: requests.Response) -> str:
+    """Status plus the structured error code, e.g. '422 NO_PERSON'"""
+    if response.status_code < 400:
+        return str(response.status_code)
+    try:
+        detail = response.json().get('detail')
+    except ValueError:
+        detail = None
+    code = detail.get('code') if isinstance(detail, dict) else None
+    return f"{response.status_code} {code}" if code else str(response.status_code)
+
+
+def client_loop(url: str, videos: List[str], mix: Dict[str, float], stop_at: float,
+                remaining: List[int], lock: threading.Lock, records: List[Dict[str, Any]], seed: int) -> None:
+    rng = random.Random(seed)
+    session = requests.Session()
+    kinds, weights = list(mix), list(mix.values())
+    while time.perf_counter() < stop_at:
+        with lock:
+            if remaining[0] == 0:
+                return
+            remaining[0] -= 1
+        kind = rng.choices(kinds, weights)[0]
+        started = time.perf_counter()
+        try:
+            if kind == 'exercise':
+                path = rng.choice(videos)
+                with open(path, 'rb') as f:
+                    response = session.post(f"{url}/api/v1/analyze-exercise",
+                                            files={'file': (os.path.basename(path), f, 'video/mp4')}, timeout=600)
+            else:
+                response = session.post(f"{url}/api/v1/analyze-vectors", json=make_vectors(rng), timeout=600)
+            code = error_code(response)
+            stages = parse_server_timing(response.headers.get('server-timing', ''))
+        except requests.RequestException as e:
+            code, stages = f"client {type(e).__name__}", {}
+        latency = time.perf_counter() - started
+        with lock:
+            records.append({'kind': kind, 'code': code, 'latency': latency, 'stages': stages, 'at': started})
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def summarize(records: List[Dict[str, Any]], elapsed: float, samples: List[Dict[str, float]]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        'elapsed_seconds': round(elapsed, 2),
+        'requests': len(records),
+        'throughput_rps': round(len(records) / elapsed, 3) if elapsed else 0.0,
+        'kinds': {},
+    }
+    for kind in sorted({r['kind'] for r in records}):
+        rows = [r for r in records if r['kind'] == kind]
+        codes: Dict[str, int] = {}
+        for r in rows:
+            codes[r['code']] = codes.get(r['code'], 0) + 1
+        stage_names = sorted({name for r in rows for name in r['stages']})
+        report['kinds'][kind] = {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / elapsed, 3) if elapsed else 0.0,
+            'codes': codes,
+            'latency': percentiles([r['latency'] for r in rows]),
+            'stages': {name: percentiles([r['stages'][name] for r in rows if name in r['stages']])
+                       for name in stage_names},
+        }
+    if samples:
+        cpu = [s['cpu_percent'] for s in samples]
+        rss = [s['rss_mb'] for s in samples]
+        report['resources'] = {
+            'cpu_percent': {'mean': round(float(np.mean(cpu)), 1), 'max': max(cpu)},
+            'rss_mb': {'start': rss[0], 'max': max(rss), 'end': rss[-1]},
+            'samples': samples,
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['requests']} requests in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']} req/s)")
+    for kind, stats in report['kinds'].items():
+        codes = ', '.join(f"{code}: {n}" for code, n in sorted(stats['codes'].items()))
+        print(f"\n{kind}: {stats['requests']} requests, {stats['throughput_rps']} req/s  [{codes}]")
+        print(f"  {'stage':12} {'p50':>8} {'p95':>8} {'p99':>8}  (seconds)")
+        for name, values in [('client', stats['latency'])] + list(stats['stages'].items()):
+            cells = ' '.join(f"{values[f'p{p}']:8.3f}" if values[f'p{p}'] is not None else f"{'-':>8}"
+                             for p in PERCENTILES)
+            print(f"  {name:12} {cells}")
+    resources = report.get('resources')
+    if resources:
+        print(f"\nServer CPU: mean {resources['cpu_percent']['mean']}%, max {resources['cpu_percent']['max']}%; "
+              f"RSS: {resources['rss_mb']['start']} -> {resources['rss_mb']['end']} MB "
+              f"(max {resources['rss_mb']['max']} MB)")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the FitPose API with a local LLM stub")
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help="concurrent clients")
+    parser.add_argument('--duration', '-d', type=float, default=60.0, help="seconds of load")
+    parser.add_argument('--requests', '-n', type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument('--mix', default='exercise=1,vectors=1', help="request weights, e.g. exercise=3,vectors=1")
+    parser.add_argument('--videos', help="directory of clips to upload (default: generated synthetic clips)")
+    parser.add_argument('--corpus-size', type=int, default=8, help="synthetic clips to generate")
+    parser.add_argument('--server', choices=('subprocess', 'inprocess'), default='subprocess',
+                        help="run the app under uvicorn in a subprocess or in this process")
+    parser.add_argument('--server-workers', type=int, default=1, help="uvicorn worker processes (subprocess mode)")
+    parser.add_argument('--url', help="test an already running server instead (no LLM stub, no resource sampling)")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="mean stub LLM latency, seconds")
+    parser.add_argument('--llm-jitter', type=float, default=0.3, help="standard deviation of the stub latency")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="fraction of stub calls failing with 500/429")
+    parser.add_argument('--feedback-policy', default='llm', choices=('llm', 'rules', 'rules_first'),
+                        help="FEEDBACK_POLICY of the server under test (default llm, so every call reaches the stub)")
+    parser.add_argument('--reuse-tracks', action='store_true',
+                        help="keep the landmark store on (repeat uploads skip inference)")
+    parser.add_argument('--sample-interval', type=float, default=1.0, help="seconds between CPU/RSS samples")
+    parser.add_argument('--output', '-o', help="write the full report (with time series) as JSON")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+
+    videos: List[str] = []
+    if 'exercise' in mix:
+        if args.videos:
+            videos = sorted(os.path.join(args.videos, name) for name in os.listdir(args.videos)
+                            if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos = make_corpus(tempfile.mkdtemp(prefix='fitpose_loadtest_'), args.corpus_size, args.seed)
+        if not videos:
+            print("Error: no videos to upload")
+            return 2
+
+    stub, process, sampler = None, None, None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        stub = LLMStub(args.llm_latency, args.llm_jitter, args.llm_error_rate, args.seed)
+        stub.start()
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        env = server_env(stub, args)
+        if args.server == 'subprocess':
+            process = start_subprocess_server(env, port, args.server_workers)
+            pid = process.pid
+        else:
+            start_inprocess_server(env, port)
+            # Includes the load generator's own threads
+            pid = os.getpid()
+        if not wait_ready(url, timeout=120):
+            print("Error: server did not become ready")
+            if process:
+                process.terminate()
+            return 2
+        if args.server == 'subprocess' and args.server_workers > 1:
+            print("Note: with several uvicorn workers only the supervisor process is sampled")
+        sampler = ResourceSampler(pid, args.sample_interval)
+
+    print(f"Load: {args.concurrency} clients, {args.duration:g}s, mix {mix}, {len(videos)} videos -> {url}")
+    records: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    remaining = [args.requests or -1]
+    started = time.perf_counter()
+    if sampler and not sampler.start(started):
+        sampler = None
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for i in range(args.concurrency):
+                pool.submit(client_loop, url, videos, mix, started + args.duration,
+                            remaining, lock, records, args.seed + i)
+    except KeyboardInterrupt:
+        print("Interrupted; reporting what finished")
+    elapsed = time.perf_counter() - started
+    if sampler:
+        sampler.stop()
+
+    report = summarize(records, elapsed, sampler.samples if sampler else [])
+    if stub:
+        report['llm_stub'] = dict(stub.counts, latency=args.llm_latency, jitter=args.llm_jitter,
+                                  error_rate=args.llm_error_rate)
+        stub.stop()
+    if process:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,9 +10,32 @@ except ImportError as e:
     print("Run: pip install -r requirements.txt")
     exit(1)
 
+from contextlib import asynccontextmanager
+
 from src.backend.core.config import settings
+from src.backend.core.deadline import DeadlineMiddleware
+from src.backend.core.profiling import ProfilingMiddleware, gc_profiles
 from src.backend.api.system_routes import router as system_router
 from src.backend.api.exercise_routes import router as exercise_router
+from src.backend.api.history_routes import router as history_router
+from src.backend.api.upload_routes import router as upload_router
+from src.backend.api.job_routes import router as job_router
+from src.backend.services.temp_janitor import temp_janitor
+from src.backend.services.job_broker import gc_jobs
+from src.backend.services.upload_service import upload_manager
+from src.cv.landmark_store import gc_tracks
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Background tasks that live as long as the app"""
+    temp_janitor.add_hook('uploads', upload_manager.gc)
+    temp_janitor.add_hook('jobs', gc_jobs)
+    temp_janitor.add_hook('profiles', gc_profiles)
+    temp_janitor.add_hook('tracks', gc_tracks)
+    temp_janitor.start()
+    yield
+    await temp_janitor.stop()
 
 
 def create_app() -> FastAPI:
@@ -22,7 +45,8 @@ def create_app() -> FastAPI:
         title=settings.app_name,
         version=settings.app_version,
         description="AI-powered exercise analysis API",
-        debug=settings.debug
+        debug=settings.debug,
+        lifespan=lifespan
     )
     
     # CORS middleware
@@ -33,10 +57,17 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # Request deadline clock starts when the request arrives, before the upload body
+    app.add_middleware(DeadlineMiddleware)
+    # Outermost, so a requested profile covers the whole request
+    app.add_middleware(ProfilingMiddleware)
     
     # Connect routes
     app.include_router(system_router)
     app.include_router(exercise_router)
+    app.include_router(history_router)
+    app.include_router(upload_router)
+    app.include_router(job_router)
     
     return app
 
@@ -0,0 +1,188 @@
+"""
+FitPose production server - pre-forked uvicorn workers sized to the CPU quota
+
+Usage:
+    python serve.py
+    python serve.py --workers 4 --threads-per-worker 2
+    python serve.py --print-plan
+
+Reads the container's CPU budget (cgroup quota and CPU set, not the host's
+core count) and starts one worker per SERVE_THREADS_PER_WORKER CPUs. Every
+worker caps OpenCV, BLAS/OpenMP, video decoding and ONNX Runtime at that many
+threads, so the workers together run about one busy thread per core.
+
+With SERVE_PRELOAD the app and the CV stack (OpenCV, MediaPipe, NumPy, PyAV)
+are imported once in the supervisor and the workers are forked from it, so
+their code and read-only data pages are shared copy-on-write. Pose graphs are
+still created per request inside the workers: MediaPipe starts threads when a
+graph is built, and threads do not survive a fork.
+
+The supervisor binds the port, restarts workers that exit and forwards
+SIGTERM/SIGINT for a graceful shutdown. Each worker has its own admission
+controller, LLM client and janitor; ADMISSION_CPU_BUDGET_SECONDS applies per
+worker.
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+from src.backend.core.config import settings
+from src.backend.core.cpu_limits import limit_loaded_threads, limit_thread_env, pin_cpus, serving_plan
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_UPTIME_SECONDS = 5.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, sock: socket.socket, plan: Dict[str, Any], pin: bool) -> int:
+    """Worker process body: thread limits, optional CPU pinning, then uvicorn on the shared socket"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        import uvicorn
+        import main
+    except ImportError as e:
+        print(f"Missing dependencies: {e}")
+        print("Run: pip install -r requirements.txt")
+        return 1
+    threads = plan['threads_per_worker']
+    limit_loaded_threads(threads)
+    cpus = pin_cpus(index, threads) if pin else None
+    print(f"Worker {index} (pid {os.getpid()}): {threads} thread(s)" + (f", CPUs {cpus}" if cpus else ""))
+    config = uvicorn.Config(main.app, log_level='debug' if settings.debug else 'info')
+    uvicorn.Server(config).run(sockets=[sock])
+    return 0
+
+
+class Supervisor:
+    """Forks the workers, restarts the ones that exit and stops them on a signal"""
+
+    def __init__(self, sock: socket.socket, plan: Dict[str, Any], pin: bool, graceful_timeout: float):
+        self.sock = sock
+        self.plan = plan
+        self.pin = pin
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, Dict[str, Any]] = {}
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _run_worker(index, self.sock, self.plan, self.pin)
+            finally:
+                os._exit(code)
+        self.workers[pid] = {'index': index, 'started': time.monotonic()}
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.plan['workers']):
+            self.spawn(index)
+
+        deadline: Optional[float] = None
+        while self.workers:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + self.graceful_timeout
+            if deadline is not None and time.monotonic() > deadline:
+                for pid in list(self.workers):
+                    print(f"Worker pid {pid} did not stop in {self.graceful_timeout:.0f}s; killing it")
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                deadline = float('inf')
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+            worker = self.workers.pop(pid, None)
+            if worker is None or self.stopping:
+                continue
+            uptime = time.monotonic() - worker['started']
+            print(f"Worker {worker['index']} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+            if uptime < MIN_WORKER_UPTIME_SECONDS:
+                time.sleep(MIN_WORKER_UPTIME_SECONDS - uptime)
+            if not self.stopping:
+                self.spawn(worker['index'])
+        return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked workers sized to the CPU quota")
+    parser.add_argument('--host', default=settings.host)
+    parser.add_argument('--port', type=int, default=settings.port)
+    parser.add_argument('--workers', type=int, default=settings.serve_workers,
+                        help="Worker processes (0 = available CPUs / threads per worker)")
+    parser.add_argument('--threads-per-worker', type=int, default=settings.serve_threads_per_worker,
+                        help="CPU threads per worker (ignored when --workers is set: CPUs are shared equally)")
+    parser.add_argument('--no-preload', action='store_true', help="Import the app in each worker instead")
+    parser.add_argument('--pin-cpus', action='store_true', default=settings.serve_pin_cpus,
+                        help="Pin each worker to its own CPUs")
+    parser.add_argument('--print-plan', action='store_true', help="Print the worker/thread plan and exit")
+    args = parser.parse_args(argv)
+
+    plan = serving_plan(args.workers, args.threads_per_worker)
+    if args.print_plan:
+        print(json.dumps(plan, indent=2))
+        return 0
+
+    threads = plan['threads_per_worker']
+    # Before numpy/cv2 load: BLAS reads its pool size once, settings are inherited by the workers
+    limit_thread_env(threads)
+    if not settings.decode_threads:
+        settings.decode_threads = threads
+    if not settings.pose_intra_op_threads:
+        settings.pose_intra_op_threads = threads
+
+    preload = settings.serve_preload and not args.no_preload
+    if preload:
+        try:
+            import main as app_module  # noqa: F401 - loaded for the workers to inherit
+        except ImportError as e:
+            print(f"Missing dependencies: {e}")
+            print("Run: pip install -r requirements.txt")
+            return 1
+        limit_loaded_threads(threads)
+        # Keep the collector from touching (and so copying) every preloaded object in each worker
+        gc.collect()
+        gc.freeze()
+
+    sock = _bind(args.host, args.port)
+    print(
+        f"Serving on {args.host}:{args.port}: {plan['workers']} worker(s) x {threads} thread(s) "
+        f"({plan['usable']} usable CPUs of {plan['host_cpus']}; quota {plan['quota'] or 'none'}), "
+        f"preload {'on' if preload else 'off'}"
+    )
+    return Supervisor(sock, plan, args.pin_cpus, settings.serve_graceful_timeout_seconds).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,18 @@
 """
 API routes for exercise analysis
 """
+import json
 from typing import Dict, Any, Optional
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
+from src.backend.core.config import settings
+from src.backend.core.user_auth import authenticated_user
+from src.backend.core.deadline import get_request_deadline
 from src.backend.services.video_service import VideoService
 from src.backend.services.analysis_service import AnalysisService
+from src.backend.services.admission_service import get_client_id
+from src.backend.services.probe_service import ProbeService
 
 router = APIRouter(prefix="/api/v1", tags=["exercise"])
 
@@ -20,27 +26,190 @@ router = APIRouter(prefix="/api/v1", tags=["exercise"])
     
     Supported formats: MP4, AVI, MOV, MKV
     Maximum file size: 50MB
+
+    Optional `start`/`end` (seconds) limit decoding and analysis to that
+    window; times in the result then count from `start` (`metrics.window`).
     """
 )
 async def analyze_exercise(
+    request: Request,
     file: UploadFile = File(...),
     exercise_type: Optional[str] = Form(None),
     strict: Optional[bool] = Form(False),
+    start: Optional[float] = Form(None),
+    end: Optional[float] = Form(None),
 ):
     """Main endpoint for exercise analysis"""
     
     video_service = VideoService()
     analysis_service = AnalysisService()
+    deadline = get_request_deadline(request)
     
     # Process video
     vectors_data = await video_service.process_video(
         file,
         expected_exercise=exercise_type,
         strict=bool(strict),
+        client_id=get_client_id(request),
+        deadline=deadline,
+        start=start,
+        end=end,
     )
     
     # Analyze with AI
-    result = await analysis_service.analyze_exercise_data(vectors_data)
+    result = await analysis_service.analyze_exercise_data(
+        vectors_data,
+        user_id=authenticated_user(request),
+        deadline=deadline,
+    )
+    
+    return JSONResponse(content=result)
+
+
+@router.post(
+    "/analyze-exercise/stream",
+    summary="Exercise analysis by video, streamed",
+    description="""
+    Same input as /analyze-exercise. Responds with newline-delimited JSON:
+    a `metrics` event as soon as the video is processed, a `field` event
+    (`path`, `value`) for each AI feedback field as it is generated, and a
+    final `result` event with the same body as /analyze-exercise.
+    """
+)
+async def analyze_exercise_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    exercise_type: Optional[str] = Form(None),
+    strict: Optional[bool] = Form(False),
+    start: Optional[float] = Form(None),
+    end: Optional[float] = Form(None),
+):
+    """Streaming variant of the exercise analysis endpoint"""
+    
+    video_service = VideoService()
+    analysis_service = AnalysisService()
+    deadline = get_request_deadline(request)
+    
+    # Video errors are still returned as regular HTTP errors
+    vectors_data = await video_service.process_video(
+        file,
+        expected_exercise=exercise_type,
+        strict=bool(strict),
+        client_id=get_client_id(request),
+        deadline=deadline,
+        start=start,
+        end=end,
+    )
+    
+    async def events():
+        stream = analysis_service.analyze_exercise_stream(
+            vectors_data,
+            user_id=authenticated_user(request),
+            deadline=deadline,
+        )
+        try:
+            async for event in stream:
+                if await request.is_disconnected():
+                    # Nobody reads the rest: closing the stream cancels the LLM request
+                    break
+                yield json.dumps(event, default=float) + "\n"
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/probe",
+    summary="Pre-flight video check",
+    description="""
+    Checks a video before the full upload. Send the first few MB of the file
+    as `file` together with the full `file_size`. Returns duration, resolution,
+    fps, the estimated processing cost and a `verdict`.
+
+    - `accept` / `reject`: `reject` comes with `issues` (`TOO_SHORT`,
+      `JOB_TOO_EXPENSIVE` with `max_duration_seconds`, `NO_PERSON`, ...).
+    - `need_more`: the MP4 header is stored at the end of the file. Repeat the
+      call with bytes `[need_range.offset, need_range.end)` as `tail` and
+      `tail_offset` = `need_range.offset`. `tail` requires `file_size`.
+
+    `check_person=true` also runs pose detection on a few frames of the first seconds.
+    """
+)
+async def probe_video(
+    file: UploadFile = File(...),
+    file_size: Optional[int] = Form(None),
+    tail: Optional[UploadFile] = File(None),
+    tail_offset: Optional[int] = Form(None),
+    check_person: Optional[bool] = Form(False),
+):
+    """Pre-flight probe endpoint"""
+    max_chunk = int(settings.probe_max_chunk_mb * 1024 * 1024)
+    head = await file.read(max_chunk + 1)
+    tail_bytes = await tail.read(max_chunk + 1) if tail is not None else None
+    if len(head) > max_chunk or (tail_bytes is not None and len(tail_bytes) > max_chunk):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Probe chunks are limited to {settings.probe_max_chunk_mb:g}MB"
+        )
+    if tail_bytes is not None:
+        if file_size is None or tail_offset is None:
+            raise HTTPException(status_code=400, detail="`tail` requires `tail_offset` and `file_size`")
+        if tail_offset < 0 or tail_offset + len(tail_bytes) > file_size:
+            raise HTTPException(
+                status_code=400,
+                detail="`tail` must lie within the file: 0 <= tail_offset and tail_offset + len(tail) <= file_size"
+            )
+
+    result = await ProbeService().probe(
+        head,
+        filename=file.filename,
+        file_size=file_size,
+        tail=tail_bytes,
+        tail_offset=tail_offset,
+        check_person=bool(check_person),
+    )
+    return JSONResponse(content=result)
+
+
+@router.post(
+    "/tracks/{track_id}/analyze",
+    summary="Re-analysis of a stored pose track",
+    description="""
+    Re-runs feature extraction, rep counting, quality gates and AI feedback on
+    the landmark track saved when the video was first analyzed (`metrics.track_id`),
+    without decoding the video or running pose inference again. Uses the
+    current analysis code and settings, so results reflect threshold or
+    classifier changes. Same form fields as /analyze-exercise, minus the file;
+    `start`/`end` analyze a window of the stored track.
+    """
+)
+async def reanalyze_track(
+    request: Request,
+    track_id: str,
+    exercise_type: Optional[str] = Form(None),
+    strict: Optional[bool] = Form(False),
+    start: Optional[float] = Form(None),
+    end: Optional[float] = Form(None),
+):
+    """Analysis from a stored landmark track"""
+    
+    video_service = VideoService()
+    analysis_service = AnalysisService()
+    
+    vectors_data = await video_service.reanalyze_track(
+        track_id,
+        expected_exercise=exercise_type,
+        strict=bool(strict),
+        start=start,
+        end=end,
+    )
+    
+    result = await analysis_service.analyze_exercise_data(
+        vectors_data,
+        user_id=authenticated_user(request),
+        deadline=get_request_deadline(request),
+    )
     
     return JSONResponse(content=result)
 
@@ -50,7 +219,7 @@ async def analyze_exercise(
     summary="Analysis of motion vectors",
     description="Analyzes extracted motion vectors using AI"
 )
-async def analyze_vectors(vectors_data: Dict[str, Any]):
+async def analyze_vectors(request: Request, vectors_data: Dict[str, Any]):
     """Endpoint for analyzing motion vectors"""
     
     analysis_service = AnalysisService()
@@ -63,6 +232,10 @@ async def analyze_vectors(vectors_data: Dict[str, Any]):
         )
     
     # Analyze with AI
-    result = await analysis_service.analyze_exercise_data(vectors_data)
+    result = await analysis_service.analyze_exercise_data(
+        vectors_data,
+        user_id=authenticated_user(request),
+        deadline=get_request_deadline(request),
+    )
     
     return JSONResponse(content=result)
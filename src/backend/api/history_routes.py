@@ -0,0 +1,70 @@
+"""
+API routes for analysis history and progress trends
+"""
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+
+from src.backend.core.config import settings
+from src.backend.core.user_auth import authenticated_user
+from src.backend.services.history_service import get_history_store
+
+router = APIRouter(prefix="/api/v1/history", tags=["history"])
+
+
+def _authorize(request: Request, user_id: str) -> None:
+    """Only the user a bearer token was issued to may read their history"""
+    if not settings.history_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    principal = authenticated_user(request)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="User token required")
+    if principal != user_id:
+        # Same answer as for an unknown user: do not confirm that others exist
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get(
+    "/{user_id}",
+    summary="Analysis history",
+    description="Returns the user's past analyses, newest first. Paginate with `before` (created_at of the last item)."
+)
+async def get_history(
+    request: Request,
+    user_id: str,
+    exercise: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[float] = Query(None),
+):
+    """Analysis history for a user"""
+    _authorize(request, user_id)
+    items = await run_in_threadpool(
+        lambda: get_history_store().history(user_id, exercise=exercise, limit=limit, before=before)
+    )
+    return {"user_id": user_id, "items": items}
+
+
+@router.get(
+    "/{user_id}/trends",
+    summary="Progress trends",
+    description="Returns per-exercise aggregates: session counts, averages and rolling averages of score, ROM and reps"
+)
+async def get_trends(request: Request, user_id: str, exercise: Optional[str] = Query(None)):
+    """Aggregated progress for a user"""
+    _authorize(request, user_id)
+    trends = await run_in_threadpool(lambda: get_history_store().trends(user_id, exercise=exercise))
+    return {"user_id": user_id, "trends": trends}
+
+
+@router.get(
+    "/{user_id}/analyses/{analysis_id}/track",
+    summary="Per-frame track of an analysis",
+    description="Returns the stored per-frame joint angle track of one analysis"
+)
+async def get_track(request: Request, user_id: str, analysis_id: int):
+    """Stored angle track"""
+    _authorize(request, user_id)
+    track = await run_in_threadpool(lambda: get_history_store().track(user_id, analysis_id))
+    if track is None:
+        raise HTTPException(status_code=404, detail="Analysis track not found")
+    return {"user_id": user_id, "analysis_id": analysis_id, "track": track}
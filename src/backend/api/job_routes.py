@@ -0,0 +1,67 @@
+"""
+API routes for queued analysis jobs, processed by worker.py
+"""
+import asyncio
+import os
+from typing import Optional
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse
+
+from src.backend.core.user_auth import authenticated_user
+from src.backend.services.video_service import VideoService
+from src.backend.services.admission_service import get_client_id
+from src.backend.services.job_broker import get_job_broker, store_job_video
+
+router = APIRouter(prefix="/api/v1/jobs", tags=["jobs"])
+
+
+@router.post(
+    "",
+    status_code=202,
+    summary="Queue an exercise analysis",
+    description="""
+    Same input as /api/v1/analyze-exercise, but the video is stored and
+    analyzed by a worker process (`python worker.py`). Returns a `job_id`;
+    poll GET /api/v1/jobs/{job_id} until `status` is `done` (with `result`,
+    the /analyze-exercise response body) or `failed` (with `error`).
+    """
+)
+async def create_job(
+    request: Request,
+    file: UploadFile = File(...),
+    exercise_type: Optional[str] = Form(None),
+    strict: Optional[bool] = Form(False),
+    start: Optional[float] = Form(None),
+    end: Optional[float] = Form(None),
+):
+    """Stores the video in shared storage and enqueues it"""
+    video_service = VideoService()
+    await video_service.validate_video_file(file)
+    video_service.validate_window(start, end)
+    content = await file.read()
+    suffix = os.path.splitext(file.filename or '')[1].lower() or '.mp4'
+    video_key = await asyncio.get_running_loop().run_in_executor(None, store_job_video, content, suffix)
+
+    job_id = get_job_broker().enqueue({
+        'video': video_key,
+        'exercise_type': exercise_type,
+        'strict': bool(strict),
+        'start': start,
+        'end': end,
+        'client_id': get_client_id(request),
+        'user_id': authenticated_user(request),
+    })
+    return JSONResponse(status_code=202, content={'job_id': job_id, 'status': 'queued'})
+
+
+@router.get(
+    "/{job_id}",
+    summary="Analysis job status",
+    description="`queued`, `leased` (being processed), `done` with `result` or `failed` with `error`"
+)
+async def get_job(job_id: str):
+    """Job status and result"""
+    job = get_job_broker().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -2,10 +2,18 @@
 System API routes
 """
 from datetime import datetime
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
 
 from src.backend.core.config import settings
 from src.cv.video_processor import VideoProcessor
+from src.backend.services.admission_service import admission_controller
+from src.backend.services.temp_janitor import temp_janitor
+from src.backend.services.job_broker import get_job_broker
+from src.backend.core.profiling import list_profiles, load_profile_summary, profile_path, require_admin
+from src.ml.llm_router import llm_router
+from src.ml.ai_feedback import feedback_source_counts
+from src.ml.prompt_compiler import TOKEN_COUNTER, prompt_compiler
 import glob
 import ctypes
 import os
@@ -41,6 +49,100 @@ async def health_check():
     }
 
 
+@router.get(
+    "/debug/admission",
+    summary="Admission control status",
+    description="Returns CPU budget usage and queued analysis jobs"
+)
+async def admission_debug():
+    """Admission control snapshot"""
+    return admission_controller.snapshot()
+
+
+@router.get(
+    "/debug/temp",
+    summary="Temp file janitor status",
+    description="Returns in-flight upload files and the last cleanup sweep"
+)
+async def temp_debug():
+    """Temp janitor snapshot"""
+    return temp_janitor.snapshot()
+
+
+@router.get(
+    "/debug/jobs",
+    summary="Analysis job queue",
+    description="Returns the number of queued, leased, done and failed jobs in the broker"
+)
+async def jobs_debug():
+    """Job broker counts"""
+    return get_job_broker().stats()
+
+
+@router.get(
+    "/debug/profiles",
+    summary="Stored request profiles",
+    description="Lists profiles captured with the X-Profile header, newest first (admin token required)"
+)
+async def profiles_debug(request: Request):
+    """Profile index"""
+    require_admin(request)
+    return list_profiles()
+
+
+@router.get(
+    "/debug/profiles/{profile_id}",
+    summary="Request profile summary",
+    description="Per-stage and top-function CPU time and top allocations of one profiled request (admin token required)"
+)
+async def profile_debug(profile_id: str, request: Request):
+    """Profile summary"""
+    require_admin(request)
+    summary = load_profile_summary(profile_id) if profile_id.isalnum() else None
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+
+@router.get(
+    "/debug/profiles/{profile_id}/download",
+    summary="Download a request profile",
+    description="`kind=cpu`: pstats file (snakeviz, `python -m pstats`); `kind=alloc`: tracemalloc snapshot (admin token required)"
+)
+async def profile_download(profile_id: str, request: Request, kind: str = 'cpu'):
+    """Raw profile artifact"""
+    require_admin(request)
+    suffix = {'cpu': '.prof', 'alloc': '.alloc'}.get(kind)
+    if suffix is None or not profile_id.isalnum():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = profile_path(profile_id, suffix)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type='application/octet-stream', filename=os.path.basename(path))
+
+
+@router.get(
+    "/debug/llm",
+    summary="LLM provider health",
+    description="Returns feedback source counts (rules vs LLM), per-provider circuit state, latency and error counts"
+)
+async def llm_debug():
+    """LLM router metrics"""
+    return {
+        "feedback_policy": settings.feedback_policy,
+        "feedback_sources": feedback_source_counts,
+        "prompt_tokens": {
+            "budget": prompt_compiler.prompt_budget,
+            "counter": TOKEN_COUNTER,
+            "over_budget": prompt_compiler.over_budget,
+            "last_over_budget": prompt_compiler.last_over_budget,
+        },
+        "hedge_enabled": llm_router.hedge_enabled,
+        "providers": llm_router.metrics(),
+        "recent_requests": list(llm_router.request_log)[-50:],
+    }
+
+
 @router.get(
     "/debug/cv",
     summary="Computer vision status",
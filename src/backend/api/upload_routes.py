@@ -0,0 +1,160 @@
+"""
+API routes for resumable chunked uploads
+"""
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Request, Response, Form
+from fastapi.responses import JSONResponse
+
+from src.backend.core.user_auth import authenticated_user
+from src.backend.core.deadline import get_request_deadline
+from src.backend.services.video_service import VideoService
+from src.backend.services.analysis_service import AnalysisService
+from src.backend.services.admission_service import get_client_id
+from src.backend.services.upload_service import upload_manager
+
+router = APIRouter(prefix="/api/v1/uploads", tags=["uploads"])
+
+
+def _status(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'upload_id': state['upload_id'],
+        'offset': state['offset'],
+        'size': state['size'],
+        'complete': state['offset'] == state['size'],
+        'expires_at': state['updated_at'] + upload_manager.ttl_seconds,
+        'max_chunk_bytes': upload_manager.max_chunk_bytes,
+    }
+
+
+@router.post(
+    "",
+    status_code=201,
+    summary="Create a resumable upload",
+    description="""
+    Body: `{"filename": "...", "size": <bytes>, "sha256": "<optional hex digest>"}`.
+    Then send the file with PUT requests carrying `Content-Range: bytes start-end/size`,
+    each starting at the current `offset`, and call `/finalize`.
+    """
+)
+async def create_upload(request: Request, body: Dict[str, Any]):
+    """Starts a resumable upload"""
+    try:
+        size = int(body.get('size'))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="size is required")
+    state = upload_manager.create(
+        filename=str(body.get('filename') or ''),
+        size=size,
+        content_type=body.get('content_type'),
+        sha256=body.get('sha256'),
+        client_id=get_client_id(request),
+    )
+    return JSONResponse(status_code=201, content=_status(state))
+
+
+@router.put(
+    "/{upload_id}",
+    summary="Upload a byte range",
+    description="""
+    Raw bytes with `Content-Range: bytes start-end/size`. `start` must equal the
+    current offset (409 returns it otherwise). An optional `X-Chunk-Sha256`
+    header is verified before the range is committed.
+    """
+)
+async def put_chunk(upload_id: str, request: Request):
+    """Appends one chunk"""
+    state = await upload_manager.append(
+        upload_id,
+        request.headers.get('content-range'),
+        request.stream(),
+        chunk_sha256=request.headers.get('x-chunk-sha256'),
+    )
+    return _status(state)
+
+
+@router.head(
+    "/{upload_id}",
+    summary="Upload offset",
+    description="Returns the committed offset in the `Upload-Offset` header"
+)
+async def head_upload(upload_id: str):
+    """Offset to resume from"""
+    state = upload_manager.get(upload_id)
+    return Response(headers={
+        'Upload-Offset': str(state['offset']),
+        'Upload-Length': str(state['size']),
+        'Cache-Control': 'no-store',
+    })
+
+
+@router.get(
+    "/{upload_id}",
+    summary="Upload status",
+    description="Returns the committed offset and size of an upload"
+)
+async def get_upload(upload_id: str):
+    """Upload status"""
+    return _status(upload_manager.get(upload_id))
+
+
+@router.delete(
+    "/{upload_id}",
+    status_code=204,
+    summary="Abort an upload"
+)
+async def delete_upload(upload_id: str):
+    """Discards an upload"""
+    await upload_manager.discard(upload_id)
+    return Response(status_code=204)
+
+
+@router.post(
+    "/{upload_id}/finalize",
+    summary="Analyze a completed upload",
+    description="""
+    Verifies the upload is complete (and matches its sha256, when given) and
+    runs the same analysis as /api/v1/analyze-exercise. The upload is removed
+    afterwards unless the server was busy (503) or the request deadline ran out
+    before anything was analyzed (504); in both cases finalize can be retried.
+    """
+)
+async def finalize_upload(
+    upload_id: str,
+    request: Request,
+    exercise_type: Optional[str] = Form(None),
+    strict: Optional[bool] = Form(False),
+    start: Optional[float] = Form(None),
+    end: Optional[float] = Form(None),
+):
+    """Processes an assembled upload"""
+    video_service = VideoService()
+    # A bad window must not cost the client its upload
+    video_service.validate_window(start, end)
+    upload = await upload_manager.complete(upload_id)
+
+    analysis_service = AnalysisService()
+    deadline = get_request_deadline(request)
+
+    try:
+        vectors_data = await video_service.process_source(
+            upload['path'],
+            expected_exercise=exercise_type,
+            strict=bool(strict),
+            client_id=upload['client_id'],
+            content_hash=upload['sha256'],
+            deadline=deadline,
+            start=start,
+            end=end,
+        )
+    except HTTPException as e:
+        if e.status_code not in (503, 504):
+            await upload_manager.discard(upload_id)
+        raise
+    await upload_manager.discard(upload_id)
+
+    result = await analysis_service.analyze_exercise_data(
+        vectors_data,
+        user_id=authenticated_user(request),
+        deadline=deadline,
+    )
+    return JSONResponse(content=result)
@@ -2,7 +2,7 @@
 Main application settings
 """
 import os
-from typing import List
+from typing import Dict, List
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +20,15 @@ class Settings:
     # Server
     host: str = os.getenv("HOST", "0.0.0.0")
     port: int = int(os.getenv("PORT", "8000"))
+    # serve.py: worker processes (0 = available CPUs / SERVE_THREADS_PER_WORKER)
+    serve_workers: int = int(os.getenv("SERVE_WORKERS", "0"))
+    # CPU threads per worker for OpenCV, BLAS, video decoding and ONNX Runtime
+    serve_threads_per_worker: int = int(os.getenv("SERVE_THREADS_PER_WORKER", "1"))
+    # Import the app and CV stack once before forking, so workers share those pages
+    serve_preload: bool = os.getenv("SERVE_PRELOAD", "true").lower() == "true"
+    # Pin each worker to its own CPUs (only when the CPU set is the container's own)
+    serve_pin_cpus: bool = os.getenv("SERVE_PIN_CPUS", "false").lower() == "true"
+    serve_graceful_timeout_seconds: float = float(os.getenv("SERVE_GRACEFUL_TIMEOUT_SECONDS", "30"))
     
     # OpenAI / LLM Provider
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
@@ -31,6 +40,29 @@ class Settings:
     # Model name; on OpenRouter prefer vendor-prefixed names, e.g. "openai/gpt-4o-mini"
     openai_model: str = os.getenv("AI_MODEL", "gpt-4")
     ai_timeout_seconds: int = int(os.getenv("AI_TIMEOUT_SECONDS", "30"))
+    # Optional JSON list of providers tried in order, e.g.
+    # [{"name": "openai", "api_base": "https://api.openai.com/v1", "model": "gpt-4o-mini", "api_key_env": "OPENAI_API_KEY"},
+    #  {"name": "local", "api_base": "http://127.0.0.1:8080/v1", "model": "llama3", "timeout": 10}]
+    llm_providers: str = os.getenv("LLM_PROVIDERS", "")
+    llm_circuit_failure_threshold: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "3"))
+    llm_circuit_reset_seconds: float = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+    # Hedging: race the next provider once the current one exceeds its latency percentile
+    llm_hedge_enabled: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    llm_hedge_percentile: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    llm_hedge_min_delay_seconds: float = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2.0"))
+    # Prompt/response size limits; provider latency and cost scale with tokens
+    ai_prompt_token_budget: int = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "700"))
+    ai_max_output_tokens: int = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "450"))
+    # Structured JSON output: "auto" enables it for api.openai.com only
+    ai_json_mode: str = os.getenv("AI_JSON_MODE", "auto").lower()
+
+    # Local rule-based feedback: "llm" (default), "rules", or "rules_first" (rules when
+    # classification and video quality are good, LLM otherwise)
+    feedback_policy: str = os.getenv("FEEDBACK_POLICY", "llm").lower()
+    rules_min_confidence: float = float(os.getenv("RULES_MIN_CONFIDENCE", "0.75"))
+    rules_min_quality: float = float(os.getenv("RULES_MIN_QUALITY", "0.8"))
+    # Mean left/right angle difference (degrees) reported as an imbalance
+    rules_asymmetry_degrees: float = float(os.getenv("RULES_ASYMMETRY_DEGREES", "10"))
     
     # CORS - Allow Vercel domains and localhost
     cors_origins: List[str] = [
@@ -52,6 +84,28 @@ class Settings:
     
     # Paths (Railway compatible)
     temp_dir: str = os.getenv("TEMP_DIR", "/tmp" if os.name == "posix" else "temp")
+    # Uploads up to this size are decoded straight from memory (needs PyAV)
+    in_memory_decode_max_mb: float = float(os.getenv("IN_MEMORY_DECODE_MAX_MB", "20"))
+    # Where larger uploads are spooled; empty = /dev/shm when it has room, else TEMP_DIR
+    spool_dir: str = os.getenv("SPOOL_DIR", "")
+    spool_shm_reserve_mb: float = float(os.getenv("SPOOL_SHM_RESERVE_MB", "256"))
+    # Decoder threads per video; 0 = the decoder's default (one per core)
+    decode_threads: int = int(os.getenv("DECODE_THREADS", "0"))
+    # Temp janitor: age limit and total size ceiling for leftover upload files
+    temp_max_age_seconds: float = float(os.getenv("TEMP_MAX_AGE_SECONDS", "3600"))
+    temp_max_total_mb: float = float(os.getenv("TEMP_MAX_TOTAL_MB", "1024"))
+    temp_janitor_interval_seconds: float = float(os.getenv("TEMP_JANITOR_INTERVAL_SECONDS", "300"))
+    # Resumable uploads: partial files live here until finalized or abandoned
+    upload_dir: str = os.getenv("UPLOAD_DIR") or os.path.join(temp_dir, "fitpose_uploads")
+    upload_ttl_seconds: float = float(os.getenv("UPLOAD_TTL_SECONDS", "86400"))
+    upload_max_chunk_mb: float = float(os.getenv("UPLOAD_MAX_CHUNK_MB", "16"))
+
+    # Pre-flight probe: largest chunk accepted, and the optional person check
+    probe_max_chunk_mb: float = float(os.getenv("PROBE_MAX_CHUNK_MB", "8"))
+    probe_min_duration_seconds: float = float(os.getenv("PROBE_MIN_DURATION_SECONDS", "1.0"))
+    probe_person_samples: int = int(os.getenv("PROBE_PERSON_SAMPLES", "5"))
+    # Person check frames are spread over the first N seconds
+    probe_decode_seconds: float = float(os.getenv("PROBE_DECODE_SECONDS", "3.0"))
 
     # Gates thresholds (tunable via env)
     # Level 1: Critical gates (blocking) - только для явно плохих видео
@@ -67,6 +121,138 @@ class Settings:
     person_avg_visibility_good: float = float(os.getenv("PERSON_AVG_VIS_GOOD", "0.60"))
     motion_score_good: float = float(os.getenv("MOTION_SCORE_GOOD", "0.80"))
 
+    # Early NO_PERSON decision while decoding, once the first max(seconds, fraction of the
+    # clip) is processed and the outcome is certain at GATE_EARLY_Z standard errors
+    gate_early_enabled: bool = os.getenv("GATE_EARLY_ENABLED", "true").lower() == "true"
+    gate_early_min_seconds: float = float(os.getenv("GATE_EARLY_MIN_SECONDS", "5.0"))
+    gate_early_min_fraction: float = float(os.getenv("GATE_EARLY_MIN_FRACTION", "0.25"))
+    gate_early_z: float = float(os.getenv("GATE_EARLY_Z", "3.0"))
+    # Frames spread over the rest of the video that must agree before aborting (guards lead-ins)
+    gate_early_probes: int = int(os.getenv("GATE_EARLY_PROBES", "8"))
+
+    # Motion gating: thin pose inference on static stretches, split sets by rest
+    motion_gate_enabled: bool = os.getenv("MOTION_GATE_ENABLED", "true").lower() == "true"
+    # Mean absolute gray-level difference (0-255) on the downscaled frame
+    motion_gate_threshold: float = float(os.getenv("MOTION_GATE_THRESHOLD", "1.5"))
+    # While static, run inference on every N-th sampled frame only
+    motion_gate_static_stride: int = int(os.getenv("MOTION_GATE_STATIC_STRIDE", "5"))
+    rest_min_seconds: float = float(os.getenv("REST_MIN_SECONDS", "5.0"))
+
+    # Isometric holds: scored by hold time and body line instead of reps, from sparse samples
+    hold_exercises: List[str] = [
+        name.strip() for name in os.getenv("HOLD_EXERCISES", "plank").split(",") if name.strip()
+    ]
+    hold_sample_fps: float = float(os.getenv("HOLD_SAMPLE_FPS", "2.0"))
+    # Shoulder-ankle line steeper than this (degrees from horizontal) is not a plank position
+    hold_incline_max_degrees: float = float(os.getenv("HOLD_INCLINE_MAX_DEGREES", "35"))
+    # Shoulder-hip-ankle angle: below MIN the position is broken, from GOOD on it counts as straight
+    hold_body_line_min_degrees: float = float(os.getenv("HOLD_BODY_LINE_MIN_DEGREES", "140"))
+    hold_body_line_good_degrees: float = float(os.getenv("HOLD_BODY_LINE_GOOD_DEGREES", "165"))
+    # Hip offset from the shoulder-ankle line, as a fraction of body length, that counts as sag/pike
+    hold_hip_offset_max: float = float(os.getenv("HOLD_HIP_OFFSET_MAX", "0.05"))
+    # A break in position longer than this ends the hold
+    hold_gap_seconds: float = float(os.getenv("HOLD_GAP_SECONDS", "1.5"))
+
+    # Template classifier (DTW against reference reps); overrides vague threshold labels.
+    # Off unless enabled or DTW_TEMPLATE_PATH provides recorded templates: the built-in
+    # library is synthetic and its confidence also drives rules_first and strict rejection
+    dtw_classifier_enabled: bool = os.getenv(
+        "DTW_CLASSIFIER_ENABLED", "true" if os.getenv("DTW_TEMPLATE_PATH") else "false"
+    ).lower() == "true"
+    dtw_min_confidence: float = float(os.getenv("DTW_MIN_CONFIDENCE", "0.6"))
+    # Sakoe-Chiba band half-width in resampled steps (templates are 32 steps long)
+    dtw_band_radius: int = int(os.getenv("DTW_BAND_RADIUS", "4"))
+    # Optional .npz with extra `templates` (K, 32, 5) and `labels`
+    dtw_template_path: str = os.getenv("DTW_TEMPLATE_PATH", "")
+
+    # Pose estimation backend: "legacy" (mp.solutions.pose), "tasks" (PoseLandmarker, VIDEO mode) or "onnx"
+    pose_backend: str = os.getenv("POSE_BACKEND", "legacy")
+    # Legacy backend: 1 is bundled with mediapipe; 0 (lite) and 2 (heavy) are downloaded on first use
+    pose_model_complexity: int = int(os.getenv("POSE_MODEL_COMPLEXITY", "1"))
+    pose_task_model_path: str = os.getenv("POSE_TASK_MODEL_PATH", "")
+    pose_onnx_model_path: str = os.getenv("POSE_ONNX_MODEL_PATH", "")
+    # "blazepose" (pixel coordinates, logit scores) or "normalized"
+    pose_onnx_output_format: str = os.getenv("POSE_ONNX_OUTPUT_FORMAT", "blazepose")
+    # Frames per inference call for backends that batch (onnx)
+    pose_batch_size: int = int(os.getenv("POSE_BATCH_SIZE", "8"))
+    # ONNX Runtime intra-op threads; 0 lets the runtime decide
+    pose_intra_op_threads: int = int(os.getenv("POSE_INTRA_OP_THREADS", "0"))
+    # Person crop: frames whose longer side is at least ROI_MIN_FRAME_SIDE go to the pose model
+    # cropped to the person found in the previous inference (padded by ROI_PADDING of its size)
+    roi_enabled: bool = os.getenv("ROI_ENABLED", "false").lower() == "true"
+    roi_min_frame_side: int = int(os.getenv("ROI_MIN_FRAME_SIDE", "1280"))
+    roi_padding: float = float(os.getenv("ROI_PADDING", "0.25"))
+    # Crops with a longer side above this are downscaled before inference
+    roi_max_side: int = int(os.getenv("ROI_MAX_SIDE", "640"))
+
+    # Raw pose tracks kept per video (sha256) so analysis can be re-run without inference
+    landmark_store_enabled: bool = os.getenv("LANDMARK_STORE_ENABLED", "true").lower() == "true"
+    landmark_store_dir: str = os.getenv("LANDMARK_STORE_DIR", os.path.join("data", "tracks"))
+    # Tracks unused for this long are deleted, then the least recently used ones over the size cap (0 = no limit)
+    landmark_store_ttl_seconds: float = float(os.getenv("LANDMARK_STORE_TTL_SECONDS", "604800"))
+    landmark_store_max_mb: float = float(os.getenv("LANDMARK_STORE_MAX_MB", "2048"))
+
+    # Admission control: job cost is estimated in CPU-seconds from container metadata
+    admission_cpu_budget_seconds: float = float(os.getenv("ADMISSION_CPU_BUDGET_SECONDS", "120"))
+    admission_max_job_seconds: float = float(os.getenv("ADMISSION_MAX_JOB_SECONDS", "90"))
+    admission_queue_timeout_seconds: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "120"))
+    admission_inference_seconds_per_frame: float = float(os.getenv("ADMISSION_INFERENCE_SECONDS_PER_FRAME", "0.03"))
+    admission_decode_seconds_per_megapixel: float = float(os.getenv("ADMISSION_DECODE_SECONDS_PER_MEGAPIXEL", "0.002"))
+    # Clients are keyed by this header, falling back to the caller IP
+    admission_client_header: str = os.getenv("ADMISSION_CLIENT_HEADER", "X-API-Key")
+    # Proxies (IPs or CIDRs) whose X-Forwarded-For is believed; other peers are keyed by their own IP
+    admission_trusted_proxies: List[str] = [
+        item.strip() for item in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if item.strip()
+    ]
+    # Per-client weights for fair queueing, e.g. "partner-key:3,internal:2"
+    admission_client_weights: Dict[str, float] = {
+        key.strip(): float(weight)
+        for key, weight in (
+            item.split(":", 1) for item in os.getenv("ADMISSION_CLIENT_WEIGHTS", "").split(",") if ":" in item
+        )
+    }
+
+    # Queued analysis (POST /api/v1/jobs, worker.py): SQLite broker and storage shared with the workers
+    job_broker_db: str = os.getenv("JOB_BROKER_DB", os.path.join("data", "fitpose_jobs.sqlite3"))
+    job_storage_dir: str = os.getenv("JOB_STORAGE_DIR", os.path.join("data", "job_videos"))
+    # A job whose worker stops extending its lease for this long is delivered again
+    job_visibility_timeout_seconds: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "120"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    job_retry_delay_seconds: float = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "10"))
+    job_poll_interval_seconds: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+    # Finished jobs (and their results) are kept this long
+    job_result_ttl_seconds: float = float(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+
+    # Request deadline: clients send a budget in milliseconds, others get the server default (0 = none)
+    request_deadline_header: str = os.getenv("REQUEST_DEADLINE_HEADER", "X-Request-Deadline-Ms")
+    request_deadline_seconds: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "240"))
+    request_deadline_max_seconds: float = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "300"))
+    # Time kept back from decoding for analysis and gates
+    deadline_analysis_reserve_seconds: float = float(os.getenv("DEADLINE_ANALYSIS_RESERVE_SECONDS", "1.0"))
+    # Below this remaining time the LLM is skipped in favour of rule-based feedback
+    deadline_ai_min_seconds: float = float(os.getenv("DEADLINE_AI_MIN_SECONDS", "3.0"))
+
+    # Per-request profiling: requests with PROFILE_HEADER and the admin token get a CPU profile (empty = off)
+    profile_admin_token: str = os.getenv("PROFILE_ADMIN_TOKEN", "")
+    profile_header: str = os.getenv("PROFILE_HEADER", "X-Profile")
+    profile_token_header: str = os.getenv("PROFILE_TOKEN_HEADER", "X-Admin-Token")
+    profile_dir: str = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+    profile_ttl_seconds: float = float(os.getenv("PROFILE_TTL_SECONDS", "604800"))
+    # Stack depth recorded per allocation with `X-Profile: cpu,alloc`
+    profile_alloc_frames: int = int(os.getenv("PROFILE_ALLOC_FRAMES", "10"))
+
+
+    # Analysis history (embedded SQLite)
+    history_enabled: bool = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+    history_db_path: str = os.getenv("HISTORY_DB_PATH", os.path.join("data", "fitpose_history.sqlite3"))
+    # Weight of the newest session in rolling averages
+    history_rolling_alpha: float = float(os.getenv("HISTORY_ROLLING_ALPHA", "0.3"))
+
+    # Signed bearer tokens naming the user (src/backend/core/user_auth.py); without a
+    # secret no request is authenticated and history is neither recorded nor readable
+    user_auth_secret: str = os.getenv("USER_AUTH_SECRET", "")
+    user_token_ttl_seconds: float = float(os.getenv("USER_TOKEN_TTL_SECONDS", "86400"))
+
 
 # Global settings
 settings = Settings()
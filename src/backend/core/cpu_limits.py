@@ -0,0 +1,103 @@
+"""
+CPU budget of the container and per-process thread limits for the CV stack
+"""
+import math
+import os
+import sys
+from typing import Dict, Any, List, Optional
+
+# Thread pool sizes read by BLAS/OpenMP libraries when they are first loaded
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+)
+
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding='ascii') as f:
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs allowed by the cgroup CFS quota (v2 or v1), None when unlimited"""
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cpu_set() -> List[int]:
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cpus() -> Dict[str, Any]:
+    """Usable CPUs: the smaller of the CPU set and the quota, rounded up.
+
+    os.cpu_count() reports the host's cores, which is what thread pools size
+    themselves by; a container limited to 2 CPUs on a 64-core host would
+    otherwise start 64 threads per library per process.
+    """
+    cpus = cpu_set()
+    quota = cgroup_cpu_quota()
+    usable = len(cpus)
+    if quota:
+        usable = min(usable, max(1, math.ceil(quota)))
+    return {'host_cpus': os.cpu_count() or 1, 'cpu_set': len(cpus), 'quota': quota, 'usable': usable}
+
+
+def serving_plan(workers: int = 0, threads_per_worker: int = 1) -> Dict[str, Any]:
+    """Worker count and threads per worker that fit the usable CPUs.
+
+    `workers=0` fills the CPUs with `threads_per_worker`-thread workers; an
+    explicit worker count gets an equal share of the CPUs each.
+    """
+    cpus = available_cpus()
+    threads_per_worker = max(1, threads_per_worker)
+    if workers <= 0:
+        workers = max(1, cpus['usable'] // threads_per_worker)
+    else:
+        threads_per_worker = max(1, cpus['usable'] // workers)
+    return {**cpus, 'workers': workers, 'threads_per_worker': threads_per_worker}
+
+
+def limit_thread_env(threads: int) -> None:
+    """Caps BLAS/OpenMP pools; only effective before numpy and cv2 are imported"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def limit_loaded_threads(threads: int) -> None:
+    """Caps the pools of libraries already imported (OpenCV keeps a process-wide setting)"""
+    cv2 = sys.modules.get('cv2')
+    if cv2 is not None:
+        cv2.setNumThreads(threads)
+
+
+def pin_cpus(worker_index: int, threads: int) -> Optional[List[int]]:
+    """Restricts this process to its own `threads` CPUs of the CPU set; None when they do not fit"""
+    cpus = cpu_set()
+    first = worker_index * threads
+    if not hasattr(os, 'sched_setaffinity') or first + threads > len(cpus):
+        return None
+    own = cpus[first:first + threads]
+    os.sched_setaffinity(0, own)
+    return own
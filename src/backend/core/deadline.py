@@ -0,0 +1,122 @@
+"""
+Per-request time budget shared by upload, decoding, analysis and AI feedback
+"""
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, Optional
+
+from src.backend.core.config import settings
+
+
+class Deadline:
+    """Absolute expiry of one request on the monotonic clock.
+
+    Stages read `remaining()` to size their own work and call `truncate()`
+    when they cut it short; `report()` is returned to the client. Stage
+    durations recorded with `stage()` go out as the Server-Timing header.
+    """
+
+    def __init__(self, budget_seconds: Optional[float] = None, source: str = 'default'):
+        self.started = time.monotonic()
+        self.budget = budget_seconds if budget_seconds and budget_seconds > 0 else None
+        self.expires_at = self.started + self.budget if self.budget else math.inf
+        self.source = source
+        self.truncated: Dict[str, Dict[str, Any]] = {}
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def bounded(self) -> bool:
+        return self.budget is not None
+
+    def remaining(self) -> float:
+        """Seconds left; infinite for an unbounded request"""
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def truncate(self, stage: str, **details: Any) -> None:
+        """Records that `stage` returned a partial result because the budget ran low"""
+        self.truncated[stage] = {'at_ms': int(self.elapsed() * 1000), **details}
+
+    def mark(self, stage: str) -> None:
+        """Records the time from request arrival until now as `stage`"""
+        self.timings[stage] = self.elapsed()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.monotonic() - started
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()]
+        return ', '.join(entries + [f"total;dur={self.elapsed() * 1000:.1f}"])
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'budget_ms': int(self.budget * 1000) if self.budget else None,
+            'source': self.source,
+            'elapsed_ms': int(self.elapsed() * 1000),
+            'truncated_stages': list(self.truncated),
+            'truncated': self.truncated,
+        }
+
+
+def timed(deadline: Optional[Deadline], stage: str):
+    """`deadline.stage(stage)`, or a no-op outside of a request"""
+    return deadline.stage(stage) if deadline is not None else nullcontext()
+
+
+def deadline_from_headers(headers: Dict[str, str]) -> Deadline:
+    """Budget from the client header (milliseconds, capped), else REQUEST_DEADLINE_SECONDS"""
+    raw = headers.get(settings.request_deadline_header.lower())
+    if raw:
+        try:
+            budget = float(raw) / 1000.0
+        except ValueError:
+            budget = 0.0
+        if budget > 0:
+            if settings.request_deadline_max_seconds > 0:
+                budget = min(budget, settings.request_deadline_max_seconds)
+            return Deadline(budget, source='header')
+    return Deadline(settings.request_deadline_seconds, source='default')
+
+
+class DeadlineMiddleware:
+    """Starts each request's clock on arrival, before the body is uploaded;
+    handlers read it with `get_request_deadline`. Adds the stage timings
+    recorded so far as a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        deadline = deadline_from_headers(headers)
+        scope.setdefault('state', {})['deadline'] = deadline
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message)
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'server-timing', deadline.server_timing().encode('latin-1'))
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+def get_request_deadline(request) -> Deadline:
+    deadline = getattr(request.state, 'deadline', None)
+    return deadline if deadline is not None else deadline_from_headers(dict(request.headers))
@@ -0,0 +1,249 @@
+"""
+On-demand profiling of single requests, authorized with the admin token
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Dict, Any, List, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from src.backend.core.config import settings
+
+# Summary rows: stage -> (file, function) of the code that does its work
+PROFILE_STAGES = {
+    'decode': ('video_processor.py', 'extract_track'),
+    'features': ('video_processor.py', 'extract_landmarks_features'),
+    'movement_analysis': ('video_processor.py', 'analyze_movement_patterns'),
+    'gates': ('video_service.py', '_apply_gates'),
+    'ai_feedback': ('ai_feedback.py', 'analyze_exercise'),
+    'ai_feedback_stream': ('ai_feedback.py', 'analyze_exercise_stream'),
+}
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 30
+
+# cProfile hooks the whole thread and tracemalloc the whole process: one profile at a time
+_profile_lock = threading.Lock()
+
+
+def is_admin(headers: Dict[str, str]) -> bool:
+    """True when the request carries the configured admin token"""
+    token = headers.get(settings.profile_token_header.lower(), '')
+    return bool(settings.profile_admin_token) and hmac.compare_digest(
+        token.encode(), settings.profile_admin_token.encode()
+    )
+
+
+def require_admin(request) -> None:
+    if not is_admin({key.lower(): value for key, value in request.headers.items()}):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def profile_path(profile_id: str, suffix: str) -> str:
+    name = os.path.basename(profile_id)
+    if not name or name != profile_id:
+        raise ValueError(f"Invalid profile id: {profile_id!r}")
+    return os.path.join(settings.profile_dir, f"{name}{suffix}")
+
+
+class RequestProfiler:
+    """CPU profile (and optionally an allocation snapshot) of one request.
+
+    The CPU profile covers the event loop thread, where decoding, pose
+    inference, analysis and gates run; the LLM's HTTP call shows up as the
+    time its coroutine runs there. Requests served concurrently by the same
+    worker appear in the profile too.
+    """
+
+    def __init__(self, profile_id: str, allocations: bool):
+        self.profile_id = profile_id
+        self.allocations = allocations
+        self.profile = cProfile.Profile()
+        self._started_tracing = False
+        self.started = 0.0
+
+    def start(self) -> None:
+        if self.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(settings.profile_alloc_frames)
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self, request_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Stops profiling and writes `<id>.prof`, `<id>.json` and, with allocations, `<id>.alloc`"""
+        self.profile.disable()
+        duration = time.perf_counter() - self.started
+        os.makedirs(settings.profile_dir, exist_ok=True)
+
+        stats = pstats.Stats(self.profile)
+        stats.dump_stats(profile_path(self.profile_id, '.prof'))
+        summary = {
+            'profile_id': self.profile_id,
+            'created_at': time.time(),
+            'duration_ms': int(duration * 1000),
+            **request_info,
+            'stages': self._stage_rows(stats),
+            'top_functions': self._top_functions(stats),
+        }
+
+        if self.allocations:
+            # The profiler's own bookkeeping is not the request's
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracing:
+                tracemalloc.stop()
+            snapshot.dump(profile_path(self.profile_id, '.alloc'))
+            summary['allocations'] = {
+                'traced_current_mb': round(current / 2**20, 2),
+                'traced_peak_mb': round(peak / 2**20, 2),
+                'top': [
+                    {'where': str(stat.traceback[0]), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                ],
+            }
+
+        with open(profile_path(self.profile_id, '.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    @staticmethod
+    def _stage_rows(stats: pstats.Stats) -> Dict[str, Dict[str, Any]]:
+        rows = {}
+        for (filename, _, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            for stage, (stage_file, stage_function) in PROFILE_STAGES.items():
+                if function == stage_function and filename.endswith(stage_file):
+                    rows[stage] = {
+                        'calls': calls,
+                        'cumulative_ms': round(cumulative * 1000, 1),
+                        'own_ms': round(own * 1000, 1),
+                    }
+        return rows
+
+    @staticmethod
+    def _top_functions(stats: pstats.Stats) -> List[Dict[str, Any]]:
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+        return [
+            {
+                'function': f"{os.path.basename(filename)}:{line}({function})",
+                'calls': calls,
+                'cumulative_ms': round(cumulative * 1000, 1),
+                'own_ms': round(own * 1000, 1),
+            }
+            for (filename, line, function), (_, calls, own, cumulative, _) in entries
+        ]
+
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it with PROFILE_HEADER (`cpu` or
+    `cpu,alloc`) and carry the admin token. The response names the stored
+    profile in `X-Profile-Id`; other requests pay one header lookup."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.profile_admin_token:
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        modes = headers.get(settings.profile_header.lower())
+        if not modes:
+            await self.app(scope, receive, send)
+            return
+
+        if not is_admin(headers):
+            response = JSONResponse(status_code=403, content={'detail': {
+                'status': 'error', 'code': 'PROFILE_FORBIDDEN',
+                'message': 'Profiling requires the admin token',
+            }})
+            await response(scope, receive, send)
+            return
+        if not _profile_lock.acquire(blocking=False):
+            response = JSONResponse(status_code=409, content={'detail': {
+                'status': 'error', 'code': 'PROFILER_BUSY',
+                'message': 'Another request is being profiled; retry shortly',
+            }})
+            await response(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = RequestProfiler(profile_id, allocations='alloc' in modes.lower())
+        status = {'code': None}
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                message = dict(message)
+                message['headers'] = list(message.get('headers', [])) + [(b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        try:
+            profiler.start()
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            try:
+                summary = profiler.stop({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'status_code': status['code'],
+                })
+                print(f"Profile {profile_id}: {summary['method']} {summary['path']} in {summary['duration_ms']} ms")
+            except Exception as e:
+                print(f"Warning: Could not store profile {profile_id}: {e}")
+            finally:
+                _profile_lock.release()
+
+
+def load_profile_summary(profile_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(profile_path(profile_id, '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profiles, newest first"""
+    try:
+        names = os.listdir(settings.profile_dir)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        if name.endswith('.json'):
+            summary = load_profile_summary(name[:-len('.json')])
+            if summary:
+                profiles.append({key: summary.get(key) for key in
+                                 ('profile_id', 'created_at', 'method', 'path', 'status_code', 'duration_ms')})
+    return sorted(profiles, key=lambda p: p['created_at'] or 0, reverse=True)
+
+
+def gc_profiles() -> Dict[str, Any]:
+    """Janitor hook: deletes profiles older than PROFILE_TTL_SECONDS"""
+    removed = 0
+    cutoff = time.time() - settings.profile_ttl_seconds
+    try:
+        names = os.listdir(settings.profile_dir)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        path = os.path.join(settings.profile_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return {'removed_files': removed}
@@ -0,0 +1,54 @@
+"""
+Signed user tokens: who a request belongs to, for history reads and writes
+
+A token is "<user_id>.<expires unix time>.<hex HMAC-SHA256 of 'user_id.expires'>"
+signed with USER_AUTH_SECRET. The account service that logs users in mints
+them (`issue_user_token`); clients send them as `Authorization: Bearer <token>`.
+Without a secret no request is authenticated, so nothing is recorded to or
+read from history.
+"""
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from src.backend.core.config import settings
+
+
+def _signature(payload: str) -> str:
+    return hmac.new(settings.user_auth_secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_user_token(user_id: str, ttl_seconds: Optional[float] = None) -> str:
+    """Token for `user_id`, valid for `ttl_seconds` (USER_TOKEN_TTL_SECONDS by default)"""
+    if not settings.user_auth_secret:
+        raise ValueError("USER_AUTH_SECRET is not set")
+    ttl = settings.user_token_ttl_seconds if ttl_seconds is None else ttl_seconds
+    payload = f"{user_id}.{int(time.time() + ttl)}"
+    return f"{payload}.{_signature(payload)}"
+
+
+def verify_user_token(token: str) -> Optional[str]:
+    """The user id of a valid, unexpired token, else None"""
+    if not settings.user_auth_secret or not token:
+        return None
+    parts = token.rsplit('.', 2)
+    if len(parts) != 3 or not parts[0]:
+        return None
+    user_id, expires, signature = parts
+    if not hmac.compare_digest(signature.encode(), _signature(f"{user_id}.{expires}").encode()):
+        return None
+    try:
+        if int(expires) < time.time():
+            return None
+    except ValueError:
+        return None
+    return user_id
+
+
+def authenticated_user(request) -> Optional[str]:
+    """User id of the request's bearer token, None when it has no valid one"""
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return verify_user_token(token.strip())
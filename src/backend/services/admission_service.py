@@ -0,0 +1,233 @@
+"""
+Cost-based admission control with weighted fair queueing across clients
+"""
+import asyncio
+import functools
+import heapq
+import ipaddress
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List
+
+from fastapi import HTTPException, Request
+
+from src.backend.core.config import settings
+
+
+def estimate_job_cost(metadata: Optional[Dict[str, Any]]) -> float:
+    """Estimates CPU-seconds for a video from its container metadata.
+
+    Every frame is decoded (skipped frames included), while pose inference runs
+    only on the sampled frames of the processing plan.
+    """
+    if not metadata:
+        return 0.0
+    megapixels = metadata.get('width', 0) * metadata.get('height', 0) / 1_000_000
+    decode_cost = metadata.get('frame_count', 0) * megapixels * settings.admission_decode_seconds_per_megapixel
+    inference_cost = metadata.get('sampled_frames', 0) * settings.admission_inference_seconds_per_frame
+    return round(decode_cost + inference_cost, 3)
+
+
+@functools.lru_cache(maxsize=1)
+def _trusted_networks(proxies: tuple) -> tuple:
+    networks = []
+    for proxy in proxies:
+        try:
+            networks.append(ipaddress.ip_network(proxy, strict=False))
+        except ValueError:
+            print(f"Warning: ignoring invalid ADMISSION_TRUSTED_PROXIES entry '{proxy}'")
+    return tuple(networks)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_networks(tuple(settings.admission_trusted_proxies)))
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """Caller IP. X-Forwarded-For is only read when the direct peer is a
+    trusted proxy, and then its right-most hop that is not one; the left
+    part of the header is whatever the client chose to send."""
+    peer = request.client.host if request.client else None
+    if peer is None or not _is_trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in request.headers.get('x-forwarded-for', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+def get_client_id(request: Optional[Request]) -> str:
+    """Identifies the caller by API key header, falling back to the client IP"""
+    if request is None:
+        return 'anonymous'
+    api_key = request.headers.get(settings.admission_client_header)
+    if api_key:
+        return f"key:{api_key}"
+    ip = client_ip(request)
+    return f"ip:{ip}" if ip else 'anonymous'
+
+
+class _QueuedJob:
+    __slots__ = ('finish_tag', 'start_tag', 'seq', 'client_id', 'cost', 'future', 'cancelled')
+
+    def __init__(self, finish_tag: float, start_tag: float, seq: int, client_id: str, cost: float, future):
+        self.finish_tag = finish_tag
+        self.start_tag = start_tag
+        self.seq = seq
+        self.client_id = client_id
+        self.cost = cost
+        self.future = future
+        self.cancelled = False
+
+    def __lt__(self, other: "_QueuedJob") -> bool:
+        return (self.finish_tag, self.seq) < (other.finish_tag, other.seq)
+
+
+class AdmissionController:
+    """Admits jobs while their summed estimated cost fits the CPU budget.
+
+    Waiting jobs are ordered by weighted-fair-queueing finish tags, so a client
+    submitting many expensive videos only delays its own later jobs.
+    """
+
+    def __init__(
+        self,
+        cpu_budget: float,
+        max_job_cost: float,
+        queue_timeout: float,
+        client_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.cpu_budget = cpu_budget
+        self.max_job_cost = max_job_cost
+        self.queue_timeout = queue_timeout
+        self.client_weights = client_weights or {}
+        self._in_flight = 0.0
+        self._running = 0
+        self._virtual_time = 0.0
+        self._client_finish: Dict[str, float] = {}
+        self._queue: List[_QueuedJob] = []
+        self._seq = itertools.count()
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _weight(self, client_id: str) -> float:
+        key = client_id.split(':', 1)[-1]
+        return max(0.01, float(self.client_weights.get(key, self.client_weights.get(client_id, 1.0))))
+
+    def _dispatch(self) -> None:
+        while self._queue:
+            job = self._queue[0]
+            if job.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            # A single job is always allowed to run on an idle worker
+            if self._running and self._in_flight + job.cost > self.cpu_budget:
+                break
+            heapq.heappop(self._queue)
+            self._in_flight += job.cost
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, job.start_tag)
+            job.future.set_result(True)
+
+        # Forget clients whose backlog is entirely in the past
+        stale = [c for c, finish in self._client_finish.items() if finish <= self._virtual_time]
+        for client_id in stale:
+            del self._client_finish[client_id]
+
+    def _release(self, cost: float) -> None:
+        self._in_flight = max(0.0, self._in_flight - cost)
+        self._running = max(0, self._running - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, cost: float, timeout: Optional[float] = None):
+        """Waits for a fair share of the CPU budget, then holds it for the job.
+
+        `timeout` shortens the queue wait (e.g. to what is left of a request deadline).
+        """
+        if cost > self.max_job_cost:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=413,
+                detail={
+                    'status': 'error',
+                    'code': 'JOB_TOO_EXPENSIVE',
+                    'message': 'Video is too expensive to process in a single request',
+                    'tips': [
+                        'Trim the video to the repetitions you want analyzed',
+                        'Record at 1080p or lower resolution',
+                        'Record at 30 FPS instead of 60 FPS'
+                    ],
+                    'diagnostics': {
+                        'estimated_cost_seconds': cost,
+                        'max_job_cost_seconds': self.max_job_cost
+                    }
+                }
+            )
+
+        start_tag = max(self._virtual_time, self._client_finish.get(client_id, 0.0))
+        finish_tag = start_tag + cost / self._weight(client_id)
+        self._client_finish[client_id] = finish_tag
+
+        job = _QueuedJob(finish_tag, start_tag, next(self._seq), client_id, cost,
+                         asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, job)
+        queued_at = time.monotonic()
+        self._dispatch()
+
+        try:
+            queue_timeout = self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout))
+            await asyncio.wait_for(asyncio.shield(job.future), timeout=queue_timeout)
+        except asyncio.TimeoutError:
+            job.cancelled = True
+            if job.future.done():
+                self._release(cost)
+            self._timed_out += 1
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    'status': 'error',
+                    'code': 'SERVER_BUSY',
+                    'message': 'Server is busy, please retry later',
+                    'diagnostics': {'estimated_cost_seconds': cost}
+                }
+            )
+        except asyncio.CancelledError:
+            job.cancelled = True
+            if job.future.done():
+                self._release(cost)
+            raise
+
+        try:
+            yield {
+                'estimated_cost_seconds': cost,
+                'queue_wait_seconds': round(time.monotonic() - queued_at, 3),
+            }
+        finally:
+            self._release(cost)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current budget usage and queue state"""
+        return {
+            'cpu_budget_seconds': self.cpu_budget,
+            'in_flight_cost_seconds': round(self._in_flight, 3),
+            'running_jobs': self._running,
+            'queued_jobs': sum(1 for job in self._queue if not job.cancelled),
+            'rejected_jobs': self._rejected,
+            'timed_out_jobs': self._timed_out,
+        }
+
+
+# Shared across requests: route handlers create a VideoService per request
+admission_controller = AdmissionController(
+    cpu_budget=settings.admission_cpu_budget_seconds,
+    max_job_cost=settings.admission_max_job_seconds,
+    queue_timeout=settings.admission_queue_timeout_seconds,
+    client_weights=settings.admission_client_weights,
+)
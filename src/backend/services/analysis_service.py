@@ -1,36 +1,34 @@
 """
 Service for AI analysis
 """
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from src.ml.ai_feedback import AIFeedbackService
 from src.backend.core.config import settings
+from src.backend.core.deadline import Deadline, timed
+from src.backend.services.history_service import get_history_store
 
 
 class AnalysisService:
     def __init__(self):
         self.ai_service = AIFeedbackService()
     
-    async def analyze_exercise_data(self, vectors_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def analyze_exercise_data(
+        self,
+        vectors_data: Dict[str, Any],
+        user_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
         """Analyzes exercise data using AI"""
         try:
             # Get AI analysis
-            ai_result = await self.ai_service.analyze_exercise(vectors_data)
+            with timed(deadline, 'ai_feedback'):
+                ai_result = await self.ai_service.analyze_exercise(vectors_data, deadline=deadline)
             
             # Format complete response
-            response = {
-                "status": "success",
-                "analysis": ai_result,
-                "metrics": {
-                    "rep_count": vectors_data.get("rep_count", 0),
-                    "total_frames": vectors_data.get("total_frames", 0),
-                    "duration": vectors_data.get("duration", 0),
-                    "fps": vectors_data.get("fps")
-                }
-            }
-            
-            return response
+            return await self.build_response(vectors_data, ai_result, user_id, deadline)
             
         except Exception as e:
             raise HTTPException(
@@ -38,6 +36,81 @@ class AnalysisService:
                 detail=f"AI analysis error: {str(e)}"
             )
     
+    async def analyze_exercise_stream(
+        self,
+        vectors_data: Dict[str, Any],
+        user_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        """Yields NDJSON-ready events: metrics first, feedback fields as the LLM
+        produces them, then the complete response of analyze_exercise_data"""
+        yield {"event": "metrics", "metrics": self.build_metrics(vectors_data)}
+        feedback = self.ai_service.analyze_exercise_stream(vectors_data, deadline=deadline)
+        try:
+            async for kind, path, value in feedback:
+                if kind == 'field':
+                    yield {"event": "field", "path": path, "value": value}
+                else:
+                    result = {"event": "result", **(await self.build_response(vectors_data, value, user_id, deadline))}
+                    if path:
+                        # Fields streamed earlier that this result replaces
+                        result["retracted_fields"] = path
+                    yield result
+        finally:
+            await feedback.aclose()
+    
+    def build_metrics(self, vectors_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Metrics block of the analysis response"""
+        metrics = {
+            "rep_count": vectors_data.get("rep_count", 0),
+            "total_frames": vectors_data.get("total_frames", 0),
+            "duration": vectors_data.get("duration", 0),
+            "fps": vectors_data.get("fps")
+        }
+        if vectors_data.get("track_id"):
+            # Stored pose track: POST /api/v1/tracks/{track_id}/analyze re-runs the analysis
+            metrics["track_id"] = vectors_data["track_id"]
+        hold = vectors_data.get("movement_analysis", {}).get("hold")
+        if hold:
+            # Static holds have no reps; the hold time is the result
+            metrics["hold_seconds"] = hold["hold_seconds"]
+            metrics["time_under_tension_seconds"] = hold["time_under_tension_seconds"]
+        if vectors_data.get("window"):
+            # Times in the result count from the window start; add `window.start` for video time
+            metrics["window"] = vectors_data["window"]
+        return metrics
+    
+    async def build_response(
+        self,
+        vectors_data: Dict[str, Any],
+        ai_result: Dict[str, Any],
+        user_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Formats the complete analysis response and records history"""
+        response = {
+            "status": "success",
+            "analysis": ai_result,
+            "metrics": self.build_metrics(vectors_data)
+        }
+        if deadline is not None and (deadline.bounded or deadline.truncated):
+            # Which stages returned partial results to stay within the budget
+            response["deadline"] = deadline.report()
+
+        if user_id and settings.history_enabled:
+            # SQLite insert of the analysis and its track: keep it off the event loop
+            response["history_id"] = await run_in_threadpool(self.record_history, user_id, vectors_data, ai_result)
+
+        return response
+    
+    def record_history(self, user_id: str, vectors_data: Dict[str, Any], ai_result: Dict[str, Any]) -> Optional[int]:
+        """Saves analysis to user history; failures never break the analysis response"""
+        try:
+            return get_history_store().record(user_id, vectors_data, ai_result)
+        except Exception as e:
+            print(f"Warning: Could not record analysis history: {e}")
+            return None
+    
     def validate_vectors_data(self, data: Dict[str, Any]) -> bool:
         """Validates vector data"""
         required_fields = ['total_frames', 'duration', 'frames_data']
@@ -0,0 +1,239 @@
+"""
+Persistent analysis history with incrementally maintained per-user aggregates
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.backend.core.config import settings
+
+
+# Per-frame columns kept in the compact track
+TRACK_COLUMNS = [
+    'timestamp',
+    'left_elbow_angle', 'right_elbow_angle',
+    'left_knee_angle', 'right_knee_angle',
+    'left_hip_angle', 'right_hip_angle',
+]
+
+# Range of motion that matters for progress tracking of each exercise
+ROM_KEYS = {
+    'pullup': 'elbow_range',
+    'pushup': 'elbow_range',
+    'squat': 'knee_range',
+    'deadlift': 'knee_range',
+    'lunge': 'knee_range',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    overall_score REAL,
+    rep_count INTEGER,
+    rom REAL,
+    duration REAL,
+    summary TEXT NOT NULL,
+    track BLOB,
+    track_frames INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_exercise_date ON analyses (user_id, exercise, created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_date ON analyses (user_id, created_at);
+CREATE TABLE IF NOT EXISTS aggregates (
+    user_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    total_reps INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    rom_sum REAL NOT NULL,
+    score_avg_rolling REAL,
+    rom_avg_rolling REAL,
+    reps_avg_rolling REAL,
+    best_score REAL,
+    first_at REAL NOT NULL,
+    last_at REAL NOT NULL,
+    PRIMARY KEY (user_id, exercise)
+);
+"""
+
+
+def _encode_track(frames_data: List[Dict[str, Any]]) -> Optional[bytes]:
+    """Packs the per-frame angle track as zlib-compressed float16"""
+    if np is None or not frames_data:
+        return None
+    track = np.array(
+        [[float(frame.get(col, 0.0)) for col in TRACK_COLUMNS] for frame in frames_data],
+        dtype=np.float16
+    )
+    return zlib.compress(track.tobytes(), 6)
+
+
+def _decode_track(blob: bytes, frames: int) -> Dict[str, List[float]]:
+    track = np.frombuffer(zlib.decompress(blob), dtype=np.float16).reshape(frames, len(TRACK_COLUMNS))
+    return {col: track[:, i].astype(float).round(2).tolist() for i, col in enumerate(TRACK_COLUMNS)}
+
+
+class HistoryStore:
+    """SQLite-backed store of analysis summaries.
+
+    Aggregates are updated in the same transaction as each insert, so trend
+    queries read a single row instead of rescanning the user's history.
+    """
+
+    def __init__(self, db_path: str, rolling_alpha: float = 0.3):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.rolling_alpha = rolling_alpha
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def record(self, user_id: str, vectors_data: Dict[str, Any], ai_result: Dict[str, Any]) -> int:
+        """Stores one analysis and folds it into the user's aggregates"""
+        movement = vectors_data.get('movement_analysis', {})
+        validation = vectors_data.get('validation', {})
+        exercise = validation.get('expected_exercise') or movement.get('exercise_type') or 'unknown'
+        score = float(ai_result.get('overall_score') or 0.0)
+        reps = int(vectors_data.get('rep_count') or 0)
+        rom_key = ROM_KEYS.get(exercise)
+        rom = float(movement.get(rom_key, 0.0)) if rom_key else float(
+            max(movement.get('elbow_range', 0.0), movement.get('knee_range', 0.0))
+        )
+        frames_data = vectors_data.get('frames_data') or []
+        created_at = time.time()
+        summary = {
+            'exercise_detected': ai_result.get('exercise_detected'),
+            'technique_analysis': ai_result.get('technique_analysis'),
+            'movement_analysis': movement,
+            'quality_score': validation.get('quality_score'),
+            'sets': vectors_data.get('sets'),
+        }
+
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO analyses (user_id, exercise, created_at, overall_score, rep_count, rom, duration,"
+                " summary, track, track_frames) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, exercise, created_at, score, reps, rom, float(vectors_data.get('duration') or 0.0),
+                 json.dumps(summary, default=float), _encode_track(frames_data), len(frames_data))
+            )
+            self._conn.execute(
+                """
+                INSERT INTO aggregates (user_id, exercise, sessions, total_reps, score_sum, rom_sum,
+                                        score_avg_rolling, rom_avg_rolling, reps_avg_rolling,
+                                        best_score, first_at, last_at)
+                VALUES (:user_id, :exercise, 1, :reps, :score, :rom, :score, :rom, :reps, :score, :now, :now)
+                ON CONFLICT (user_id, exercise) DO UPDATE SET
+                    sessions = sessions + 1,
+                    total_reps = total_reps + :reps,
+                    score_sum = score_sum + :score,
+                    rom_sum = rom_sum + :rom,
+                    score_avg_rolling = score_avg_rolling + :alpha * (:score - score_avg_rolling),
+                    rom_avg_rolling = rom_avg_rolling + :alpha * (:rom - rom_avg_rolling),
+                    reps_avg_rolling = reps_avg_rolling + :alpha * (:reps - reps_avg_rolling),
+                    best_score = MAX(best_score, :score),
+                    last_at = :now
+                """,
+                {'user_id': user_id, 'exercise': exercise, 'reps': reps, 'score': score, 'rom': rom,
+                 'alpha': self.rolling_alpha, 'now': created_at}
+            )
+            return int(cur.lastrowid)
+
+    def history(
+        self,
+        user_id: str,
+        exercise: Optional[str] = None,
+        limit: int = 50,
+        before: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Most recent analyses first, paginated by `created_at`"""
+        query = ("SELECT id, exercise, created_at, overall_score, rep_count, rom, duration, summary"
+                 " FROM analyses WHERE user_id = ?")
+        params: List[Any] = [user_id]
+        if exercise:
+            query += " AND exercise = ?"
+            params.append(exercise)
+        if before is not None:
+            query += " AND created_at < ?"
+            params.append(before)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(max(1, min(int(limit), 500)))
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                'id': row['id'],
+                'exercise': row['exercise'],
+                'created_at': row['created_at'],
+                'overall_score': row['overall_score'],
+                'rep_count': row['rep_count'],
+                'range_of_motion': row['rom'],
+                'duration': row['duration'],
+                'summary': json.loads(row['summary']),
+            }
+            for row in rows
+        ]
+
+    def trends(self, user_id: str, exercise: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Precomputed aggregates per exercise"""
+        query = "SELECT * FROM aggregates WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if exercise:
+            query += " AND exercise = ?"
+            params.append(exercise)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                'exercise': row['exercise'],
+                'sessions': row['sessions'],
+                'total_reps': row['total_reps'],
+                'avg_score': round(row['score_sum'] / row['sessions'], 2),
+                'avg_range_of_motion': round(row['rom_sum'] / row['sessions'], 2),
+                'rolling_avg_score': round(row['score_avg_rolling'], 2),
+                'rolling_avg_range_of_motion': round(row['rom_avg_rolling'], 2),
+                'rolling_avg_reps': round(row['reps_avg_rolling'], 2),
+                'best_score': row['best_score'],
+                'first_at': row['first_at'],
+                'last_at': row['last_at'],
+            }
+            for row in rows
+        ]
+
+    def track(self, user_id: str, analysis_id: int) -> Optional[Dict[str, List[float]]]:
+        """Decoded per-frame track of one analysis"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT track, track_frames FROM analyses WHERE id = ? AND user_id = ?",
+                (analysis_id, user_id)
+            ).fetchone()
+        if not row or row['track'] is None:
+            return None
+        return _decode_track(row['track'], row['track_frames'])
+
+
+_history_store: Optional[HistoryStore] = None
+
+
+def get_history_store() -> HistoryStore:
+    """Returns the process-wide store, opening the database on first use"""
+    global _history_store
+    if _history_store is None:
+        _history_store = HistoryStore(settings.history_db_path, settings.history_rolling_alpha)
+    return _history_store
@@ -0,0 +1,326 @@
+"""
+Analysis job queue shared by the API and worker processes (worker.py)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, Set
+
+from src.backend.core.config import settings
+
+QUEUED, LEASED, DONE, FAILED = 'queued', 'leased', 'done', 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_token TEXT,
+    lease_until REAL,
+    worker_id TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+"""
+
+
+class JobBroker(ABC):
+    """At-least-once job delivery with visibility timeouts.
+
+    `lease` hands a job to one worker until `lease_until`; a worker that
+    crashes or stops extending its lease loses the job to the next `lease`
+    call. Results are written once: the first `complete` or `reject` wins and
+    later writes (from a worker whose lease expired meanwhile) are ignored.
+    """
+
+    @abstractmethod
+    def enqueue(self, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        ...
+
+    @abstractmethod
+    def lease(self, worker_id: str, visibility_timeout: float) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def extend(self, job_id: str, lease_token: str, visibility_timeout: float) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, result: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def reject(self, job_id: str, error: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def release(self, job_id: str, lease_token: str, error: str, retry_delay: float = 0.0) -> str:
+        ...
+
+    @abstractmethod
+    def annotate(self, job_id: str, fields: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def pending_videos(self) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def gc(self, ttl_seconds: float) -> Dict[str, Any]:
+        ...
+
+
+class SQLiteJobBroker(JobBroker):
+    """Broker in a SQLite file, for a single machine or a shared local disk.
+
+    Every process opens its own connection; leases are taken in `BEGIN
+    IMMEDIATE` transactions, so two workers never lease the same job.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def enqueue(self, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        """Adds a job; re-enqueueing an existing `job_id` is a no-op"""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, payload, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), QUEUED, now, now, now)
+            )
+        return job_id
+
+    def lease(self, worker_id: str, visibility_timeout: float) -> Optional[Dict[str, Any]]:
+        """Oldest available job (queued, or leased with an expired lease), or None"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) "
+                        "ORDER BY available_at LIMIT 1",
+                        (QUEUED, now, LEASED, now)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    if row['attempts'] >= self.max_attempts:
+                        # Every delivery so far crashed or timed out; stop redelivering
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, lease_token = NULL, updated_at = ? WHERE id = ?",
+                            (FAILED, json.dumps({'code': 'MAX_ATTEMPTS', 'message': row['error'] or 'lease expired'}),
+                             now, row['id'])
+                        )
+                        continue
+                    token = uuid.uuid4().hex
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_token = ?, lease_until = ?, "
+                        "worker_id = ?, updated_at = ? WHERE id = ?",
+                        (LEASED, token, now + visibility_timeout, worker_id, now, row['id'])
+                    )
+                    self._conn.execute("COMMIT")
+                    return {
+                        'job_id': row['id'],
+                        'payload': json.loads(row['payload']),
+                        'attempt': row['attempts'] + 1,
+                        'lease_token': token,
+                    }
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def extend(self, job_id: str, lease_token: str, visibility_timeout: float) -> bool:
+        """Pushes the lease out; False when the lease was lost to another worker"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_token = ?",
+                (now + visibility_timeout, now, job_id, LEASED, lease_token)
+            )
+        return cursor.rowcount == 1
+
+    def _finish(self, job_id: str, status: str, column: str, value: Dict[str, Any]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = ?, {column} = ?, lease_token = NULL, updated_at = ? "
+                "WHERE id = ? AND status NOT IN (?, ?)",
+                (status, json.dumps(value, default=float), time.time(), job_id, DONE, FAILED)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """Stores the result; False if the job already has one"""
+        return self._finish(job_id, DONE, 'result', result)
+
+    def reject(self, job_id: str, error: Dict[str, Any]) -> bool:
+        """Fails the job for good (the input is unusable; retrying cannot help)"""
+        return self._finish(job_id, FAILED, 'error', error)
+
+    def release(self, job_id: str, lease_token: str, error: str, retry_delay: float = 0.0) -> str:
+        """Returns a job after a transient failure; it is failed once out of attempts"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND status = ? AND lease_token = ?",
+                (job_id, LEASED, lease_token)
+            ).fetchone()
+            if row is None:
+                return 'lost'
+            if row['attempts'] >= self.max_attempts:
+                status, error = FAILED, json.dumps({'code': 'MAX_ATTEMPTS', 'message': error})
+            else:
+                status = QUEUED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_token = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_token = ?",
+                (status, error, now + retry_delay, now, job_id, lease_token)
+            )
+        return status
+
+    def annotate(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """Adds fields to a stored result (e.g. the history id recorded after completion)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT result FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)).fetchone()
+                if row is not None:
+                    result = {**json.loads(row['result']), **fields}
+                    self._conn.execute(
+                        "UPDATE jobs SET result = ? WHERE id = ?", (json.dumps(result, default=float), job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if row['status'] == DONE:
+            job['result'] = json.loads(row['result'])
+        elif row['status'] == FAILED:
+            job['error'] = json.loads(row['error'])
+        elif row['error']:
+            # Transient failure of an earlier attempt
+            job['last_error'] = row['error']
+        return job
+
+    def pending_videos(self) -> Set[str]:
+        """Video keys of jobs that may still be processed (queued or leased)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM jobs WHERE status IN (?, ?)", (QUEUED, LEASED)
+            ).fetchall()
+        return {json.loads(row['payload']).get('video') for row in rows}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def gc(self, ttl_seconds: float) -> Dict[str, Any]:
+        """Forgets finished jobs older than `ttl_seconds`"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - ttl_seconds)
+            )
+        return {'removed_jobs': cursor.rowcount}
+
+
+_broker: Optional[JobBroker] = None
+
+
+def get_job_broker() -> JobBroker:
+    """Process-wide broker, opening the database on first use"""
+    global _broker
+    if _broker is None:
+        _broker = SQLiteJobBroker(settings.job_broker_db, max_attempts=settings.job_max_attempts)
+    return _broker
+
+
+def gc_jobs() -> Dict[str, Any]:
+    """Janitor hook: forgets old finished jobs and deletes stale videos from job storage.
+
+    Videos of jobs still queued or leased are kept however old they are; a
+    backlog longer than the TTL must not lose its inputs.
+    """
+    broker = get_job_broker()
+    stats = broker.gc(settings.job_result_ttl_seconds)
+    pending = broker.pending_videos()
+    removed = 0
+    cutoff = time.time() - settings.job_result_ttl_seconds
+    try:
+        names = os.listdir(settings.job_storage_dir)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if name in pending:
+            continue
+        path = os.path.join(settings.job_storage_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    stats['removed_videos'] = removed
+    return stats
+
+
+def job_video_path(video_key: str) -> str:
+    """Location of a job's video in the shared storage directory"""
+    name = os.path.basename(video_key)
+    if not name or name != video_key:
+        raise ValueError(f"Invalid video key: {video_key!r}")
+    return os.path.join(settings.job_storage_dir, name)
+
+
+def store_job_video(content: bytes, suffix: str) -> str:
+    """Writes an upload to shared storage and returns its key"""
+    os.makedirs(settings.job_storage_dir, exist_ok=True)
+    key = f"{uuid.uuid4().hex}{suffix}"
+    path = job_video_path(key)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return key
@@ -0,0 +1,145 @@
+"""
+Pre-flight video probe: metadata, cost estimate and a quick person check
+from the first bytes of a file, before the full upload
+"""
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from src.backend.core.config import settings
+from src.backend.services.admission_service import admission_controller, estimate_job_cost
+from src.backend.services.temp_janitor import temp_janitor
+from src.cv.mp4_header import parse_mp4_header
+from src.cv.video_probe import read_video_metadata, processing_plan, probe_person
+from src.cv.video_source import VideoSource, can_decode_in_memory, spool_video, spool_sparse
+
+
+def _issue(code: str, message: str, tips: List[str], **extra) -> Dict[str, Any]:
+    return {'code': code, 'message': message, 'tips': tips, **extra}
+
+
+class ProbeService:
+    """Answers "will this video be accepted, and how long will it take?"
+
+    The header is parsed from the bytes sent (MP4/MOV boxes, with a decoder
+    fallback for other containers). If an MP4 keeps its `moov` box at the end,
+    the response asks for that range (`need_more`) instead of the whole file.
+    """
+
+    def _suffix(self, filename: Optional[str]) -> str:
+        if filename and '.' in filename:
+            return f".{filename.split('.')[-1].lower()}"
+        return '.mp4'
+
+    def _read_metadata(self, head: bytes, tail: Optional[bytes], tail_offset: Optional[int],
+                       complete: bool, suffix: str) -> Dict[str, Any]:
+        header = parse_mp4_header(head, tail, tail_offset)
+        if header['status'] == 'ok':
+            meta = header['metadata']
+            plan = processing_plan(meta['fps'], meta['frame_count'], meta['width'], meta['height'])
+            return {'status': 'ok', 'source': 'mp4_header', 'metadata': {**meta, **plan}}
+        if header['status'] == 'need_more' and not complete:
+            return header
+
+        # Other containers keep their header up front; let the decoder read it
+        temp_path = None
+        source: VideoSource = head
+        if not can_decode_in_memory(len(head)):
+            temp_path = spool_video(head, suffix=suffix)
+            temp_janitor.track(temp_path)
+            source = temp_path
+        try:
+            metadata = read_video_metadata(source)
+        except Exception as e:
+            print(f"Warning: probe could not read video metadata: {e}")
+            metadata = None
+        finally:
+            if temp_path:
+                temp_janitor.release(temp_path)
+        if not metadata or not metadata.get('frame_count'):
+            return {'status': 'unreadable'}
+        return {'status': 'ok', 'source': 'decoder', 'metadata': metadata}
+
+    def _check_person(self, head: bytes, tail: Optional[bytes], tail_offset: Optional[int],
+                      suffix: str) -> Optional[Dict[str, Any]]:
+        temp_path = None
+        if tail is not None and tail_offset is not None:
+            temp_path = spool_sparse(head, tail, tail_offset, suffix=suffix)
+        elif not can_decode_in_memory(len(head)):
+            temp_path = spool_video(head, suffix=suffix)
+        source: VideoSource = temp_path or head
+        if temp_path:
+            temp_janitor.track(temp_path)
+        try:
+            return probe_person(source, settings.probe_person_samples, settings.probe_decode_seconds)
+        except Exception as e:
+            print(f"Warning: probe person check failed: {e}")
+            return None
+        finally:
+            if temp_path:
+                temp_janitor.release(temp_path)
+
+    async def probe(
+        self,
+        head: bytes,
+        filename: Optional[str] = None,
+        file_size: Optional[int] = None,
+        tail: Optional[bytes] = None,
+        tail_offset: Optional[int] = None,
+        check_person: bool = False,
+    ) -> Dict[str, Any]:
+        """Probe result with `verdict` "accept", "reject", "need_more" or "unknown" """
+        issues: List[Dict[str, Any]] = []
+        suffix = self._suffix(filename)
+        complete = file_size is None or file_size <= len(head)
+
+        if suffix.lstrip('.') not in settings.supported_video_formats:
+            issues.append(_issue('UNSUPPORTED_FORMAT', f"Unsupported format '{suffix}'",
+                                 [f"Use one of: {', '.join(settings.supported_video_formats)}"]))
+        if file_size is not None and file_size > settings.max_file_size_mb * 1024 * 1024:
+            issues.append(_issue('FILE_TOO_LARGE', f"File too large. Maximum size: {settings.max_file_size_mb}MB",
+                                 ['Trim the video to the working set', 'Record at a lower resolution']))
+
+        loop = asyncio.get_running_loop()
+        header = await loop.run_in_executor(None, self._read_metadata, head, tail, tail_offset, complete, suffix)
+        if header['status'] == 'need_more':
+            moov_end = header.get('moov_end') or file_size
+            return {
+                'verdict': 'reject' if issues else 'need_more',
+                'issues': issues,
+                # Send bytes [offset, end) as `tail` with `tail_offset` = offset
+                'need_range': {'offset': header['moov_offset'], 'end': moov_end},
+            }
+        if header['status'] != 'ok':
+            issues.append(_issue('UNREADABLE', 'Could not read the video header',
+                                 ['Re-export the video as MP4 (H.264)']))
+            return {'verdict': 'unknown' if not complete else 'reject', 'issues': issues}
+
+        metadata = header['metadata']
+        cost = estimate_job_cost(metadata)
+        result: Dict[str, Any] = {
+            'metadata': metadata,
+            'header_source': header['source'],
+            'estimated_cost_seconds': cost,
+            'admission': admission_controller.snapshot(),
+        }
+
+        if metadata['frame_count'] < 5 or metadata['duration'] < settings.probe_min_duration_seconds:
+            issues.append(_issue('TOO_SHORT', f"Video too short: {metadata['duration']:.1f}s",
+                                 ['Record at least one complete repetition']))
+        if cost > settings.admission_max_job_seconds:
+            max_duration = metadata['duration'] * settings.admission_max_job_seconds / cost
+            issues.append(_issue('JOB_TOO_EXPENSIVE', 'Video is too long or high-resolution to analyze',
+                                 [f"Trim the video to under {max_duration:.0f} seconds", 'Record at 720p or lower'],
+                                 max_duration_seconds=round(max_duration, 1)))
+
+        if check_person:
+            person = await loop.run_in_executor(None, self._check_person, head, tail, tail_offset, suffix)
+            result['person'] = person
+            if person and (person['person_ratio'] < settings.person_frames_ratio_min
+                           or person['avg_visibility'] < settings.person_avg_visibility_min):
+                issues.append(_issue('NO_PERSON', 'No person detected in the first seconds of the video',
+                                     ['Ensure full body is visible in frame', 'Improve lighting and camera angle']))
+
+        result['issues'] = issues
+        result['verdict'] = 'reject' if issues else 'accept'
+        return result
@@ -0,0 +1,200 @@
+"""
+Background cleanup of stale temp files (uploads left behind by crashed workers)
+"""
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Any, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows: only this process's own files are protected
+    fcntl = None
+
+from src.backend.core.config import settings
+from src.cv.video_source import TEMP_PREFIX, SHM_DIR
+
+
+class TempJanitor:
+    """Removes prefixed temp files older than `max_age_seconds`, then evicts the
+    oldest remaining ones while their total size exceeds `max_total_bytes`.
+
+    Paths registered with `track()` belong to in-flight requests and hold a
+    shared flock until `release()`; no worker removes a file someone holds.
+    Untracked files are only evicted for the size ceiling once they are older
+    than `grace_seconds` (the time between spooling and `track()`).
+    """
+
+    def __init__(
+        self,
+        directories: List[str],
+        max_age_seconds: float,
+        max_total_bytes: int,
+        interval_seconds: float,
+        grace_seconds: float = 60.0,
+    ):
+        self.directories = directories
+        self.max_age_seconds = max_age_seconds
+        self.max_total_bytes = max_total_bytes
+        self.interval_seconds = interval_seconds
+        self.grace_seconds = grace_seconds
+        self.active: Set[str] = set()
+        self._held: Dict[str, int] = {}
+        # Extra cleanups run on every sweep, e.g. abandoned resumable uploads
+        self.hooks: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.last_sweep: Optional[Dict[str, Any]] = None
+        self.total_removed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def add_hook(self, name: str, cleanup: Callable[[], Dict[str, Any]]) -> None:
+        self.hooks[name] = cleanup
+
+    def track(self, path: str) -> None:
+        path = os.path.abspath(path)
+        self.active.add(path)
+        if fcntl is None or path in self._held:
+            return
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            print(f"Warning: Could not lock temp file {path}: {e}")
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        except OSError as e:
+            os.close(fd)
+            print(f"Warning: Could not lock temp file {path}: {e}")
+            return
+        self._held[path] = fd
+
+    def release(self, path: str) -> None:
+        """Deletes a finished request's temp file and stops protecting it"""
+        path = os.path.abspath(path)
+        self.active.discard(path)
+        fd = self._held.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Warning: Could not delete temp file {path}: {e}")
+
+    def _candidates(self) -> List[Dict[str, Any]]:
+        files = []
+        for directory in dict.fromkeys(self.directories):
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            for entry in entries:
+                if not entry.name.startswith(TEMP_PREFIX) or not entry.is_file(follow_symlinks=False):
+                    continue
+                path = os.path.abspath(entry.path)
+                if path in self.active:
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                files.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+        return files
+
+    def _remove(self, path: str) -> bool:
+        """Deletes a file unless a request (of any worker) still holds its lock"""
+        fd = None
+        try:
+            if fcntl is not None:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Warning: janitor could not delete {path}: {e}")
+            return False
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def sweep(self) -> Dict[str, Any]:
+        """One cleanup pass; returns what was removed and what is left"""
+        now = time.time()
+        files = sorted(self._candidates(), key=lambda f: f['mtime'])
+        removed, freed = 0, 0
+        kept = []
+        for f in files:
+            if now - f['mtime'] > self.max_age_seconds and self._remove(f['path']):
+                removed += 1
+                freed += f['size']
+            else:
+                kept.append(f)
+
+        total = sum(f['size'] for f in kept) + sum(
+            os.path.getsize(p) for p in list(self.active) if os.path.exists(p)
+        )
+        for f in kept:
+            if total <= self.max_total_bytes:
+                break
+            if now - f['mtime'] > self.grace_seconds and self._remove(f['path']):
+                removed += 1
+                freed += f['size']
+                total -= f['size']
+
+        self.total_removed += removed
+        self.last_sweep = {
+            'at': now,
+            'removed_files': removed,
+            'freed_bytes': freed,
+            'remaining_bytes': total,
+            'over_ceiling': total > self.max_total_bytes,
+        }
+        for name, cleanup in self.hooks.items():
+            try:
+                self.last_sweep[name] = cleanup()
+            except Exception as e:
+                print(f"Warning: janitor hook {name} failed: {e}")
+        return self.last_sweep
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep)
+            except Exception as e:
+                print(f"Warning: temp janitor sweep failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'directories': list(dict.fromkeys(self.directories)),
+            'active_files': len(self.active),
+            'total_removed': self.total_removed,
+            'last_sweep': self.last_sweep,
+        }
+
+
+temp_janitor = TempJanitor(
+    directories=[d for d in (settings.temp_dir, settings.spool_dir or SHM_DIR) if d],
+    max_age_seconds=settings.temp_max_age_seconds,
+    max_total_bytes=int(settings.temp_max_total_mb * 1024 * 1024),
+    interval_seconds=settings.temp_janitor_interval_seconds,
+)
@@ -0,0 +1,302 @@
+"""
+Resumable chunked uploads: create, append byte ranges, query offset, finalize
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are only ordered within one worker
+    fcntl = None
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from src.backend.core.config import settings
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+# Received pieces are written in blocks of this size, off the event loop
+_WRITE_BLOCK = 1024 * 1024
+
+
+def parse_content_range(header: Optional[str]) -> Dict[str, Optional[int]]:
+    """`bytes start-end/total` -> {'start', 'end' (exclusive), 'total'}"""
+    match = _CONTENT_RANGE.match((header or '').strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Content-Range must be 'bytes <start>-<end>/<total>'")
+    start, last, total = match.groups()
+    if int(last) < int(start):
+        raise HTTPException(status_code=400, detail="Invalid Content-Range")
+    return {'start': int(start), 'end': int(last) + 1, 'total': None if total == '*' else int(total)}
+
+
+class UploadManager:
+    """Assembles uploads on disk: `<id>.part` holds the bytes received so far,
+    `<id>.json` the upload's state. The offset in the state file only advances
+    after a whole chunk was written (and matched its checksum), so a
+    connection dropped mid-chunk is rolled back and the client resumes from
+    the last committed offset.
+
+    Requests that touch an upload hold an exclusive flock on its data file,
+    so chunks, finalize and cleanup are ordered across all server workers.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float, max_chunk_bytes: int):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_chunk_bytes = max_chunk_bytes
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _paths(self, upload_id: str) -> Dict[str, str]:
+        if not _UPLOAD_ID.match(upload_id):
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return {
+            'data': os.path.join(self.directory, f"{upload_id}.part"),
+            'state': os.path.join(self.directory, f"{upload_id}.json"),
+        }
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    @asynccontextmanager
+    async def _locked(self, upload_id: str):
+        """Holds an upload: an asyncio lock within this worker, then a flock
+        on the data file against the others (waited for off the event loop)"""
+        data_path = self._paths(upload_id)['data']
+        async with self._lock(upload_id):
+            try:
+                fd = await run_in_threadpool(os.open, data_path, os.O_RDWR)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Upload not found")
+            try:
+                if fcntl is not None:
+                    await run_in_threadpool(fcntl.flock, fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                # Closing the descriptor releases the flock
+                os.close(fd)
+
+    @staticmethod
+    def _try_lock(path: str) -> Optional[int]:
+        """Descriptor holding an exclusive flock on `path`, None while a request holds it"""
+        fd = os.open(path, os.O_RDWR)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+        return fd
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        path = self._paths(state['upload_id'])['state']
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._paths(upload_id)['state'], encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+    def create(self, filename: str, size: int, content_type: Optional[str] = None,
+               sha256: Optional[str] = None, client_id: str = 'anonymous') -> Dict[str, Any]:
+        extension = filename.split('.')[-1].lower() if '.' in filename else ''
+        if extension not in settings.supported_video_formats:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Supported formats: {', '.join(settings.supported_video_formats)}"
+            )
+        if size <= 0 or size > settings.max_file_size_mb * 1024 * 1024:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+            )
+        if sha256 is not None and not re.match(r'^[0-9a-fA-F]{64}$', sha256):
+            raise HTTPException(status_code=400, detail="sha256 must be 64 hex characters")
+
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        state = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': filename,
+            'content_type': content_type or 'video/mp4',
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'offset': 0,
+            'client_id': client_id,
+            'created_at': now,
+            'updated_at': now,
+        }
+        open(self._paths(state['upload_id'])['data'], 'wb').close()
+        self._save_state(state)
+        return state
+
+    async def append(self, upload_id: str, content_range: Optional[str], body: AsyncIterator[bytes],
+                     chunk_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Writes one byte range; it must start at the committed offset"""
+        rng = parse_content_range(content_range)
+        async with self._locked(upload_id):
+            # Read under the lock: another worker may have committed a chunk or deleted the upload
+            state = self.get(upload_id)
+            if rng['total'] is not None and rng['total'] != state['size']:
+                raise HTTPException(status_code=400, detail="Content-Range total does not match the upload size")
+            if rng['end'] > state['size']:
+                raise HTTPException(status_code=400, detail="Chunk extends past the upload size")
+            if rng['end'] - rng['start'] > self.max_chunk_bytes:
+                raise HTTPException(status_code=413, detail=f"Chunks are limited to {self.max_chunk_bytes} bytes")
+            if rng['start'] != state['offset']:
+                raise HTTPException(
+                    status_code=409,
+                    detail={'message': 'Chunk does not start at the upload offset', 'offset': state['offset']}
+                )
+
+            expected = rng['end'] - rng['start']
+            digest = hashlib.sha256()
+            written = 0
+            data_path = self._paths(upload_id)['data']
+            f = await run_in_threadpool(open, data_path, 'r+b')
+            try:
+                await run_in_threadpool(f.seek, state['offset'])
+                pending, pending_size = [], 0
+                try:
+                    async for piece in body:
+                        written += len(piece)
+                        if written > expected:
+                            break
+                        digest.update(piece)
+                        pending.append(piece)
+                        pending_size += len(piece)
+                        if pending_size >= _WRITE_BLOCK:
+                            await run_in_threadpool(f.write, b''.join(pending))
+                            pending, pending_size = [], 0
+                    if pending and written <= expected:
+                        await run_in_threadpool(f.write, b''.join(pending))
+                except Exception:
+                    # Client went away mid-chunk: drop the partial range
+                    written = -1
+                if written != expected or (chunk_sha256 and digest.hexdigest() != chunk_sha256.lower()):
+                    await run_in_threadpool(f.truncate, state['offset'])
+                    if written == -1:
+                        raise HTTPException(status_code=400, detail="Upload interrupted; resume from the offset")
+                    if written != expected:
+                        raise HTTPException(status_code=400, detail="Body length does not match Content-Range")
+                    raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+                await run_in_threadpool(self._sync, f)
+            finally:
+                await run_in_threadpool(f.close)
+
+            state['offset'] = rng['end']
+            state['updated_at'] = time.time()
+            await run_in_threadpool(self._save_state, state)
+            return state
+
+    @staticmethod
+    def _sync(f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _file_sha256(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    async def complete(self, upload_id: str) -> Dict[str, Any]:
+        """Verifies an upload is whole and intact; returns its state with `path`"""
+        async with self._locked(upload_id):
+            # Read under the lock: no chunk of this upload is being written now
+            state = self.get(upload_id)
+            if state['offset'] != state['size']:
+                raise HTTPException(
+                    status_code=409,
+                    detail={'message': 'Upload is incomplete', 'offset': state['offset'], 'size': state['size']}
+                )
+            path = self._paths(upload_id)['data']
+            if state['sha256']:
+                actual = await run_in_threadpool(self._file_sha256, path)
+                if actual != state['sha256']:
+                    self.delete(upload_id)
+                    raise HTTPException(
+                        status_code=422,
+                        detail={
+                            'status': 'error',
+                            'code': 'CHECKSUM_MISMATCH',
+                            'message': 'Assembled file does not match the declared sha256',
+                            'tips': ['Create a new upload and send the file again'],
+                        }
+                    )
+            return {**state, 'path': path}
+
+    async def discard(self, upload_id: str) -> None:
+        """Deletes an upload once no other request is writing it"""
+        async with self._locked(upload_id):
+            self.delete(upload_id)
+
+    def delete(self, upload_id: str) -> None:
+        """Deletes an upload's files; callers hold its lock (or know it is unused)"""
+        for path in self._paths(upload_id).values():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    def gc(self) -> Dict[str, Any]:
+        """Removes uploads not touched for `ttl_seconds`, and orphaned data files"""
+        removed = 0
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {'removed_uploads': 0}
+        for name in names:
+            upload_id, _, extension = name.partition('.')
+            if not _UPLOAD_ID.match(upload_id) or extension not in ('json', 'part'):
+                continue
+            if extension == 'part' and f"{upload_id}.json" in names:
+                continue
+            lock = self._locks.get(upload_id)
+            if lock is not None and lock.locked():
+                continue
+            # Uploads a request of any worker is writing are skipped; the state is read under the lock
+            try:
+                fd = self._try_lock(self._paths(upload_id)['data'])
+            except FileNotFoundError:
+                fd = -1
+            if fd is None:
+                continue
+            try:
+                if extension == 'json':
+                    with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                        touched = json.load(f)['updated_at']
+                else:
+                    touched = os.path.getmtime(os.path.join(self.directory, name))
+                if now - touched > self.ttl_seconds:
+                    self.delete(upload_id)
+                    removed += 1
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            finally:
+                if fd >= 0:
+                    os.close(fd)
+        return {'removed_uploads': removed}
+
+
+upload_manager = UploadManager(
+    directory=settings.upload_dir,
+    ttl_seconds=settings.upload_ttl_seconds,
+    max_chunk_bytes=int(settings.upload_max_chunk_mb * 1024 * 1024),
+)
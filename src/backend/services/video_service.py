@@ -1,13 +1,21 @@
 """
 Service for video file processing
 """
-import os
-import tempfile
+import asyncio
 from typing import Optional, Dict, Any
 from fastapi import UploadFile, HTTPException
 
-from src.cv.video_processor import VideoProcessor
+from src.cv.landmark_store import LandmarkStore, get_landmark_store, content_sha256
+from src.cv.video_processor import VideoProcessor, is_hold_exercise, slice_track
+from src.cv.video_probe import processing_plan, read_video_metadata
+from src.cv.video_source import VideoSource, can_decode_in_memory, spool_video
+from src.cv.quality_gates import (
+    PASS, NO_PERSON, INSUFFICIENT_MOTION, evaluate_gates, gate_thresholds, motion_amplitude, motion_score, person_stats
+)
 from src.backend.core.config import settings
+from src.backend.core.deadline import Deadline, timed
+from src.backend.services.admission_service import admission_controller, estimate_job_cost
+from src.backend.services.temp_janitor import temp_janitor
 
 
 class VideoService:
@@ -45,33 +53,27 @@ class VideoService:
                 detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
             )
     
+    def _suffix(self, file: UploadFile) -> str:
+        if file.filename and '.' in file.filename:
+            return f".{file.filename.split('.')[-1].lower()}"
+        return '.mp4'
+
     async def save_temp_video(self, file: UploadFile) -> str:
-        """Saves video to temporary file"""
-        # Create temporary file
-        suffix = '.mp4'
-        if file.filename:
-            extension = file.filename.split('.')[-1].lower()
-            suffix = f'.{extension}'
-        
-        # Ensure temp_dir exists
-        temp_dir = settings.temp_dir
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir, exist_ok=True)
-        
-        temp_file = tempfile.NamedTemporaryFile(
-            delete=False, 
-            suffix=suffix,
-            dir=temp_dir
-        )
-        temp_path = temp_file.name
-        
-        # Write file synchronously (simpler for Railway)
+        """Saves video to a prefixed temporary file (memory-backed dir when available)"""
         content = await file.read()
-        temp_file.write(content)
-        temp_file.close()
-        
+        temp_path = spool_video(content, suffix=self._suffix(file))
+        temp_janitor.track(temp_path)
         return temp_path
-    
+
+    async def load_video_source(self, file: UploadFile) -> VideoSource:
+        """Raw bytes for small uploads (decoded in memory), a spooled temp path otherwise"""
+        content = await file.read()
+        if can_decode_in_memory(len(content)):
+            return content
+        temp_path = spool_video(content, suffix=self._suffix(file))
+        temp_janitor.track(temp_path)
+        return temp_path
+
     def _normalize_exercise(self, name: Optional[str]) -> Optional[str]:
         if not name:
             return None
@@ -91,6 +93,7 @@ class VideoService:
             "lunge": "lunge",
             "lunges": "lunge",
             "plank": "plank",
+            "planks": "plank",
         }
         return aliases.get(key, key)
 
@@ -99,56 +102,125 @@ class VideoService:
         file: UploadFile,
         expected_exercise: Optional[str] = None,
         strict: bool = False,
+        client_id: str = 'anonymous',
+        deadline: Optional[Deadline] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
     ) -> Optional[Dict[str, Any]]:
         """Complete video file processing"""
         temp_path = None
-        expected_norm = self._normalize_exercise(expected_exercise)
         
         try:
             # Validate file
             await self.validate_video_file(file)
+            self.validate_window(start, end)
             
-            # Save to temporary file
-            temp_path = await self.save_temp_video(file)
+            # Small uploads stay in memory; larger ones are spooled to disk
+            source = await self.load_video_source(file)
+            if isinstance(source, str):
+                temp_path = source
+            if deadline is not None:
+                deadline.mark('upload')
             
-            # Process video
-            result = await self.video_processor.process_video(temp_path, expected_exercise=expected_norm)
+            return await self.process_source(
+                source, expected_exercise, strict, client_id, deadline=deadline, start=start, end=end
+            )
             
-            if not result:
-                raise HTTPException(
-                    status_code=422,
-                    detail="Failed to process video. Please check video quality and content."
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Video processing error: {str(e)}"
+            )
+        finally:
+            # Remove temporary file
+            if temp_path:
+                temp_janitor.release(temp_path)
+
+    async def process_source(
+        self,
+        source: VideoSource,
+        expected_exercise: Optional[str] = None,
+        strict: bool = False,
+        client_id: str = 'anonymous',
+        content_hash: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Processing of an already validated video (path or in-memory bytes); the caller owns the file.
+
+        With the landmark store enabled, the pose track is saved under the
+        video's sha256 (`track_id` in the result) and a re-upload of the same
+        video skips decoding and inference. With a `deadline`, the queue wait
+        and decoding are cut short so that analysis still fits in the budget.
+        With `start`/`end` (seconds) only that window is decoded, or cut from
+        the stored track of the whole video. Hold exercises (plank) are
+        sampled sparsely and scored by hold time instead of reps.
+        """
+        self.validate_window(start, end)
+        expected_norm = self._normalize_exercise(expected_exercise)
+        windowed = bool(start or end)
+        sample_fps = settings.hold_sample_fps if is_hold_exercise(expected_norm) else None
+        
+        try:
+            if deadline is not None and deadline.remaining() <= settings.deadline_analysis_reserve_seconds:
+                self._raise_deadline_exceeded(deadline, 'upload')
+
+            store = get_landmark_store() if self.video_processor.pose is not None else None
+            track_id = None
+            track = None
+            if store:
+                track_id = content_hash or await asyncio.get_running_loop().run_in_executor(
+                    None, content_sha256, source
                 )
-            # Gates: person presence and motion sufficiency
-            result = self._apply_gates(result)
-
-            # If client provided expected exercise, validate mismatch
-            movement = result.get('movement_analysis', {})
-            detected = movement.get('exercise_type')
-            conf = float(movement.get('confidence', 0.0))
-            if expected_norm and detected and expected_norm != detected:
-                # If detection failed ('unknown'), do not hard-fail even in strict mode
-                if strict and detected != 'unknown' and conf >= settings.exercise_confidence_min:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Exercise mismatch: expected '{expected_norm}', detected '{detected}'"
+                track = self._load_track(store, track_id, sample_fps)
+                if track is not None and windowed:
+                    self._check_window_in_video(start, track['frame_count'] / track['fps'])
+                    track = slice_track(track, start, end)
+
+            if track is not None:
+                admission = {'track_reused': True}
+                with timed(deadline, 'analysis'):
+                    result = self.video_processor.analyze_track(track, expected_exercise=expected_norm)
+            else:
+                # Estimate cost from container metadata and wait for a fair share of the CPU budget
+                metadata = read_video_metadata(source)
+                if windowed and metadata:
+                    metadata = self._window_plan(metadata, start, end, sample_fps)
+                elif sample_fps and metadata:
+                    metadata = processing_plan(
+                        metadata['fps'], metadata['frame_count'], metadata['width'], metadata['height'], sample_fps
                     )
-                # Attach validation info
-                result.setdefault('validation', {})
-                result['validation'].update({
-                    'expected_exercise': expected_norm,
-                    'detected_exercise': detected,
-                    'match': detected == expected_norm
-                })
-            elif expected_norm and detected:
-                result.setdefault('validation', {})
-                result['validation'].update({
-                    'expected_exercise': expected_norm,
-                    'detected_exercise': detected,
-                    'match': True
-                })
-
-            return result
+                cost = estimate_job_cost(metadata)
+                queue_timeout = deadline.remaining() - settings.deadline_analysis_reserve_seconds if deadline else None
+                async with admission_controller.admit(client_id, cost, timeout=queue_timeout) as admission:
+                    if deadline is not None:
+                        deadline.timings['queue'] = admission['queue_wait_seconds']
+                    with timed(deadline, 'pose'):
+                        if store:
+                            track = await self.video_processor.extract_track(
+                                source, deadline=deadline, start=start, end=end, sample_fps=sample_fps,
+                                early_gates=settings.gate_early_enabled,
+                            )
+                        else:
+                            result = await self.video_processor.process_video(
+                                source, expected_exercise=expected_norm, deadline=deadline, start=start, end=end,
+                                early_gates=settings.gate_early_enabled,
+                            )
+                if store:
+                    # A truncated, gate-aborted or windowed track covers only part of the video and is not worth keeping
+                    if track and not windowed and 'truncated' not in track['processing_info'] and not track.get('gate_abort'):
+                        self._save_track(store, track_id, track)
+                    if windowed:
+                        track_id = None
+                    with timed(deadline, 'analysis'):
+                        result = self.video_processor.analyze_track(track, expected_exercise=expected_norm) if track else None
+            
+            if not result and deadline is not None and 'decode' in deadline.truncated:
+                self._raise_deadline_exceeded(deadline, 'decode')
+            return self._finish_result(result, admission, expected_norm, strict, track_id)
             
         except HTTPException:
             raise
@@ -157,51 +229,237 @@ class VideoService:
                 status_code=500,
                 detail=f"Video processing error: {str(e)}"
             )
-        finally:
-            # Remove temporary file
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete temp file {temp_path}: {e}")
+
+    async def reanalyze_track(
+        self,
+        track_id: str,
+        expected_exercise: Optional[str] = None,
+        strict: bool = False,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Re-runs features, reps, gates and exercise validation on a stored track (or a window of it)"""
+        self.validate_window(start, end)
+        store = get_landmark_store()
+        track = store.load(track_id) if store else None
+        if track is None:
+            raise HTTPException(status_code=404, detail="Landmark track not found")
+        if start or end:
+            self._check_window_in_video(start, track['frame_count'] / track['fps'])
+            track = slice_track(track, start, end)
+        expected_norm = self._normalize_exercise(expected_exercise)
+        if track.get('processing_info', {}).get('sample_fps') and not is_hold_exercise(expected_norm):
+            raise HTTPException(
+                status_code=409,
+                detail="Track was sampled sparsely for a hold analysis; upload the video again to count reps"
+            )
+        try:
+            result = self.video_processor.analyze_track(track, expected_exercise=expected_norm)
+            return self._finish_result(result, {'track_reused': True}, expected_norm, strict, track_id)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Video processing error: {str(e)}"
+            )
+
+    def validate_window(self, start: Optional[float], end: Optional[float]) -> None:
+        """`start`/`end` in seconds: both optional, non-negative, start before end"""
+        if start is None and end is None:
+            return
+        if (start is not None and start < 0) or (end is not None and end <= (start or 0.0)):
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    'status': 'error',
+                    'code': 'INVALID_WINDOW',
+                    'message': f'Invalid analysis window: start={start}, end={end}',
+                    'tips': ['Send start and end in seconds, with start < end', 'Leave both out to analyze the whole video'],
+                    'diagnostics': {'start': start, 'end': end}
+                }
+            )
+
+    def _check_window_in_video(self, start: Optional[float], duration: float) -> None:
+        # Containers without a frame count report a zero duration; decoding finds the end then
+        if start and duration > 0 and start >= duration:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    'status': 'error',
+                    'code': 'WINDOW_OUT_OF_RANGE',
+                    'message': f'Window starts at {start:.2f}s but the video is {duration:.2f}s long',
+                    'tips': ['Check the start time against the video duration'],
+                    'diagnostics': {'start': start, 'duration': round(duration, 3)}
+                }
+            )
+
+    def _window_plan(
+        self,
+        metadata: Dict[str, Any],
+        start: Optional[float],
+        end: Optional[float],
+        sample_fps: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Processing plan of the window only, for the admission cost estimate"""
+        self._check_window_in_video(start, metadata['duration'])
+        fps = metadata['fps']
+        first_frame = int(round((start or 0.0) * fps))
+        last_frame = min(int(round(end * fps)), metadata['frame_count']) if end else metadata['frame_count']
+        return processing_plan(fps, max(last_frame - first_frame, 0), metadata['width'], metadata['height'], sample_fps)
+
+    def _raise_deadline_exceeded(self, deadline: Deadline, stage: str) -> None:
+        raise HTTPException(
+            status_code=504,
+            detail={
+                'status': 'error',
+                'code': 'DEADLINE_EXCEEDED',
+                'message': f'Request deadline ran out during {stage} before anything could be analyzed',
+                'tips': [
+                    'Send a larger budget in the request deadline header',
+                    'Trim the video to the repetitions you want analyzed',
+                    'Use the resumable upload API on slow connections'
+                ],
+                'diagnostics': deadline.report()
+            }
+        )
+
+    def _load_track(
+        self, store: LandmarkStore, track_id: str, sample_fps: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Stored track, if it was extracted with the current pose settings.
+
+        A hold analysis (`sample_fps`) also accepts the dense track of the rep
+        pipeline; a sparse hold track is never used for rep counting.
+        """
+        track = store.load(track_id)
+        if not track:
+            return None
+        usable = [self.video_processor.extraction_settings()]
+        if sample_fps:
+            usable.append(self.video_processor.extraction_settings(sample_fps))
+        return track if track.get('extraction') in usable else None
+
+    def _save_track(self, store: LandmarkStore, track_id: str, track: Dict[str, Any]) -> None:
+        try:
+            store.save(track_id, track)
+        except Exception as e:
+            print(f"Warning: Could not save landmark track {track_id}: {e}")
+
+    def _finish_result(
+        self,
+        result: Optional[Dict[str, Any]],
+        admission: Dict[str, Any],
+        expected_norm: Optional[str],
+        strict: bool,
+        track_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Quality gates and expected-exercise validation of a processing result"""
+        if not result:
+            raise HTTPException(
+                status_code=422,
+                detail="Failed to process video. Please check video quality and content."
+            )
+        result.setdefault('processing_info', {}).update(admission)
+        if track_id:
+            result['track_id'] = track_id
+
+        # Gates: person presence and motion sufficiency
+        result = self._apply_gates(result)
+
+        # If client provided expected exercise, validate mismatch
+        movement = result.get('movement_analysis', {})
+        detected = movement.get('exercise_type')
+        conf = float(movement.get('confidence', 0.0))
+        if expected_norm and detected and expected_norm != detected:
+            # If detection failed ('unknown'), do not hard-fail even in strict mode
+            if strict and detected != 'unknown' and conf >= settings.exercise_confidence_min:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Exercise mismatch: expected '{expected_norm}', detected '{detected}'"
+                )
+            # Attach validation info
+            result.setdefault('validation', {})
+            result['validation'].update({
+                'expected_exercise': expected_norm,
+                'detected_exercise': detected,
+                'match': detected == expected_norm
+            })
+        elif expected_norm and detected:
+            result.setdefault('validation', {})
+            result['validation'].update({
+                'expected_exercise': expected_norm,
+                'detected_exercise': detected,
+                'match': True
+            })
+
+        return result
     
-    def cleanup_temp_files(self):
-        """Cleanup old temporary files"""
-        # Can add logic for cleaning old files
-        pass
+    def cleanup_temp_files(self) -> Dict[str, Any]:
+        """Cleanup old temporary files (age limit, then total size ceiling)"""
+        return temp_janitor.sweep()
+
+    def _gate_error(self, code: str, diagnostics: Dict[str, Any]) -> HTTPException:
+        """Structured 422 of a blocking gate"""
+        if code == 'NO_PERSON':
+            message = 'No person detected in the video'
+            tips = [
+                'Ensure full body is visible in frame',
+                'Improve lighting and camera angle',
+                'Keep camera steady and avoid motion blur',
+                'Stand closer to camera or zoom in'
+            ]
+        else:
+            message = 'Insufficient motion for exercise analysis'
+            tips = [
+                'Perform at least one complete repetition',
+                'Make movements more pronounced',
+                'Ensure you\'re doing the exercise throughout the video',
+                'Check that your full body is visible'
+            ]
+        return HTTPException(
+            status_code=422,
+            detail={
+                'status':'error',
+                'code':code,
+                'message':message,
+                'tips':tips,
+                'diagnostics': diagnostics
+            }
+        )
 
     def _apply_gates(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Многоуровневая валидация: критичные проверки + качественные предупреждения"""
+        abort = result.get('gate_abort')
+        if abort:
+            # Decided while decoding; the statistics cover the part that was processed
+            stats = abort['stats']
+            raise self._gate_error(abort['gate'], {
+                'frames_with_pose_ratio': round(stats['frames_with_pose_ratio'], 3),
+                'avg_visibility': round(stats['avg_visibility'], 3),
+                'min_keypoints_per_frame': int(stats['min_keypoints_per_frame']),
+                'source_total_frames': abort['source_total_frames'],
+                'sample_fps': result.get('fps'),
+                'early_decision': {
+                    key: abort[key] for key in ('reason', 'bound', 'probes', 'decoded_frames', 'source_frames')
+                    if key in abort
+                },
+            })
+
         frames = result.get('frames_data', [])
         movement = result.get('movement_analysis', {})
         fps = result.get('fps') or 30.0
         source_total = int(result.get('source_total_frames') or len(frames))
+        hold = movement.get('mode') == 'hold'
+        if hold:
+            # Sparse sampling: pose coverage is measured against the frames that were sampled
+            info = result.get('processing_info', {})
+            source_total = int(info.get('sampled_frames') or -(-source_total // int(info.get('frame_skip') or 1)))
 
-        frames_with_pose = len(frames)
-        ratio = (frames_with_pose / source_total) if source_total else 0.0
-        
-        # Статистика видимости
-        vis_keys = [
-            'left_shoulder_visibility','right_shoulder_visibility',
-            'left_hip_visibility','right_hip_visibility',
-            'left_knee_visibility','right_knee_visibility',
-            'left_elbow_visibility','right_elbow_visibility'
-        ]
-        vis_vals = []
-        min_kp = 0
-        if frames:
-            counts = []
-            for f in frames:
-                cnt = 0
-                for k in vis_keys:
-                    v = f.get(k)
-                    if isinstance(v,(int,float)):
-                        vis_vals.append(v)
-                        if v > 0.5:
-                            cnt += 1
-                counts.append(cnt)
-            min_kp = min(counts) if counts else 0
-        avg_vis = (sum(vis_vals)/len(vis_vals)) if vis_vals else 0.0
+        stats = person_stats(frames, source_total)
+        ratio = stats['frames_with_pose_ratio']
+        avg_vis = stats['avg_visibility']
+        min_kp = stats['min_keypoints_per_frame']
 
         # Диагностика
         diagnostics = result.setdefault('diagnostics', {})
@@ -213,61 +471,41 @@ class VideoService:
             'sample_fps': fps,
         })
 
+        amp = motion_amplitude(movement)
+        score = float(motion_score(amp))
+        diagnostics.update({'motion_amplitude': amp, 'motion_score': round(score,2)})
+        rep_count = int(movement.get('estimated_reps', 0))
+
+        # Blocking checks, shared with the offline threshold sweep
+        gate = int(evaluate_gates(ratio, avg_vis, min_kp, score, fps, rep_count, gate_thresholds()))
+        if hold and gate == INSUFFICIENT_MOTION:
+            # Holding still is the exercise; the hold position check below replaces the motion gate
+            gate = PASS
+
         # 🚫 УРОВЕНЬ 1: КРИТИЧНЫЕ ПРОВЕРКИ (блокирующие)
         # Только для явно неподходящих видео
-        if ratio < settings.person_frames_ratio_min or avg_vis < settings.person_avg_visibility_min or min_kp < settings.person_min_keypoints:
+        if gate == NO_PERSON:
+            raise self._gate_error('NO_PERSON', diagnostics)
+
+        if hold and not movement['hold']['hold_seconds']:
             raise HTTPException(
                 status_code=422,
                 detail={
                     'status':'error',
-                    'code':'NO_PERSON',
-                    'message':'No person detected in the video',
-                    'tips':[ 
-                        'Ensure full body is visible in frame', 
-                        'Improve lighting and camera angle', 
-                        'Keep camera steady and avoid motion blur',
-                        'Stand closer to camera or zoom in'
+                    'code':'NO_HOLD_POSITION',
+                    'message':'No hold position detected in the video',
+                    'tips':[
+                        'Film from the side so shoulders, hips and ankles are visible',
+                        'Keep the camera level with your body',
+                        'Hold the position for at least a few seconds'
                     ],
-                    'diagnostics': diagnostics
+                    'diagnostics': {**diagnostics, 'hold': movement['hold']}
                 }
             )
 
-        # Анализ движения
-        amp = {
-            'elbow': float(movement.get('elbow_range',0.0)),
-            'knee': float(movement.get('knee_range',0.0)),
-            'shoulderY': float(movement.get('shoulder_y_range',0.0)),
-            'wristY': float(movement.get('wrist_y_range',0.0)),
-        }
-        motion_score = max(
-            amp['elbow']/25.0,
-            amp['knee']/25.0,
-            (amp['shoulderY']/0.05) if 0.05 else 0.0,
-            (amp['wristY']/0.05) if 0.05 else 0.0,
-        )
-        diagnostics.update({'motion_amplitude': amp, 'motion_score': round(motion_score,2)})
-        
-        # Адаптивный порог для низкого FPS
-        motion_threshold = settings.motion_score_min - (0.15 if fps and fps < 20 else 0.0)
-        rep_count = int(movement.get('estimated_reps', 0))
-        
         # Блокируем только если совсем нет движения И нет повторений
-        if motion_score < motion_threshold and rep_count < 1:
-            raise HTTPException(
-                status_code=422,
-                detail={
-                    'status':'error',
-                    'code':'INSUFFICIENT_MOTION',
-                    'message':'Insufficient motion for exercise analysis',
-                    'tips':[ 
-                        'Perform at least one complete repetition', 
-                        'Make movements more pronounced',
-                        'Ensure you\'re doing the exercise throughout the video',
-                        'Check that your full body is visible'
-                    ],
-                    'diagnostics': diagnostics
-                }
-            )
+        if gate == INSUFFICIENT_MOTION:
+            raise self._gate_error('INSUFFICIENT_MOTION', diagnostics)
 
         # 🟡 УРОВЕНЬ 2: КАЧЕСТВЕННЫЕ ПРЕДУПРЕЖДЕНИЯ (не блокирующие)
         quality_warnings = []
@@ -281,7 +519,7 @@ class VideoService:
             quality_warnings.append("Pose detection quality is low")
             quality_score *= 0.8
             
-        if motion_score < settings.motion_score_good:
+        if score < settings.motion_score_good and not hold:
             quality_warnings.append("Movement amplitude is limited")
             quality_score *= 0.9
 
@@ -0,0 +1,84 @@
+"""
+Per-frame pose features and the subset each exercise needs
+"""
+from typing import Dict, FrozenSet, Optional, Tuple
+
+# BlazePose landmark indices
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+# Feature name -> ('angle', (a, vertex, c)) | ('y', point) | ('visibility', point),
+# in the order frames_data has always listed them
+FEATURE_SPECS: Dict[str, Tuple[str, object]] = {
+    'left_elbow_angle': ('angle', (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST)),
+    'right_elbow_angle': ('angle', (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST)),
+    'left_knee_angle': ('angle', (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)),
+    'right_knee_angle': ('angle', (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)),
+    'left_hip_angle': ('angle', (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE)),
+    'right_hip_angle': ('angle', (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE)),
+    'left_shoulder_angle': ('angle', (LEFT_ELBOW, LEFT_SHOULDER, LEFT_HIP)),
+    'right_shoulder_angle': ('angle', (RIGHT_ELBOW, RIGHT_SHOULDER, RIGHT_HIP)),
+    'left_wrist_y': ('y', LEFT_WRIST),
+    'right_wrist_y': ('y', RIGHT_WRIST),
+    'left_knee_y': ('y', LEFT_KNEE),
+    'right_knee_y': ('y', RIGHT_KNEE),
+    'left_shoulder_y': ('y', LEFT_SHOULDER),
+    'right_shoulder_y': ('y', RIGHT_SHOULDER),
+    'left_hip_y': ('y', LEFT_HIP),
+    'right_hip_y': ('y', RIGHT_HIP),
+    'left_elbow_visibility': ('visibility', LEFT_ELBOW),
+    'right_elbow_visibility': ('visibility', RIGHT_ELBOW),
+    'left_knee_visibility': ('visibility', LEFT_KNEE),
+    'right_knee_visibility': ('visibility', RIGHT_KNEE),
+    'left_shoulder_visibility': ('visibility', LEFT_SHOULDER),
+    'right_shoulder_visibility': ('visibility', RIGHT_SHOULDER),
+    'left_hip_visibility': ('visibility', LEFT_HIP),
+    'right_hip_visibility': ('visibility', RIGHT_HIP),
+}
+
+
+def _pair(name: str) -> FrozenSet[str]:
+    return frozenset((f'left_{name}', f'right_{name}'))
+
+
+# Read for every exercise: quality gates (visibilities), movement summary,
+# rule feedback and prompts (elbow/knee angles), history tracks (hip angles)
+COMMON_FEATURES = frozenset(
+    name for name, (kind, _) in FEATURE_SPECS.items() if kind == 'visibility'
+) | _pair('elbow_angle') | _pair('knee_angle') | _pair('hip_angle')
+
+# Inputs of exercise detection (threshold rules and DTW templates). Rep
+# analysis always detects, so the detected type can be checked against the
+# expected one.
+DETECTION_FEATURES = (
+    _pair('elbow_angle') | _pair('knee_angle') | _pair('hip_angle') | _pair('shoulder_y') | _pair('wrist_y')
+)
+
+# Per exercise: the extra features its analysis reads and the features whose
+# velocities are kept (the channel that drives the rep)
+FEATURE_REQUIREMENTS: Dict[str, Dict[str, FrozenSet[str]]] = {
+    'squat': {'features': frozenset(), 'velocities': _pair('knee_angle')},
+    'deadlift': {'features': frozenset(), 'velocities': _pair('hip_angle')},
+    'pushup': {'features': frozenset(), 'velocities': _pair('elbow_angle')},
+    'pullup': {'features': frozenset(), 'velocities': _pair('shoulder_y')},
+    # Hold analysis reads the raw landmarks
+    'plank': {'features': frozenset(), 'velocities': frozenset()},
+}
+
+
+def required_features(
+    exercise: Optional[str], detect: bool = True
+) -> Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]:
+    """(features, velocities) to compute for a known exercise; (None, None)
+    means everything, for exercises without an entry or not given"""
+    requirements = FEATURE_REQUIREMENTS.get(exercise) if exercise else None
+    if requirements is None:
+        return None, None
+    features = COMMON_FEATURES | requirements['features'] | requirements['velocities']
+    if detect:
+        features |= DETECTION_FEATURES
+    return features, requirements['velocities']
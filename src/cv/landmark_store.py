@@ -0,0 +1,192 @@
+"""
+On-disk store of raw pose tracks, keyed by the sha256 of the video content
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Any, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.backend.core.config import settings
+from src.cv.video_source import VideoSource
+
+# Bump when the track layout or the extraction pipeline changes
+TRACK_FORMAT_VERSION = 1
+
+_TRACK_ID = re.compile(r'^[0-9a-f]{64}$')
+_TRACK_FILE = re.compile(r'^([0-9a-f]{64})\.')
+# Arrays without a meta file this old are left over from an interrupted save
+ORPHAN_GRACE_SECONDS = 600
+
+
+def content_sha256(source: VideoSource) -> str:
+    """Hash of the video bytes (in-memory upload or file path)"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class LandmarkStore:
+    """Keeps each track as three files:
+
+    - `<id>.landmarks.npy`: float32 (N, 33, 4) x, y, z, visibility per frame
+    - `<id>.frames.npy`: int32 (N, 2) source frame id and interpolated flag
+    - `<id>.json`: fps, frame count, extraction settings, motion segments
+
+    The arrays are loaded memory-mapped, so re-analysis reads only what it touches.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _paths(self, track_id: str) -> Dict[str, str]:
+        if not _TRACK_ID.match(track_id or ''):
+            raise KeyError(track_id)
+        base = os.path.join(self.directory, track_id)
+        return {
+            'landmarks': f"{base}.landmarks.npy",
+            'frames': f"{base}.frames.npy",
+            'meta': f"{base}.json",
+        }
+
+    def exists(self, track_id: str) -> bool:
+        try:
+            return os.path.exists(self._paths(track_id)['meta'])
+        except KeyError:
+            return False
+
+    def save(self, track_id: str, track: Dict[str, Any]) -> None:
+        """Writes a track from `extract_track`; the meta file goes last and marks it complete"""
+        paths = self._paths(track_id)
+        os.makedirs(self.directory, exist_ok=True)
+        frames = np.stack([
+            np.asarray(track['frame_ids'], dtype=np.int32),
+            np.asarray(track['interpolated'], dtype=np.int32),
+        ], axis=1) if len(track['frame_ids']) else np.zeros((0, 2), dtype=np.int32)
+        arrays = {
+            'landmarks': np.asarray(track['landmarks'], dtype=np.float32).reshape(-1, 33, 4),
+            'frames': frames,
+        }
+        for name, array in arrays.items():
+            tmp_path = f"{paths[name]}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, paths[name])
+
+        meta = {
+            key: value for key, value in track.items()
+            if key not in ('landmarks', 'frame_ids', 'interpolated')
+        }
+        meta.update({'version': TRACK_FORMAT_VERSION, 'frames': int(len(frames)), 'saved_at': time.time()})
+        tmp_path = f"{paths['meta']}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, default=float)
+        os.replace(tmp_path, paths['meta'])
+
+    def load(self, track_id: str) -> Optional[Dict[str, Any]]:
+        """Track in the `extract_track` format, or None if missing or outdated"""
+        try:
+            paths = self._paths(track_id)
+            with open(paths['meta'], encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != TRACK_FORMAT_VERSION:
+                return None
+            # The meta file's mtime is the track's last use for `gc`
+            os.utime(paths['meta'])
+            landmarks = np.load(paths['landmarks'], mmap_mode='r')
+            frames = np.load(paths['frames'], mmap_mode='r')
+        except (KeyError, FileNotFoundError):
+            return None
+        except ValueError as e:
+            print(f"Warning: Could not load landmark track {track_id}: {e}")
+            return None
+        return {
+            **meta,
+            'landmarks': landmarks,
+            'frame_ids': frames[:, 0],
+            'interpolated': frames[:, 1].astype(bool),
+        }
+
+    def delete(self, track_id: str) -> None:
+        for path in self._paths(track_id).values():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def gc(self, ttl_seconds: float, max_bytes: int) -> Dict[str, Any]:
+        """Deletes tracks not used for `ttl_seconds`, then the least recently
+        used ones while the store is larger than `max_bytes` (0 = no limit)"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return {'removed_tracks': 0, 'remaining_bytes': 0}
+        tracks: Dict[str, Dict[str, float]] = {}
+        for entry in entries:
+            match = _TRACK_FILE.match(entry.name)
+            if not match:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            track = tracks.setdefault(match.group(1), {'size': 0, 'used': None, 'mtime': 0.0})
+            track['size'] += stat.st_size
+            track['mtime'] = max(track['mtime'], stat.st_mtime)
+            if entry.name.endswith('.json'):
+                track['used'] = stat.st_mtime
+
+        now = time.time()
+        removed = 0
+        kept = []
+        for track_id, track in tracks.items():
+            if track['used'] is None:
+                expired = now - track['mtime'] > ORPHAN_GRACE_SECONDS
+            else:
+                expired = ttl_seconds > 0 and now - track['used'] > ttl_seconds
+            if expired:
+                self.delete(track_id)
+                removed += 1
+            else:
+                kept.append((track['used'] or track['mtime'], track['size'], track_id))
+
+        total = sum(size for _, size, _ in kept)
+        if max_bytes > 0:
+            for _, size, track_id in sorted(kept):
+                if total <= max_bytes:
+                    break
+                self.delete(track_id)
+                removed += 1
+                total -= size
+        return {'removed_tracks': removed, 'remaining_bytes': total}
+
+
+_store: Optional[LandmarkStore] = None
+
+
+def get_landmark_store() -> Optional[LandmarkStore]:
+    """Shared store, or None when LANDMARK_STORE_ENABLED is off"""
+    global _store
+    if not settings.landmark_store_enabled or np is None:
+        return None
+    if _store is None:
+        _store = LandmarkStore(settings.landmark_store_dir)
+    return _store
+
+
+def gc_tracks() -> Dict[str, Any]:
+    """Janitor hook: LANDMARK_STORE_TTL_SECONDS / LANDMARK_STORE_MAX_MB limits"""
+    store = get_landmark_store()
+    if store is None:
+        return {'removed_tracks': 0}
+    return store.gc(settings.landmark_store_ttl_seconds, int(settings.landmark_store_max_mb * 1024 * 1024))
@@ -0,0 +1,102 @@
+"""
+Pixel-level motion gating for pose inference
+"""
+from typing import Dict, List, Optional
+
+try:
+    import cv2
+    import numpy as np
+    CV_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    np = None
+    CV_AVAILABLE = False
+
+
+class MotionGate:
+    """Decides per sampled frame whether pose inference is worth running.
+
+    Frames are downscaled to a small grayscale thumbnail and compared with the
+    thumbnail of the last frame that went through inference. While the scene
+    stays static only every `static_stride`-th sampled frame is inferred, the
+    rest are filled in by interpolation in `VideoProcessor`.
+    """
+
+    def __init__(self, threshold: float = 1.5, static_stride: int = 5, downscale_width: int = 64):
+        self.threshold = threshold
+        self.static_stride = max(1, int(static_stride))
+        self.downscale_width = downscale_width
+        self._reference = None
+        self._static_run = 0
+        self.timeline: List[Dict] = []
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        width = min(self.downscale_width, w)
+        height = max(1, int(h * width / w))
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def should_infer(self, frame_id: int, frame) -> bool:
+        """Scores motion of a BGR frame against the last inferred frame"""
+        thumb = self._thumbnail(frame)
+        if self._reference is None or self._reference.shape != thumb.shape:
+            score: Optional[float] = None
+            static = False
+        else:
+            score = float(np.mean(cv2.absdiff(thumb, self._reference)))
+            static = score < self.threshold
+
+        if static:
+            self._static_run += 1
+            infer = self._static_run % self.static_stride == 0
+        else:
+            self._static_run = 0
+            infer = True
+
+        if infer:
+            self._reference = thumb
+        self.timeline.append({'frame_id': frame_id, 'motion': score, 'static': static})
+        return infer
+
+    def segment_sets(self, fps: float, rest_min_seconds: float) -> Dict[str, List[Dict]]:
+        """Splits the timeline into active sets separated by static rest periods"""
+        if not self.timeline:
+            return {'sets': [], 'rest_periods': []}
+
+        rest_periods = []
+        run_start = None
+        for i, point in enumerate(self.timeline + [{'static': False}]):
+            if point['static'] and run_start is None:
+                run_start = i
+            elif not point['static'] and run_start is not None:
+                start_id = self.timeline[run_start]['frame_id']
+                end_id = self.timeline[i - 1]['frame_id']
+                if (end_id - start_id) / fps >= rest_min_seconds:
+                    rest_periods.append({
+                        'start_frame': start_id,
+                        'end_frame': end_id,
+                        'start_time': round(start_id / fps, 2),
+                        'end_time': round(end_id / fps, 2),
+                    })
+                run_start = None
+
+        sets = []
+        cursor = self.timeline[0]['frame_id']
+        last_id = self.timeline[-1]['frame_id']
+        for rest in rest_periods + [None]:
+            end_id = rest['start_frame'] - 1 if rest else last_id
+            if end_id > cursor:
+                sets.append({
+                    'index': len(sets) + 1,
+                    'start_frame': cursor,
+                    'end_frame': end_id,
+                    'start_time': round(cursor / fps, 2),
+                    'end_time': round(end_id / fps, 2),
+                })
+            if rest:
+                cursor = rest['end_frame'] + 1
+
+        return {'sets': sets, 'rest_periods': rest_periods}
@@ -0,0 +1,179 @@
+"""
+Minimal ISO-BMFF (MP4/MOV) header parser: duration, resolution and fps from
+the `moov` box, without decoding or even having the whole file
+"""
+import struct
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+# Boxes whose payload is a list of child boxes (only the ones on our path)
+_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _unpack(fmt: str, data: bytes, offset: int, end: int) -> tuple:
+    """struct.unpack_from that also refuses to read past the end of the enclosing box"""
+    if offset < 0 or offset + struct.calcsize(fmt) > min(end, len(data)):
+        raise struct.error(f"box field at {offset} runs past the box end {end}")
+    return struct.unpack_from(fmt, data, offset)
+
+
+def _boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """Yields (type, box_offset, payload_offset, box_end); box_end may exceed `end` for a truncated box"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = _unpack('>I4s', data, offset, end)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = _unpack('>Q', data, offset + 8, end)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset, offset + header, offset + size
+        offset += size
+
+
+def _full_box_version(data: bytes, payload: int, end: int) -> int:
+    return _unpack('>B', data, payload, end)[0]
+
+
+def _parse_mvhd(data: bytes, payload: int, end: int) -> Tuple[int, int]:
+    if _full_box_version(data, payload, end) == 1:
+        return _unpack('>IQ', data, payload + 4 + 16, end)
+    return _unpack('>II', data, payload + 4 + 8, end)
+
+
+_parse_mdhd = _parse_mvhd
+
+
+def _parse_tkhd(data: bytes, payload: int, end: int) -> Dict[str, Any]:
+    version = _full_box_version(data, payload, end)
+    # version/flags, times, track id, reserved, duration
+    base = payload + 4 + (32 if version == 1 else 20)
+    # reserved(8) layer(2) alternate_group(2) volume(2) reserved(2)
+    matrix = _unpack('>9i', data, base + 16, end)
+    width, height = _unpack('>II', data, base + 16 + 36, end)
+    a, b = matrix[0] / 65536.0, matrix[1] / 65536.0
+    if abs(a) < 0.5:
+        rotation = 90 if b > 0 else 270
+    else:
+        rotation = 0 if a > 0 else 180
+    return {'width': width >> 16, 'height': height >> 16, 'rotation': rotation}
+
+
+def _parse_stts(data: bytes, payload: int, end: int) -> int:
+    count = _unpack('>I', data, payload + 4, end)[0]
+    # (sample_count, sample_delta) pairs; the count is checked against the box size first
+    entries = _unpack(f'>{2 * count}I', data, payload + 8, end)
+    return sum(entries[0::2])
+
+
+def _parse_stsd(data: bytes, payload: int, end: int) -> Optional[str]:
+    if _unpack('>I', data, payload + 4, end)[0] < 1:
+        return None
+    return _unpack('>4s', data, payload + 12, end)[0].decode('latin-1')
+
+
+def _parse_track(data: bytes, start: int, end: int) -> Dict[str, Any]:
+    track: Dict[str, Any] = {}
+    for box_type, _, payload, box_end in _boxes(data, start, end):
+        box_end = min(box_end, end)
+        if box_type == b'tkhd':
+            track.update(_parse_tkhd(data, payload, box_end))
+        elif box_type == b'mdhd':
+            track['timescale'], track['duration'] = _parse_mdhd(data, payload, box_end)
+        elif box_type == b'hdlr':
+            track['handler'] = _unpack('>4s', data, payload + 8, box_end)[0]
+        elif box_type == b'stts':
+            track['sample_count'] = _parse_stts(data, payload, box_end)
+        elif box_type == b'stsd':
+            track['codec'] = _parse_stsd(data, payload, box_end)
+        elif box_type in _CONTAINERS:
+            # tkhd/mdhd live at different depths; merge everything below trak
+            for key, value in _parse_track(data, payload, box_end).items():
+                track.setdefault(key, value)
+    return track
+
+
+def _parse_moov(data: bytes, start: int, end: int) -> Optional[Dict[str, Any]]:
+    movie_timescale, movie_duration = 0, 0
+    video = None
+    for box_type, _, payload, box_end in _boxes(data, start, end):
+        box_end = min(box_end, end)
+        if box_type == b'mvhd':
+            movie_timescale, movie_duration = _parse_mvhd(data, payload, box_end)
+        elif box_type == b'trak' and video is None:
+            track = _parse_track(data, payload, box_end)
+            if track.get('handler') == b'vide':
+                video = track
+    if video is None:
+        return None
+
+    timescale = video.get('timescale') or movie_timescale
+    duration = video.get('duration') or movie_duration
+    seconds = duration / timescale if timescale else 0.0
+    frame_count = int(video.get('sample_count', 0))
+    width, height = video.get('width', 0), video.get('height', 0)
+    if video.get('rotation') in (90, 270):
+        width, height = height, width
+    return {
+        'fps': round(frame_count / seconds, 3) if seconds else 0.0,
+        'frame_count': frame_count,
+        'width': width,
+        'height': height,
+        'duration': round(seconds, 3),
+        'rotation': video.get('rotation', 0),
+        'codec': video.get('codec'),
+    }
+
+
+def parse_mp4_header(head: bytes, tail: Optional[bytes] = None, tail_offset: Optional[int] = None) -> Dict[str, Any]:
+    """Parses video metadata from the first bytes of an MP4 (and optionally a tail chunk).
+
+    Returns `{'status': 'ok', 'metadata': {...}}` when `moov` was found,
+    `{'status': 'need_more', 'moov_offset': int, 'moov_end': int|None}` when the
+    header lives outside the given bytes (e.g. `moov` after `mdat` in files that
+    were not written with faststart), or `{'status': 'not_mp4'}` (also for
+    malformed boxes, e.g. a truncated `mvhd` or an `stts` entry count larger
+    than its box).
+    """
+    try:
+        return _parse_header(head, tail, tail_offset)
+    except (struct.error, IndexError, ValueError):
+        return {'status': 'not_mp4'}
+
+
+def _parse_header(head: bytes, tail: Optional[bytes], tail_offset: Optional[int]) -> Dict[str, Any]:
+    chunks = [(0, head)]
+    if tail is not None and tail_offset is not None:
+        chunks.append((tail_offset, tail))
+
+    moov_offset: Optional[int] = None
+    moov_end: Optional[int] = None
+    next_box = 0
+    first = True
+    for base, data in chunks:
+        for box_type, offset, payload, box_end in _boxes(data, 0, len(data)):
+            if first:
+                if box_type not in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                    return {'status': 'not_mp4'}
+                first = False
+            if box_type == b'moov':
+                if box_end <= len(data):
+                    metadata = _parse_moov(data, payload, box_end)
+                    if metadata is None:
+                        return {'status': 'not_mp4'}
+                    return {'status': 'ok', 'metadata': metadata}
+                moov_offset, moov_end = base + offset, base + box_end
+                break
+            next_box = base + box_end
+            if box_end > len(data):
+                # Box runs past the chunk: the next top-level box starts at box_end
+                break
+        if first:
+            return {'status': 'not_mp4'}
+    if moov_offset is None:
+        moov_offset = next_box
+    return {'status': 'need_more', 'moov_offset': moov_offset, 'moov_end': moov_end}
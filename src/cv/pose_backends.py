@@ -0,0 +1,260 @@
+"""
+Pose estimation backends: RGB frames in, (33, 4) landmark arrays out
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+from src.backend.core.config import settings
+
+NUM_LANDMARKS = 33
+POSE_BACKENDS = ('legacy', 'tasks', 'onnx')
+
+
+def landmarks_to_array(landmarks) -> 'np.ndarray':
+    """(33, 4) x, y, z, visibility from a sequence of MediaPipe landmarks"""
+    return np.array(
+        [[lm.x, lm.y, lm.z, lm.visibility if lm.visibility is not None else 0.0] for lm in landmarks],
+        dtype=np.float32
+    )
+
+
+class PoseBackend(ABC):
+    """`process_batch` takes consecutive RGB frames of one video with their
+    timestamps (ms) and returns, per frame, a (33, 4) array of normalized
+    x, y, z and visibility in MediaPipe landmark order, or None when no person
+    was found. Call `reset()` before the frames of another video.
+    """
+
+    name = 'base'
+    # Frames the caller should collect per process_batch call
+    batch_size = 1
+
+    @abstractmethod
+    def process_batch(self, frames: Sequence['np.ndarray'], timestamps_ms: Sequence[int]) -> List[Optional['np.ndarray']]:
+        ...
+
+    def process(self, frame: 'np.ndarray', timestamp_ms: int = 0) -> Optional['np.ndarray']:
+        return self.process_batch([frame], [timestamp_ms])[0]
+
+    def reset(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def describe(self) -> Dict[str, Any]:
+        """Everything that changes the landmarks; stored tracks are matched on it"""
+        return {'backend': self.name}
+
+
+class LegacyPoseBackend(PoseBackend):
+    """`mp.solutions.pose.Pose` with tracking between frames, one frame per call"""
+
+    name = 'legacy'
+
+    def __init__(self, model_complexity: int = 1, min_detection_confidence: float = 0.5,
+                 min_tracking_confidence: float = 0.5):
+        import mediapipe as mp
+        self.model_complexity = model_complexity
+        self._pose = mp.solutions.pose.Pose(
+            static_image_mode=False,
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
+        )
+
+    def process_batch(self, frames, timestamps_ms):
+        out = []
+        for frame in frames:
+            results = self._pose.process(frame)
+            out.append(landmarks_to_array(results.pose_landmarks.landmark) if results.pose_landmarks else None)
+        return out
+
+    def reset(self) -> None:
+        # Drop the tracked ROI of the previous video
+        self._pose.reset()
+
+    def close(self) -> None:
+        self._pose.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'model_complexity': self.model_complexity}
+
+
+class TasksPoseBackend(PoseBackend):
+    """MediaPipe Tasks PoseLandmarker in VIDEO running mode (needs a .task model file)"""
+
+    name = 'tasks'
+
+    def __init__(self, model_path: str, min_detection_confidence: float = 0.5,
+                 min_tracking_confidence: float = 0.5):
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"PoseLandmarker model not found: '{model_path}' (set POSE_TASK_MODEL_PATH)")
+        from mediapipe.tasks.python import BaseOptions, vision
+        self.model_path = model_path
+        self._vision = vision
+        self._options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.VIDEO,
+            num_poses=1,
+            min_pose_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+        )
+        self._landmarker = vision.PoseLandmarker.create_from_options(self._options)
+        self._last_timestamp = -1
+
+    def process_batch(self, frames, timestamps_ms):
+        import mediapipe as mp
+        out = []
+        for frame, timestamp in zip(frames, timestamps_ms):
+            # VIDEO mode rejects timestamps that do not increase
+            timestamp = max(int(timestamp), self._last_timestamp + 1)
+            self._last_timestamp = timestamp
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(frame))
+            result = self._landmarker.detect_for_video(image, timestamp)
+            out.append(landmarks_to_array(result.pose_landmarks[0]) if result.pose_landmarks else None)
+        return out
+
+    def reset(self) -> None:
+        # A landmarker's clock only moves forward; each video gets a fresh one
+        self._landmarker.close()
+        self._landmarker = self._vision.PoseLandmarker.create_from_options(self._options)
+        self._last_timestamp = -1
+
+    def close(self) -> None:
+        self._landmarker.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'model': os.path.basename(self.model_path)}
+
+
+_onnx_sessions: Dict[Any, Any] = {}
+_onnx_sessions_lock = threading.Lock()
+
+
+def _onnx_session(model_path: str, intra_op_threads: int):
+    """Sessions are thread-safe and slow to create, so one per model and thread count is shared"""
+    key = (os.path.abspath(model_path), intra_op_threads)
+    with _onnx_sessions_lock:
+        if key not in _onnx_sessions:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            _onnx_sessions[key] = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        return _onnx_sessions[key]
+
+
+def _sigmoid(x: 'np.ndarray') -> 'np.ndarray':
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class OnnxPoseBackend(PoseBackend):
+    """Single-stage whole-frame pose model on ONNX Runtime (CPU), several frames per call.
+
+    Model contract: one float32 RGB input scaled to [0, 1], NHWC or NCHW
+    (detected from the input shape). The first output holds (N, 33 * K) or
+    (N, 33, K) values with K >= 4: x, y, z, visibility. The optional second
+    output (N, 1) is a pose presence score. `output_format` "blazepose"
+    means x, y in input pixels and logit scores (BlazePose landmark exports);
+    "normalized" means x, y in [0, 1] and probabilities.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_path: str, batch_size: int = 8, intra_op_threads: int = 0,
+                 output_format: str = 'blazepose', presence_threshold: float = 0.5):
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime is not installed")
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX pose model not found: '{model_path}' (set POSE_ONNX_MODEL_PATH)")
+        if output_format not in ('blazepose', 'normalized'):
+            raise ValueError(f"Unknown ONNX output format '{output_format}'")
+        import cv2
+        self._cv2 = cv2
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.output_format = output_format
+        self.presence_threshold = presence_threshold
+        self.session = _onnx_session(model_path, intra_op_threads)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        self.channels_first = shape[1] == 3
+        self.height, self.width = (shape[2], shape[3]) if self.channels_first else (shape[1], shape[2])
+        # Models exported with a fixed batch dimension get padded batches of exactly that size
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+        self.batch_size = self.fixed_batch or max(1, batch_size)
+
+    def _inputs(self, frames) -> 'np.ndarray':
+        size = (self.width, self.height)
+        batch = np.stack([self._cv2.resize(frame, size, interpolation=self._cv2.INTER_AREA) for frame in frames])
+        batch = batch.astype(np.float32) * (1.0 / 255.0)
+        if self.fixed_batch and len(frames) < self.fixed_batch:
+            padding = np.zeros((self.fixed_batch - len(frames),) + batch.shape[1:], dtype=np.float32)
+            batch = np.concatenate([batch, padding])
+        return batch.transpose(0, 3, 1, 2) if self.channels_first else batch
+
+    def process_batch(self, frames, timestamps_ms):
+        out: List[Optional['np.ndarray']] = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = frames[start:start + self.batch_size]
+            outputs = self.session.run(None, {self.input_name: self._inputs(chunk)})
+            raw = np.asarray(outputs[0], dtype=np.float32)
+            landmarks = np.array(raw.reshape(raw.shape[0], NUM_LANDMARKS, -1)[:len(chunk), :, :4])
+            if self.output_format == 'blazepose':
+                landmarks[..., 0] /= self.width
+                landmarks[..., 1] /= self.height
+                landmarks[..., 2] /= self.width
+                landmarks[..., 3] = _sigmoid(landmarks[..., 3])
+            presence = np.ones(len(chunk), dtype=np.float32)
+            if len(outputs) > 1:
+                presence = np.asarray(outputs[1], dtype=np.float32).reshape(-1)[:len(chunk)]
+                if self.output_format == 'blazepose':
+                    presence = _sigmoid(presence)
+            out.extend(
+                landmarks[i] if presence[i] >= self.presence_threshold else None
+                for i in range(len(chunk))
+            )
+        return out
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'model': os.path.basename(self.model_path),
+            'input': [self.height, self.width],
+            'output_format': self.output_format,
+        }
+
+
+def create_pose_backend(name: Optional[str] = None, batch_size: Optional[int] = None) -> PoseBackend:
+    """Backend from POSE_BACKEND (or `name`): "legacy", "tasks" or "onnx" """
+    name = (name or settings.pose_backend).strip().lower()
+    if name == 'tasks':
+        return TasksPoseBackend(settings.pose_task_model_path)
+    if name == 'onnx':
+        return OnnxPoseBackend(
+            settings.pose_onnx_model_path,
+            batch_size=batch_size or settings.pose_batch_size,
+            intra_op_threads=settings.pose_intra_op_threads,
+            output_format=settings.pose_onnx_output_format,
+        )
+    if name != 'legacy':
+        raise ValueError(f"Unknown pose backend '{name}'; expected one of {', '.join(POSE_BACKENDS)}")
+    return LegacyPoseBackend(model_complexity=settings.pose_model_complexity)
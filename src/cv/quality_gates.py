@@ -0,0 +1,205 @@
+"""
+Blocking quality gates (person presence, motion sufficiency) as pure functions.
+
+The decision works element-wise on numpy arrays, so the threshold sweep can
+evaluate many threshold combinations at once with the same code the API uses.
+"""
+import math
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from src.backend.core.config import settings
+
+PASS, NO_PERSON, INSUFFICIENT_MOTION = 0, 1, 2
+GATE_CODES = {PASS: None, NO_PERSON: 'NO_PERSON', INSUFFICIENT_MOTION: 'INSUFFICIENT_MOTION'}
+
+# Settings attributes the gates read; the sweep accepts these names as grid axes
+GATE_PARAMS = (
+    'person_frames_ratio_min',
+    'person_avg_visibility_min',
+    'person_min_keypoints',
+    'motion_score_min',
+    'exercise_confidence_min',
+)
+
+VISIBILITY_KEYS = [
+    'left_shoulder_visibility', 'right_shoulder_visibility',
+    'left_hip_visibility', 'right_hip_visibility',
+    'left_knee_visibility', 'right_knee_visibility',
+    'left_elbow_visibility', 'right_elbow_visibility',
+]
+
+# Landmark indices of VISIBILITY_KEYS, for statistics taken from raw landmark arrays
+VISIBILITY_LANDMARKS = (11, 12, 23, 24, 25, 26, 13, 14)
+
+# Below this fps the motion threshold is relaxed by LOW_FPS_MOTION_RELIEF
+LOW_FPS = 20
+LOW_FPS_MOTION_RELIEF = 0.15
+
+
+def gate_thresholds(overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Current gate thresholds from settings, with overrides applied"""
+    unknown = set(overrides or {}) - set(GATE_PARAMS)
+    if unknown:
+        raise KeyError(f"Unknown gate parameters: {', '.join(sorted(unknown))}")
+    return {**{name: getattr(settings, name) for name in GATE_PARAMS}, **(overrides or {})}
+
+
+def person_stats(frames_data, source_total_frames: int) -> Dict[str, float]:
+    """Pose coverage and visibility statistics; independent of any threshold"""
+    ratio = (len(frames_data) / source_total_frames) if source_total_frames else 0.0
+    vis_vals = []
+    counts = []
+    for f in frames_data:
+        cnt = 0
+        for k in VISIBILITY_KEYS:
+            v = f.get(k)
+            if isinstance(v, (int, float)):
+                vis_vals.append(v)
+                if v > 0.5:
+                    cnt += 1
+        counts.append(cnt)
+    return {
+        'frames_with_pose_ratio': ratio,
+        'avg_visibility': (sum(vis_vals) / len(vis_vals)) if vis_vals else 0.0,
+        'min_keypoints_per_frame': min(counts) if counts else 0,
+    }
+
+
+def motion_amplitude(movement: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        'elbow': float(movement.get('elbow_range', 0.0)),
+        'knee': float(movement.get('knee_range', 0.0)),
+        'shoulderY': float(movement.get('shoulder_y_range', 0.0)),
+        'wristY': float(movement.get('wrist_y_range', 0.0)),
+    }
+
+
+def motion_score(amp: Dict[str, Any]):
+    """Largest joint excursion relative to a nominal rep (25 degrees / 0.05 travel)"""
+    return np.maximum.reduce([
+        np.asarray(amp['elbow']) / 25.0,
+        np.asarray(amp['knee']) / 25.0,
+        np.asarray(amp['shoulderY']) / 0.05,
+        np.asarray(amp['wristY']) / 0.05,
+    ])
+
+
+def evaluate_gates(ratio, avg_visibility, min_keypoints, score, fps, rep_count, thresholds: Dict[str, Any]):
+    """Gate code (PASS, NO_PERSON, INSUFFICIENT_MOTION); every argument may be an array"""
+    no_person = (
+        (np.asarray(ratio) < thresholds['person_frames_ratio_min'])
+        | (np.asarray(avg_visibility) < thresholds['person_avg_visibility_min'])
+        | (np.asarray(min_keypoints) < thresholds['person_min_keypoints'])
+    )
+    # Low frame rates undersample the motion, so the bar is lower
+    motion_min = np.asarray(thresholds['motion_score_min']) - np.where(
+        np.asarray(fps) < LOW_FPS, LOW_FPS_MOTION_RELIEF, 0.0
+    )
+    # Only block when there is neither motion nor a single counted rep
+    no_motion = (np.asarray(score) < motion_min) & (np.asarray(rep_count) < 1)
+    return np.where(no_person, NO_PERSON, np.where(no_motion, INSUFFICIENT_MOTION, PASS))
+
+
+def _wilson_upper(successes: int, trials: int, z: float) -> float:
+    """Upper bound of a binomial rate (Wilson score interval)"""
+    if trials <= 0:
+        return 1.0
+    p = successes / trials
+    center = p + z * z / (2 * trials)
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    return min(1.0, (center + margin) / (1 + z * z / trials))
+
+
+class GateAccumulator:
+    """Person statistics of a track while it is being extracted, kept in step
+    with what person_stats will compute on the finished track, and an early
+    NO_PERSON decision once the outcome can no longer change.
+
+    The statistical rules assume the rest of the video looks like the part
+    processed so far, which a lead-in (empty room, then the person walks in)
+    breaks; `confirm` checks a decision against frames spread over the rest.
+    Only NO_PERSON is decided early. Motion is not: a still lead-in says
+    nothing about whether the exercise starts later.
+    """
+
+    def __init__(self, thresholds: Optional[Dict[str, float]] = None, z: Optional[float] = None):
+        self.thresholds = thresholds or gate_thresholds()
+        self.z = settings.gate_early_z if z is None else z
+        self.pose_frames = 0
+        self.visibility_sum = 0.0
+        self.visibility_sq_sum = 0.0
+        self.min_keypoints: Optional[int] = None
+        # Cleared when probes of the rest contradict the prefix; only the exact rule remains
+        self.statistical = True
+
+    def add(self, landmarks) -> None:
+        """One frame of the track ((33, 4) landmark array)"""
+        visibility = np.asarray(landmarks)[VISIBILITY_LANDMARKS, 3]
+        frame_mean = float(visibility.mean())
+        keypoints = int((visibility > 0.5).sum())
+        self.pose_frames += 1
+        self.visibility_sum += frame_mean
+        self.visibility_sq_sum += frame_mean * frame_mean
+        self.min_keypoints = keypoints if self.min_keypoints is None else min(self.min_keypoints, keypoints)
+
+    def stats(self, resolved_frames: int) -> Dict[str, float]:
+        """person_stats of the frames seen so far (ratio over the resolved sampled frames)"""
+        return {
+            'frames_with_pose_ratio': self.pose_frames / resolved_frames if resolved_frames else 0.0,
+            'avg_visibility': self.visibility_sum / self.pose_frames if self.pose_frames else 0.0,
+            'min_keypoints_per_frame': self.min_keypoints or 0,
+        }
+
+    def decide(self, resolved_frames: int, total_frames: int, denominator: int,
+               window_reached: bool) -> Optional[Dict[str, Any]]:
+        """NO_PERSON decision info when the final gate is certain to fail, else None.
+
+        `resolved_frames` of the `total_frames` sampled frames are processed;
+        the final ratio divides pose frames by `denominator`. Before the
+        initial window is reached only the certain minimum-keypoint rule applies.
+        """
+        t = self.thresholds
+        if self.min_keypoints is not None and self.min_keypoints < t['person_min_keypoints']:
+            # The final minimum over all frames can only be lower
+            return {'reason': 'min_keypoints_per_frame', 'bound': self.min_keypoints}
+        if not self.statistical or not window_reached or not resolved_frames or not denominator:
+            return None
+
+        # Pose frames in the rest of the video at the upper bound of the rate seen so far
+        rate = _wilson_upper(self.pose_frames, resolved_frames, self.z)
+        ratio_bound = (self.pose_frames + rate * max(total_frames - resolved_frames, 0)) / denominator
+        if ratio_bound < t['person_frames_ratio_min']:
+            return {'reason': 'frames_with_pose_ratio', 'bound': round(ratio_bound, 3)}
+
+        if self.pose_frames >= 2:
+            mean = self.visibility_sum / self.pose_frames
+            variance = max(0.0, self.visibility_sq_sum / self.pose_frames - mean * mean)
+            visibility_bound = mean + self.z * math.sqrt(variance / self.pose_frames)
+            if visibility_bound < t['person_avg_visibility_min']:
+                return {'reason': 'avg_visibility', 'bound': round(visibility_bound, 3)}
+        return None
+
+    def confirm(self, decision: Dict[str, Any], probes: List[Any]) -> bool:
+        """Whether pose results of frames spread over the unprocessed part
+        (None where no pose was found) agree with a statistical decision.
+
+        Any probe that looks like a usable person vetoes the decision: too few
+        probes to estimate the rest, but enough to see that it differs.
+        """
+        if decision['reason'] == 'min_keypoints_per_frame':
+            return True
+        if not probes:
+            return False
+        found = [landmarks for landmarks in probes if landmarks is not None]
+        if decision['reason'] == 'frames_with_pose_ratio':
+            agrees = not found
+        else:
+            agrees = all(
+                np.asarray(landmarks)[VISIBILITY_LANDMARKS, 3].mean() < self.thresholds['person_avg_visibility_min']
+                for landmarks in found
+            )
+        if not agrees:
+            self.statistical = False
+        return agrees
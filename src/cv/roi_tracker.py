@@ -0,0 +1,144 @@
+"""
+Person region of interest for pose inference on large frames
+"""
+from typing import Dict, Optional, Tuple
+
+try:
+    import cv2
+    import numpy as np
+    CV_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    np = None
+    CV_AVAILABLE = False
+
+# Fewer visible landmarks than this and the person counts as lost
+MIN_TRACKED_LANDMARKS = 6
+# Visible landmarks this close to the crop border (normalized) may be cut off
+EDGE_MARGIN = 0.02
+# The box is re-framed when it is more than this many times the area it needs
+MAX_SLACK_AREA = 2.25
+
+Box = Tuple[int, int, int, int]
+
+
+class RoiTracker:
+    """Crops frames to the person found in the previous inference.
+
+    The first frame, and any frame after the person was lost, goes to the pose
+    model whole (detection). After that each frame is cropped to the bounding
+    box of the last visible landmarks, padded by `padding` of its longer side
+    on every side, and crops larger than `max_side` are downscaled. Landmarks
+    are mapped back to full-frame coordinates, so features and angles are
+    computed exactly as for uncropped frames.
+
+    The box only moves when the person gets near its border or it has become
+    much larger than needed. A box that follows every frame would shift the
+    image under the pose model's own tracking and landmark smoothing; `crop`
+    reports every change of framing so the caller can reset the model.
+    """
+
+    def __init__(self, padding: float = 0.25, max_side: int = 640, min_frame_side: int = 1280,
+                 min_visibility: float = 0.5):
+        self.padding = padding
+        self.max_side = max_side
+        self.min_frame_side = min_frame_side
+        self.min_visibility = min_visibility
+        self.box: Optional[Box] = None
+        # Box of the last frame handed out by `crop` (None: the whole frame)
+        self._framing: Optional[Box] = None
+        self.frames = 0
+        self.cropped_frames = 0
+        self.detections = 0
+        self.reframes = 0
+        self.pixels = 0
+        self.frame_pixels = 0
+
+    def crop(self, frame) -> Tuple['np.ndarray', Optional[Box], bool]:
+        """The part of a frame to run inference on, its box (None for the whole
+        frame) and whether the framing differs from the previous frame's
+        (full -> crop, re-crop, crop -> full)"""
+        h, w = frame.shape[:2]
+        self.frames += 1
+        self.frame_pixels += h * w
+        box = self.box if max(h, w) >= self.min_frame_side else None
+        changed = box != self._framing
+        self._framing = box
+        if box is None:
+            if max(h, w) >= self.min_frame_side:
+                self.detections += 1
+            self.pixels += h * w
+            return frame, None, changed
+        x0, y0, x1, y1 = box
+        region = frame[y0:y1, x0:x1]
+        scale = self.max_side / max(x1 - x0, y1 - y0)
+        if scale < 1:
+            size = (max(1, int(round((x1 - x0) * scale))), max(1, int(round((y1 - y0) * scale))))
+            region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+        self.cropped_frames += 1
+        self.pixels += region.shape[0] * region.shape[1]
+        return region, box, changed
+
+    def observe(self, landmarks, box: Optional[Box], frame_shape) -> Optional['np.ndarray']:
+        """Maps the landmarks of a crop from `crop` back to the full frame and
+        moves the box for the next frames. Results must arrive in frame order."""
+        h, w = frame_shape[:2]
+        if landmarks is None:
+            self.box = None
+            return None
+        visible = landmarks[:, 3] >= self.min_visibility
+        if box is not None:
+            x0, y0, x1, y1 = box
+            if visible.any():
+                (lx, ly), (hx, hy) = landmarks[visible, :2].min(axis=0), landmarks[visible, :2].max(axis=0)
+                # Sides clamped to the frame border cut nothing off; only the inner ones count
+                if ((lx < EDGE_MARGIN and x0 > 0) or (hx > 1 - EDGE_MARGIN and x1 < w)
+                        or (ly < EDGE_MARGIN and y0 > 0) or (hy > 1 - EDGE_MARGIN and y1 < h)):
+                    # Part of the person may be outside the crop: detect on the whole frame again
+                    self.box = None
+            landmarks = landmarks.copy()
+            landmarks[:, 0] = (landmarks[:, 0] * (x1 - x0) + x0) / w
+            landmarks[:, 1] = (landmarks[:, 1] * (y1 - y0) + y0) / h
+            # z shares the x scale
+            landmarks[:, 2] = landmarks[:, 2] * (x1 - x0) / w
+            if self.box is None:
+                return landmarks
+
+        if max(h, w) < self.min_frame_side:
+            return landmarks
+        if int(visible.sum()) < MIN_TRACKED_LANDMARKS:
+            self.box = None
+            return landmarks
+
+        points = landmarks[visible, :2] * (w, h)
+        (px0, py0), (px1, py1) = points.min(axis=0), points.max(axis=0)
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            inner = self.padding * 0.5 * max(px1 - px0, py1 - py0)
+            needed = (px1 - px0 + 2 * inner) * (py1 - py0 + 2 * inner)
+            # A side clamped to the frame border has all the room there is
+            inside = ((px0 - inner >= x0 or x0 == 0) and (py0 - inner >= y0 or y0 == 0)
+                      and (px1 + inner <= x1 or x1 == w) and (py1 + inner <= y1 or y1 == h))
+            if inside and (x1 - x0) * (y1 - y0) <= MAX_SLACK_AREA * max(needed, 1.0):
+                return landmarks
+            self.reframes += 1
+
+        pad = self.padding * max(px1 - px0, py1 - py0)
+        self.box = (
+            max(0, int(px0 - pad)), max(0, int(py0 - pad)),
+            min(w, int(np.ceil(px1 + pad))), min(h, int(np.ceil(py1 + pad))),
+        )
+        if self.box[2] - self.box[0] < 2 or self.box[3] - self.box[1] < 2:
+            self.box = None
+        return landmarks
+
+    def summary(self) -> Optional[Dict]:
+        """processing_info entry: how much of the frames went through inference"""
+        if not self.cropped_frames:
+            return None
+        return {
+            'cropped_frames': self.cropped_frames,
+            'detections': self.detections,
+            'reframes': self.reframes,
+            'pixel_ratio': round(self.pixels / self.frame_pixels, 3) if self.frame_pixels else 1.0,
+        }
@@ -0,0 +1,123 @@
+"""
+Lightweight video probing: container metadata, and an optional person check
+on a few sampled frames
+"""
+import threading
+from typing import Dict, Optional
+
+try:
+    import cv2
+    CV_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    CV_AVAILABLE = False
+
+from src.cv.video_source import VideoSource, open_capture
+
+
+def sampling_frame_skip(fps: float, sample_fps: Optional[float] = None) -> int:
+    """Frame step used by VideoProcessor: at most ~10 sampled frames per second,
+    or about `sample_fps` (sparse sampling of static holds)"""
+    if sample_fps:
+        return max(1, int(round(fps / sample_fps)))
+    return max(1, int(fps / 10)) if fps > 20 else 1
+
+
+def read_video_metadata(video_path: VideoSource) -> Optional[Dict]:
+    """Reads fps, frame count and resolution from the container header (path or in-memory bytes)"""
+    if not CV_AVAILABLE:
+        return None
+
+    cap = open_capture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        cap.release()
+
+    return processing_plan(fps, frame_count, width, height)
+
+
+def processing_plan(fps: float, frame_count: int, width: int, height: int,
+                    sample_fps: Optional[float] = None) -> Dict:
+    """Container metadata plus the frame sampling VideoProcessor will use"""
+    frame_skip = sampling_frame_skip(fps, sample_fps)
+    return {
+        'fps': fps,
+        'frame_count': frame_count,
+        'width': width,
+        'height': height,
+        'duration': frame_count / fps if fps > 0 else 0.0,
+        'frame_skip': frame_skip,
+        'sampled_frames': (frame_count + frame_skip - 1) // frame_skip if frame_count > 0 else 0,
+    }
+
+
+# Keypoints whose visibility the person gate looks at (shoulders, elbows, hips, knees)
+_GATE_LANDMARKS = (11, 12, 13, 14, 23, 24, 25, 26)
+
+_person_pose = None
+_person_pose_lock = threading.Lock()
+
+
+def _get_person_pose():
+    """Single-image pose model shared by probes (no tracking between frames)"""
+    global _person_pose
+    if _person_pose is None:
+        # Imported here: video_processor preloads GL libraries before mediapipe
+        from src.cv.video_processor import mp
+        _person_pose = mp.solutions.pose.Pose(
+            static_image_mode=True,
+            min_detection_confidence=0.5
+        )
+    return _person_pose
+
+
+def probe_person(source: VideoSource, samples: int, max_seconds: float) -> Optional[Dict]:
+    """Runs single-image pose detection on a few frames spread over the first
+    `max_seconds` of the video; other frames are only demuxed/decoded"""
+    if not CV_AVAILABLE:
+        return None
+
+    cap = open_capture(source)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or int(fps * max_seconds)
+        window = max(1, min(frame_count, int(fps * max_seconds)))
+        targets = sorted({int(i * (window - 1) / max(1, samples - 1)) for i in range(samples)})
+
+        checked, with_person, visibilities = 0, 0, []
+        frame_id = 0
+        for target in targets:
+            while frame_id < target:
+                if not cap.grab():
+                    break
+                frame_id += 1
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_id += 1
+            with _person_pose_lock:
+                results = _get_person_pose().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            checked += 1
+            if results.pose_landmarks:
+                with_person += 1
+                landmarks = results.pose_landmarks.landmark
+                visibilities.extend(landmarks[i].visibility for i in _GATE_LANDMARKS)
+    finally:
+        cap.release()
+
+    if not checked:
+        return None
+    return {
+        'frames_checked': checked,
+        'frames_with_person': with_person,
+        'person_ratio': round(with_person / checked, 3),
+        'avg_visibility': round(sum(visibilities) / len(visibilities), 3) if visibilities else 0.0,
+    }
@@ -1,6 +1,8 @@
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
 import asyncio
+import functools
+import math
 import os
 import ctypes
 import glob
@@ -80,8 +82,194 @@ except ImportError as e:
     mp = None
     np = None
 
+from src.backend.core.config import settings
+from src.backend.core.deadline import Deadline
+from src.cv.features import FEATURE_SPECS, required_features
+from src.cv.motion_gate import MotionGate
+from src.cv.pose_backends import LegacyPoseBackend, create_pose_backend
+from src.cv.quality_gates import GateAccumulator
+from src.cv.roi_tracker import RoiTracker
+from src.cv.video_probe import sampling_frame_skip
+from src.cv.video_source import VideoSource, open_capture, describe_source, seek_frame, seek_or_reopen
+from src.ml.dtw_classifier import get_classifier
+
+
+# Hand-tuned classification thresholds and rep-counter hysteresis. Kept in one
+# place so the offline sweep (src/ml/threshold_sweep.py) can replay them.
+# Motion values are normalized y travel; angles in degrees; *_pct are percentiles.
+ANALYSIS_DEFAULTS: Dict[str, float] = {
+    'smooth_window': 7,
+    'pullup_motion_min': 0.06,
+    'pullup_elbow_min': 35.0,
+    'pullup_knee_max': 25.0,
+    'squat_knee_min': 55.0,
+    'squat_motion_min': 0.04,
+    'deadlift_knee_min': 25.0,
+    'deadlift_knee_max': 55.0,
+    'deadlift_hip_min': 20.0,
+    'deadlift_motion_max': 0.05,
+    'pushup_elbow_min': 45.0,
+    'pushup_motion_max': 0.03,
+    'pushup_knee_max': 25.0,
+    'pullup_rep_low': 0.25,
+    'pullup_rep_high': 0.75,
+    'pullup_rep_min_amp': 0.03,
+    'squat_rep_flex_pct': 30.0,
+    'squat_rep_extend_pct': 70.0,
+    'squat_rep_min_amp': 30.0,
+    'deadlift_rep_flex_pct': 35.0,
+    'deadlift_rep_extend_pct': 75.0,
+    'deadlift_rep_min_amp': 20.0,
+    'pushup_rep_flex_pct': 35.0,
+    'pushup_rep_extend_pct': 75.0,
+    'pushup_rep_min_amp': 25.0,
+}
+
+
+def analysis_params(overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """ANALYSIS_DEFAULTS with overrides applied; unknown names are an error"""
+    unknown = set(overrides or {}) - set(ANALYSIS_DEFAULTS)
+    if unknown:
+        raise KeyError(f"Unknown analysis parameters: {', '.join(sorted(unknown))}")
+    return {**ANALYSIS_DEFAULTS, **(overrides or {})}
+
+
+def _smooth(series: List[float], window: int = 7) -> List[float]:
+    """Moving-average smoothing with edge padding"""
+    if len(series) < 3:
+        return series
+    w = max(3, window if window % 2 == 1 else window + 1)
+    pad = w // 2
+    arr = np.array(series, dtype=float)
+    arr = np.pad(arr, (pad, pad), mode='edge')
+    kernel = np.ones(w) / w
+    sm = np.convolve(arr, kernel, mode='same')[pad:-pad]
+    return sm.tolist()
+
+
+def _count_reps_pullup(y_series: List[float], low_frac: float = 0.25, high_frac: float = 0.75,
+                       min_amp: float = 0.03) -> int:
+    y_min, y_max = min(y_series), max(y_series)
+    amp = y_max - y_min
+    if amp < min_amp:
+        return 0
+    low = y_min + low_frac * amp
+    high = y_min + high_frac * amp
+    state = 'down'
+    reps = 0
+    for y in y_series:
+        if state == 'down' and y <= low:
+            state = 'up'
+        elif state == 'up' and y >= high:
+            reps += 1
+            state = 'down'
+    return reps
+
+
+def _count_reps_angle(angles: List[float], flex_thresh: float, extend_thresh: float, min_amp: float = 20.0) -> int:
+    a_min, a_max = min(angles), max(angles)
+    if a_max - a_min < min_amp:
+        return 0
+    state = 'extended'
+    reps = 0
+    for a in angles:
+        if state == 'extended' and a <= flex_thresh:
+            state = 'flexed'
+        elif state == 'flexed' and a >= extend_thresh:
+            reps += 1
+            state = 'extended'
+    return reps
+
+
+class _LandmarkPoint:
+    __slots__ = ('x', 'y', 'z', 'visibility')
+
+    def __init__(self, x: float, y: float, z: float, visibility: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visibility = visibility
+
+
+class ArrayLandmarks:
+    """Exposes an (33, 4) landmark array through the MediaPipe `.landmark` interface"""
+
+    def __init__(self, array):
+        self.array = array
+        # tolist() converts each row once; element access on (memory-mapped) arrays is slow
+        self.landmark = [_LandmarkPoint(*row) for row in np.asarray(array).tolist()]
+
+
+@functools.lru_cache(maxsize=None)
+def _feature_plan(features: Optional[FrozenSet[str]]) -> Tuple[Tuple[str, str, object], ...]:
+    """(name, kind, landmarks) of the features to compute, in FEATURE_SPECS order"""
+    return tuple(
+        (name, kind, source) for name, (kind, source) in FEATURE_SPECS.items()
+        if features is None or name in features
+    )
+
+
+def is_hold_exercise(exercise: Optional[str]) -> bool:
+    """Isometric exercises (HOLD_EXERCISES) are analyzed in hold mode"""
+    return bool(exercise) and exercise in settings.hold_exercises
+
+
+def window_info(fps: float, first_frame: int, last_frame: int, source_frames: int) -> Dict:
+    """Where an analyzed window sits in the source video (`last_frame` is exclusive)"""
+    return {
+        'start': round(first_frame / fps, 3),
+        'end': round(last_frame / fps, 3),
+        'start_frame': first_frame,
+        'end_frame': last_frame,
+        'source_frames': source_frames,
+        'source_duration': round(source_frames / fps, 3),
+    }
+
+
+def slice_track(track: Dict, start: Optional[float] = None, end: Optional[float] = None) -> Dict:
+    """The part of a whole-video track between `start` and `end` seconds, in the
+    layout `extract_track` returns for that window"""
+    fps = track['fps']
+    source_frames = int(track['frame_count'])
+    first_frame = min(int(round((start or 0.0) * fps)), source_frames)
+    last_frame = min(int(round(end * fps)), source_frames) if end else source_frames
+    frame_ids = np.asarray(track['frame_ids'])
+    keep = (frame_ids >= first_frame) & (frame_ids < last_frame)
+    frame_count = max(last_frame - first_frame, 0)
+
+    segments = track.get('segments')
+    if segments is not None:
+        def clip(items: List[Dict]) -> List[Dict]:
+            clipped = []
+            for item in items:
+                lo = max(item['start_frame'], first_frame) - first_frame
+                hi = min(item['end_frame'], last_frame - 1) - first_frame
+                if hi > lo:
+                    clipped.append({
+                        **item, 'start_frame': lo, 'end_frame': hi,
+                        'start_time': round(lo / fps, 2), 'end_time': round(hi / fps, 2),
+                    })
+            return clipped
+        sets = clip(segments['sets'])
+        for index, workout_set in enumerate(sets, 1):
+            workout_set['index'] = index
+        segments = {'sets': sets, 'rest_periods': clip(segments['rest_periods'])}
+
+    return {
+        **track,
+        'landmarks': np.asarray(track['landmarks'])[keep],
+        'frame_ids': (frame_ids[keep] - first_frame).tolist(),
+        'interpolated': np.asarray(track['interpolated'])[keep].tolist(),
+        'frame_count': frame_count,
+        'duration': frame_count / fps,
+        'segments': segments,
+        'window': window_info(fps, first_frame, last_frame, source_frames),
+        'processing_info': {**track['processing_info'], 'window_from_stored_track': True},
+    }
+
+
 class VideoProcessor:
-    def __init__(self):
+    def __init__(self, pose_backend: Optional[str] = None, pose_batch_size: Optional[int] = None):
         if not CV_AVAILABLE:
             print("Warning: VideoProcessor initialized without computer vision support")
             self.mp_pose = None
@@ -89,168 +277,348 @@ class VideoProcessor:
             return
             
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        try:
+            self.pose = create_pose_backend(pose_backend, batch_size=pose_batch_size)
+        except Exception as e:
+            print(f"Warning: pose backend '{pose_backend or settings.pose_backend}' unavailable ({e}); using legacy")
+            self.pose = LegacyPoseBackend(model_complexity=settings.pose_model_complexity)
     
     def calculate_angle(self, a, b, c) -> float:
         """Calculates angle between three points"""
         if not CV_AVAILABLE:
             return 180.0
             
-        a = np.array([a.x, a.y])
-        b = np.array([b.x, b.y])
-        c = np.array([c.x, c.y])
+        # Scalar math: called 8 times per frame, where small numpy arrays cost more than the arithmetic
+        ba_x, ba_y = a.x - b.x, a.y - b.y
+        bc_x, bc_y = c.x - b.x, c.y - b.y
 
-        ba = a - b
-        bc = c - b
-
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-        return np.degrees(angle)
+        norm = math.hypot(ba_x, ba_y) * math.hypot(bc_x, bc_y)
+        if norm == 0:
+            return float('nan')
+        cosine_angle = (ba_x * bc_x + ba_y * bc_y) / norm
+        angle = math.acos(min(1.0, max(-1.0, cosine_angle)))
+        return math.degrees(angle)
     
-    def extract_landmarks_features(self, landmarks) -> Dict:
-        """Extracts key angles and coordinates from landmarks"""
+    def extract_landmarks_features(self, landmarks, features: Optional[FrozenSet[str]] = None) -> Dict:
+        """Extracts key angles and coordinates from landmarks; only `features` when given"""
         if not landmarks:
             return {}
-        
-        # Key points
-        left_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
-        left_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_ELBOW]
-        left_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_WRIST]
-        left_hip = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_HIP]
-        left_knee = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_KNEE]
-        left_ankle = landmarks.landmark[self.mp_pose.PoseLandmark.LEFT_ANKLE]
-        
-        right_shoulder = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
-        right_elbow = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_ELBOW]
-        right_wrist = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_WRIST]
-        right_hip = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_HIP]
-        right_knee = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_KNEE]
-        right_ankle = landmarks.landmark[self.mp_pose.PoseLandmark.RIGHT_ANKLE]
-        
-        # Calculate angles
-        features = {
-            # Arm angles
-            'left_elbow_angle': self.calculate_angle(left_shoulder, left_elbow, left_wrist),
-            'right_elbow_angle': self.calculate_angle(right_shoulder, right_elbow, right_wrist),
-            
-            # Leg angles
-            'left_knee_angle': self.calculate_angle(left_hip, left_knee, left_ankle),
-            'right_knee_angle': self.calculate_angle(right_hip, right_knee, right_ankle),
-            
-            # Hip hinge angles (shoulder-hip-knee)
-            'left_hip_angle': self.calculate_angle(left_shoulder, left_hip, left_knee),
-            'right_hip_angle': self.calculate_angle(right_shoulder, right_hip, right_knee),
-            
-            # Shoulder angles
-            'left_shoulder_angle': self.calculate_angle(left_elbow, left_shoulder, left_hip),
-            'right_shoulder_angle': self.calculate_angle(right_elbow, right_shoulder, right_hip),
-            
-            # Key point coordinates
-            'left_wrist_y': left_wrist.y,
-            'right_wrist_y': right_wrist.y,
-            'left_knee_y': left_knee.y,
-            'right_knee_y': right_knee.y,
-            'left_shoulder_y': left_shoulder.y,
-            'right_shoulder_y': right_shoulder.y,
-            'left_hip_y': left_hip.y,
-            'right_hip_y': right_hip.y,
-            
-            # Point visibility
-            'left_elbow_visibility': left_elbow.visibility,
-            'right_elbow_visibility': right_elbow.visibility,
-            'left_knee_visibility': left_knee.visibility,
-            'right_knee_visibility': right_knee.visibility,
-            'left_shoulder_visibility': left_shoulder.visibility,
-            'right_shoulder_visibility': right_shoulder.visibility,
-            'left_hip_visibility': left_hip.visibility,
-            'right_hip_visibility': right_hip.visibility
+        points = landmarks.landmark
+        values = {}
+        for name, kind, source in _feature_plan(features):
+            if kind == 'angle':
+                a, b, c = source
+                values[name] = self.calculate_angle(points[a], points[b], points[c])
+            elif kind == 'y':
+                values[name] = points[source].y
+            else:
+                values[name] = points[source].visibility
+        return values
+    
+    def _append_frame(
+        self,
+        frames_data: List[Dict],
+        frame_id: int,
+        fps: float,
+        landmarks,
+        previous_features: Optional[Dict],
+        interpolated: bool = False,
+        feature_names: Optional[FrozenSet[str]] = None,
+        velocity_names: Optional[FrozenSet[str]] = None,
+    ) -> Optional[Dict]:
+        """Extracts features for one frame, appends it and returns the features"""
+        features = self.extract_landmarks_features(ArrayLandmarks(landmarks), feature_names)
+        if not features:  # Только если получили валидные features
+            return previous_features
+
+        # Add metadata
+        frame_data = {
+            'frame_id': frame_id,
+            'timestamp': frame_id / fps,
+            **features
         }
-        
+        if interpolated:
+            frame_data['interpolated'] = True
+
+        # Calculate velocities if previous frame exists
+        if previous_features:
+            velocities = self.calculate_velocity(features, previous_features, fps, velocity_names)
+            frame_data.update(velocities)
+
+        frames_data.append(frame_data)
         return features
     
-    def calculate_velocity(self, current_features: Dict, previous_features: Dict, fps: float) -> Dict:
-        """Calculates velocity of angle changes"""
+    def calculate_velocity(
+        self, current_features: Dict, previous_features: Dict, fps: float, keys: Optional[FrozenSet[str]] = None
+    ) -> Dict:
+        """Calculates velocity of angle changes (of `keys` only, when given)"""
         velocities = {}
         
         for key in current_features:
+            if keys is not None and key not in keys:
+                continue
             if key in previous_features and isinstance(current_features[key], (int, float)):
                 velocity = (current_features[key] - previous_features[key]) * fps
                 velocities[f"{key}_velocity"] = velocity
         
         return velocities
     
-    async def process_video(self, video_path: str, expected_exercise: Optional[str] = None) -> Optional[Dict]:
+    def extraction_settings(self, sample_fps: Optional[float] = None) -> Dict:
+        """Settings that shape the landmark track; stored tracks are reused only when they match"""
+        pose = self.pose.describe()
+        if settings.roi_enabled:
+            pose['roi'] = {
+                'min_frame_side': settings.roi_min_frame_side,
+                'padding': settings.roi_padding,
+                'max_side': settings.roi_max_side,
+            }
+        if sample_fps:
+            return {**pose, 'sample_fps': sample_fps}
+        return {
+            **pose,
+            'motion_gate_enabled': settings.motion_gate_enabled,
+            'motion_gate_threshold': settings.motion_gate_threshold,
+            'motion_gate_static_stride': settings.motion_gate_static_stride,
+        }
+
+    async def process_video(
+        self,
+        video_path: VideoSource,
+        expected_exercise: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        early_gates: bool = False,
+    ) -> Optional[Dict]:
         """
         Main video processing function with improved error handling
-        Returns movement vectors for AI analysis
+        Returns movement vectors for AI analysis. `video_path` may also be the
+        raw bytes of a small upload, decoded in memory.
         """
         if not CV_AVAILABLE:
             print("Warning: Computer vision processing not available")
             return self._generate_fallback_result()
-            
+
+        sample_fps = settings.hold_sample_fps if is_hold_exercise(expected_exercise) else None
+        track = await self.extract_track(
+            video_path, deadline=deadline, start=start, end=end, sample_fps=sample_fps, early_gates=early_gates
+        )
+        if not track:
+            return None
+        return self.analyze_track(track, expected_exercise=expected_exercise)
+
+    async def extract_track(
+        self,
+        video_path: VideoSource,
+        deadline: Optional[Deadline] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        sample_fps: Optional[float] = None,
+        early_gates: bool = False,
+    ) -> Optional[Dict]:
+        """Decodes the video and runs pose inference.
+
+        Returns the raw track: `landmarks` (N, 33, 4), `frame_ids`, `interpolated`
+        flags, video info, `processing_info` and the motion gate's set segments.
+        Everything derived from it (features, reps, gates) is `analyze_track`.
+        When the deadline runs low, decoding stops and the track covers only
+        the frames read so far (`processing_info['truncated']`).
+
+        With `start`/`end` (seconds), decoding seeks to `start` and stops at
+        `end`; frame ids, `frame_count` and `duration` then describe the
+        window, counted from its first frame (`window` has the offsets).
+        With `sample_fps`, poses are inferred at about that rate and the
+        motion gate is off (static holds, which need no dense sampling).
+        With `early_gates`, decoding stops as soon as the NO_PERSON gate is
+        certain to fail; the track then carries `gate_abort` instead of a
+        usable pose sequence.
+        With ROI_ENABLED, large frames are cropped to the person before
+        inference (`RoiTracker`); landmarks stay in full-frame coordinates.
+        """
+        if not CV_AVAILABLE:
+            return None
+
         try:
-            cap = cv2.VideoCapture(video_path)
+            cap = open_capture(video_path)
             if not cap.isOpened():
-                print(f"Error opening video: {video_path}")
+                print(f"Error opening video: {describe_source(video_path)}")
                 return None
 
             fps = cap.get(cv2.CAP_PROP_FPS) or 30.0  # Fallback FPS
             frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
             duration = frame_count / fps if fps > 0 else 10.0
             
+            window = None
+            if start or end:
+                first_frame = min(int(round((start or 0.0) * fps)), frame_count)
+                last_frame = min(int(round(end * fps)), frame_count) if end else frame_count
+                window = window_info(fps, first_frame, last_frame, frame_count)
+                frame_count = max(last_frame - first_frame, 0)
+                duration = frame_count / fps
+                if first_frame and frame_count:
+                    cap = seek_or_reopen(cap, video_path, first_frame, fps)
+                    if cap is None:
+                        print(f"Video ends before the window start (frame {first_frame})")
+                        return None
+
             # Минимальные требования для обработки
             if frame_count < 5:
                 print(f"Video too short: {frame_count} frames")
                 return None
             
-            all_frames_data = []
-            previous_features = None
+            track_landmarks = []
+            track_frame_ids: List[int] = []
+            track_interpolated: List[bool] = []
             frame_id = 0
-            processed_frames = 0
+            inference_calls = 0
+            sampled_frames = 0
+            motion_gated_frames = 0
+
+            gates = GateAccumulator() if early_gates else None
+
+            def add(fid: int, landmarks, interpolated: bool = False) -> None:
+                track_landmarks.append(landmarks)
+                track_frame_ids.append(fid)
+                track_interpolated.append(interpolated)
+                if gates is not None:
+                    gates.add(landmarks)
             
             print(f"Processing video: {frame_count} frames, {fps:.1f} FPS, {duration:.2f}s")
             
             # Адаптивная обработка - для длинных видео обрабатываем каждый N-й кадр
-            frame_skip = max(1, int(fps / 10)) if fps > 20 else 1  # Максимум 10 FPS обработки
-            
+            frame_skip = sampling_frame_skip(fps, sample_fps)
+            expected_sampled = (frame_count + frame_skip - 1) // frame_skip
+            # Gates measure sparse hold tracks against the sampled frames, others against all frames
+            gate_denominator = expected_sampled if sample_fps else frame_count
+            gate_window_frames = max(settings.gate_early_min_seconds * fps, settings.gate_early_min_fraction * frame_count)
+            gate_abort = None
+
+            # Static stretches (rest, setup) are inferred sparsely and interpolated
+            motion_gate = None
+            if settings.motion_gate_enabled and not sample_fps:
+                motion_gate = MotionGate(
+                    threshold=settings.motion_gate_threshold,
+                    static_stride=settings.motion_gate_static_stride
+                )
+            gated_frame_ids: List[int] = []
+            last_landmarks = None
+            roi = RoiTracker(
+                padding=settings.roi_padding,
+                max_side=settings.roi_max_side,
+                min_frame_side=settings.roi_min_frame_side
+            ) if settings.roi_enabled else None
+            last_landmarks_frame = 0
+
+            def handle(fid: int, gated_before: List[int], landmarks) -> None:
+                """Consumes one inference result in frame order"""
+                nonlocal last_landmarks, last_landmarks_frame
+                if landmarks is None:
+                    last_landmarks = None
+                    return
+                # Fill frames skipped by the motion gate between two inferred poses
+                if last_landmarks is not None:
+                    span = fid - last_landmarks_frame
+                    for gated_id in gated_before:
+                        t = (gated_id - last_landmarks_frame) / span
+                        add(gated_id, last_landmarks + (landmarks - last_landmarks) * t, interpolated=True)
+                add(fid, landmarks)
+                last_landmarks = landmarks
+                last_landmarks_frame = fid
+
+            # Frames selected for inference, run through the backend in batches,
+            # with the crop box (None = whole frame) and the full frame's shape
+            pending: List[Tuple[int, List[int], object, Optional[Tuple[int, int, int, int]], Tuple]] = []
+
+            def flush() -> None:
+                nonlocal inference_calls
+                if not pending:
+                    return
+                results = self.pose.process_batch(
+                    [rgb for _, _, rgb, _, _ in pending],
+                    [int(fid * 1000 / fps) for fid, _, _, _, _ in pending]
+                )
+                inference_calls += len(pending)
+                for (fid, gated_before, _, box, shape), landmarks in zip(pending, results):
+                    if roi is not None:
+                        landmarks = roi.observe(landmarks, box, shape)
+                    handle(fid, gated_before, landmarks)
+                pending.clear()
+
+            # Cleared once a seek had to fall back to decoding forward: probing would repeat that
+            seekable = True
+
+            def check_gates() -> Optional[Dict]:
+                nonlocal inference_calls, cap, seekable
+                resolved = sampled_frames - len(gated_frame_ids)
+                decision = gates.decide(resolved, expected_sampled, gate_denominator, frame_id >= gate_window_frames)
+                if decision is None:
+                    return None
+                if decision['reason'] != 'min_keypoints_per_frame':
+                    # The processed part may be a lead-in: look at the rest before deciding
+                    origin = window['start_frame'] if window else 0
+                    if not seekable:
+                        return None
+                    probed_cap = cap
+                    probes, cap = self._probe_frames(
+                        cap, video_path, fps, origin + frame_id + 1, origin + frame_count, settings.gate_early_probes
+                    )
+                    seekable = cap is probed_cap
+                    inference_calls += len(probes)
+                    if cap is None or not gates.confirm(decision, probes):
+                        return None
+                    decision['probes'] = len(probes)
+                return {
+                    'gate': 'NO_PERSON',
+                    **decision,
+                    'decoded_frames': frame_id + 1,
+                    'source_frames': frame_count,
+                    'stats': gates.stats(resolved),
+                    'source_total_frames': gate_denominator,
+                }
+
+            # Decoding stops while there is still time to analyze and write feedback
+            stop_at = settings.deadline_analysis_reserve_seconds + settings.deadline_ai_min_seconds
+            truncated = None
+
+            self.pose.reset()
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                if deadline is not None and deadline.remaining() <= stop_at:
+                    truncated = {'decoded_frames': frame_id, 'source_frames': frame_count}
+                    break
+                if window and frame_id >= frame_count:
                     break
-                
                 # Пропускаем кадры для ускорения если видео длинное
                 if frame_id % frame_skip != 0:
+                    # Skipped frames are decoded but never converted
+                    if not cap.grab():
+                        break
+                    frame_id += 1
+                    continue
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                sampled_frames += 1
+
+                if motion_gate and not motion_gate.should_infer(frame_id, frame):
+                    gated_frame_ids.append(frame_id)
+                    motion_gated_frames += 1
                     frame_id += 1
                     continue
                 
-                # Convert to RGB for MediaPipe
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = self.pose.process(rgb_frame)
-                
-                if results.pose_landmarks:
-                    # Extract features
-                    features = self.extract_landmarks_features(results.pose_landmarks)
-                    
-                    if features:  # Только если получили валидные features
-                        # Add metadata
-                        frame_data = {
-                            'frame_id': frame_id,
-                            'timestamp': frame_id / fps,
-                            **features
-                        }
-                        
-                        # Calculate velocities if previous frame exists
-                        if previous_features:
-                            velocities = self.calculate_velocity(features, previous_features, fps)
-                            frame_data.update(velocities)
-                        
-                        all_frames_data.append(frame_data)
-                        previous_features = features
-                        processed_frames += 1
+                # Convert to RGB for the pose model (only the crop, when there is one)
+                region, box, reframed = roi.crop(frame) if roi is not None else (frame, None, False)
+                if reframed:
+                    # The model's tracked ROI and smoothing belong to the old framing. Boxes only
+                    # move in flush(), so no frame of the old framing is still pending here
+                    self.pose.reset()
+                pending.append((frame_id, gated_frame_ids, cv2.cvtColor(region, cv2.COLOR_BGR2RGB), box, frame.shape))
+                gated_frame_ids = []
+                if len(pending) >= self.pose.batch_size:
+                    flush()
+                    if gates is not None:
+                        gate_abort = check_gates()
+                        if gate_abort or cap is None:
+                            break
                 
                 frame_id += 1
                 
@@ -258,7 +626,111 @@ class VideoProcessor:
                 if frame_id % 30 == 0:
                     await asyncio.sleep(0.01)
             
-            cap.release()
+            if cap is not None:
+                cap.release()
+            flush()
+
+            # Trailing static stretch: the pose held still since the last inference
+            if last_landmarks is not None:
+                for gated_id in gated_frame_ids:
+                    add(gated_id, last_landmarks, interpolated=True)
+
+            processing_info = {
+                'pose_backend': self.pose.name,
+                'frame_skip': frame_skip,
+                'sampled_frames': sampled_frames,
+                'inference_calls': inference_calls,
+                'motion_gated_frames': motion_gated_frames
+            }
+            if sample_fps:
+                processing_info['sample_fps'] = sample_fps
+            if roi is not None and roi.summary():
+                processing_info['roi'] = roi.summary()
+            if gate_abort:
+                processing_info['gate_abort'] = {
+                    key: gate_abort[key] for key in ('reason', 'decoded_frames', 'source_frames')
+                }
+                print(f"Gates: {gate_abort['gate']} certain at frame {gate_abort['decoded_frames']} "
+                      f"of {frame_count} ({gate_abort['reason']})")
+            if truncated:
+                # The result describes the decoded prefix, so coverage ratios stay meaningful
+                frame_count = max(frame_id, 1)
+                duration = frame_count / fps
+                processing_info['truncated'] = truncated
+                deadline.truncate('decode', **truncated)
+                print(f"Deadline: decoding stopped at frame {frame_id} of {truncated['source_frames']}")
+
+            track = {
+                'landmarks': np.array(track_landmarks, dtype=np.float32).reshape(-1, 33, 4),
+                'frame_ids': track_frame_ids,
+                'interpolated': track_interpolated,
+                'fps': fps,
+                'frame_count': frame_count,
+                'duration': duration,
+                'extraction': self.extraction_settings(sample_fps),
+                'processing_info': processing_info,
+                'segments': motion_gate.segment_sets(fps, settings.rest_min_seconds) if motion_gate else None,
+                'window': window,
+            }
+            if gate_abort:
+                track['gate_abort'] = gate_abort
+            return track
+            
+        except Exception as e:
+            print(f"Error processing video: {str(e)}")
+            return None
+
+    def _probe_frames(self, cap, source: VideoSource, fps: float, first: int, last: int,
+                      count: int) -> Tuple[List, Any]:
+        """Pose results of `count` frames spread over [first, last) (absolute
+        frame numbers) and the capture to continue with, positioned at `first`
+        (reopened if seeking back failed; None if it cannot get there). Probing
+        stops at the first seek that does not land on its frame."""
+        results = []
+        if last > first and count > 0:
+            self.pose.reset()
+            for target in sorted({first + int((i + 0.5) * (last - first) / count) for i in range(count)}):
+                if not seek_frame(cap, target, fps):
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                results.extend(self.pose.process_batch(
+                    [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)], [int(target * 1000 / fps)]
+                ))
+            cap = seek_or_reopen(cap, source, first, fps)
+        self.pose.reset()
+        return results, cap
+
+    def analyze_track(
+        self,
+        track: Dict,
+        expected_exercise: Optional[str] = None,
+        params: Optional[Dict[str, float]] = None,
+    ) -> Optional[Dict]:
+        """Features, exercise type, reps and sets from a landmark track (fresh or stored)"""
+        if track.get('gate_abort'):
+            # Extraction stopped once the gate outcome was certain; _apply_gates reports it
+            return {
+                'gate_abort': track['gate_abort'],
+                'fps': track['fps'],
+                'source_total_frames': track['frame_count'],
+                'processing_info': dict(track['processing_info']),
+            }
+        try:
+            fps = track['fps']
+            frame_count = track['frame_count']
+            hold = is_hold_exercise(expected_exercise)
+            # A known exercise computes only what its analysis reads; unknown ones get every feature
+            feature_names, velocity_names = required_features(expected_exercise, detect=not hold)
+            all_frames_data = []
+            previous_features = None
+            for landmarks, fid, interpolated in zip(track['landmarks'], track['frame_ids'], track['interpolated']):
+                previous_features = self._append_frame(
+                    all_frames_data, int(fid), fps, landmarks, previous_features, interpolated=bool(interpolated),
+                    feature_names=feature_names, velocity_names=velocity_names,
+                )
+            processed_frames = len(all_frames_data)
             
             # Проверяем результат обработки
             if not all_frames_data:
@@ -269,23 +741,45 @@ class VideoProcessor:
                 print(f"Insufficient pose data: {processed_frames} frames")
                 return None
             
-            # Analyze data for rep counting
-            analysis_result = self.analyze_movement_patterns(all_frames_data, expected_exercise=expected_exercise)
+            if hold:
+                analysis_result = self.analyze_hold(track, all_frames_data, expected_exercise)
+            else:
+                # Analyze data for rep counting
+                analysis_result = self.analyze_movement_patterns(
+                    all_frames_data, expected_exercise=expected_exercise, params=params
+                )
             
             result = {
                 'total_frames': len(all_frames_data),
-                'duration': duration,
+                'duration': track['duration'],
                 'fps': fps,
                 'frames_data': all_frames_data,
                 'movement_analysis': analysis_result,
                 'rep_count': analysis_result.get('estimated_reps', 0),
                 'source_total_frames': frame_count,
+                'window': track.get('window'),
                 'processing_info': {
-                    'frame_skip': frame_skip,
+                    **track['processing_info'],
                     'processed_frames': processed_frames,
-                    'processing_ratio': round(processed_frames / frame_count, 3)
+                    'processing_ratio': round(processed_frames / frame_count, 3),
+                    'feature_set': expected_exercise if feature_names is not None else 'full',
                 }
             }
+
+            segments = track.get('segments')
+            if segments is not None and not hold:
+                exercise_type = analysis_result.get('exercise_type', 'unknown')
+                sets = [dict(workout_set) for workout_set in segments['sets']]
+                for workout_set in sets:
+                    set_frames = [
+                        f for f in all_frames_data
+                        if workout_set['start_frame'] <= f['frame_id'] <= workout_set['end_frame']
+                    ]
+                    workout_set['rep_count'] = (
+                        self.count_reps(set_frames, exercise_type, params=params) if len(set_frames) >= 3 else 0
+                    )
+                result['sets'] = sets
+                result['rest_periods'] = segments['rest_periods']
             
             return result
             
@@ -318,12 +812,20 @@ class VideoProcessor:
             }
         }
     
-    def analyze_movement_patterns(self, frames_data: List[Dict], expected_exercise: Optional[str] = None) -> Dict:
+    def analyze_movement_patterns(
+        self,
+        frames_data: List[Dict],
+        expected_exercise: Optional[str] = None,
+        params: Optional[Dict[str, float]] = None,
+    ) -> Dict:
         """Analyzes movement patterns to determine exercise type and rep count.
         Uses per-exercise state machines with smoothing and hysteresis.
+        `params` overrides entries of ANALYSIS_DEFAULTS.
         """
         if not frames_data:
             return {}
+        p = analysis_params(params)
+        window = int(p['smooth_window'])
 
         # Extract time series of angles and coordinates
         left_elbow_angles = [frame.get('left_elbow_angle', 0.0) for frame in frames_data]
@@ -342,21 +844,10 @@ class VideoProcessor:
         knee_angles = [(l + r) / 2.0 for l, r in zip(left_knee_angles, right_knee_angles)]
         hip_angles = [(l + r) / 2.0 for l, r in zip(left_hip_angles, right_hip_angles)]
 
-        def smooth(series: List[float], window: int = 7) -> List[float]:
-            if len(series) < 3:
-                return series
-            w = max(3, window if window % 2 == 1 else window + 1)
-            pad = w // 2
-            arr = np.array(series, dtype=float)
-            arr = np.pad(arr, (pad, pad), mode='edge')
-            kernel = np.ones(w) / w
-            sm = np.convolve(arr, kernel, mode='same')[pad:-pad]
-            return sm.tolist()
-
-        wrist_y_s = smooth(wrist_y, 7)
-        shoulder_y_s = smooth(shoulder_y, 7)
-        knee_angles_s = smooth(knee_angles, 7)
-        hip_angles_s = smooth(hip_angles, 7)
+        wrist_y_s = _smooth(wrist_y, window)
+        shoulder_y_s = _smooth(shoulder_y, window)
+        knee_angles_s = _smooth(knee_angles, window)
+        hip_angles_s = _smooth(hip_angles, window)
 
         # Ranges
         elbow_range = (max(left_elbow_angles + right_elbow_angles) - min(left_elbow_angles + right_elbow_angles))
@@ -367,13 +858,15 @@ class VideoProcessor:
 
         # Determine exercise type (do not override with expected_exercise)
         exercise_type = "unknown"
-        if (max(wrist_y_range, shoulder_y_range) > 0.06 and elbow_range > 35 and knee_range < 25):
+        motion = max(wrist_y_range, shoulder_y_range)
+        if motion > p['pullup_motion_min'] and elbow_range > p['pullup_elbow_min'] and knee_range < p['pullup_knee_max']:
             exercise_type = "pullup"
-        elif knee_range > 55 and max(wrist_y_range, shoulder_y_range) > 0.04:
+        elif knee_range > p['squat_knee_min'] and motion > p['squat_motion_min']:
             exercise_type = "squat"
-        elif 25 <= knee_range <= 55 and hip_range > 20 and max(wrist_y_range, shoulder_y_range) <= 0.05:
+        elif (p['deadlift_knee_min'] <= knee_range <= p['deadlift_knee_max'] and hip_range > p['deadlift_hip_min']
+              and motion <= p['deadlift_motion_max']):
             exercise_type = "deadlift"
-        elif elbow_range > 45 and max(wrist_y_range, shoulder_y_range) <= 0.03 and knee_range < 25:
+        elif elbow_range > p['pushup_elbow_min'] and motion <= p['pushup_motion_max'] and knee_range < p['pushup_knee_max']:
             exercise_type = "pushup"
         else:
             if elbow_range > 60 and knee_range < 30:
@@ -399,55 +892,23 @@ class VideoProcessor:
         elif exercise_type == 'pushup':
             confidence = 0.4 + 0.3*_norm(elbow_range, 40, 90) + 0.3*_norm(max(wrist_y_range, shoulder_y_range), 0.0, 0.03)
 
-        # Rep counting with hysteresis
-        def count_reps_pullup(y_series: List[float]) -> int:
-            y_min, y_max = min(y_series), max(y_series)
-            amp = y_max - y_min
-            if amp < 0.03:
-                return 0
-            low = y_min + 0.25 * amp
-            high = y_min + 0.75 * amp
-            state = 'down'
-            reps = 0
-            for y in y_series:
-                if state == 'down' and y <= low:
-                    state = 'up'
-                elif state == 'up' and y >= high:
-                    reps += 1
-                    state = 'down'
-            return reps
-
-        def count_reps_angle(angles: List[float], flex_thresh: float, extend_thresh: float, min_amp: float = 20.0) -> int:
-            a_min, a_max = min(angles), max(angles)
-            if a_max - a_min < min_amp:
-                return 0
-            state = 'extended'
-            reps = 0
-            for a in angles:
-                if state == 'extended' and a <= flex_thresh:
-                    state = 'flexed'
-                elif state == 'flexed' and a >= extend_thresh:
-                    reps += 1
-                    state = 'extended'
-            return reps
-
-        estimated_reps = 0
-        if exercise_type == 'pullup':
-            estimated_reps = count_reps_pullup(shoulder_y_s)
-        elif exercise_type == 'squat':
-            p30, p70 = np.percentile(knee_angles_s, [30, 70])
-            estimated_reps = count_reps_angle(knee_angles_s, p30, p70, min_amp=30.0)
-        elif exercise_type == 'deadlift':
-            p35, p75 = np.percentile(hip_angles_s, [35, 75])
-            estimated_reps = count_reps_angle(hip_angles_s, p35, p75, min_amp=20.0)
-        elif exercise_type == 'pushup':
-            elbows = smooth([(l + r) / 2.0 for l, r in zip(left_elbow_angles, right_elbow_angles)], 7)
-            p35, p75 = np.percentile(elbows, [35, 75])
-            estimated_reps = count_reps_angle(elbows, p35, p75, min_amp=25.0)
-        else:
-            estimated_reps = max(0, int(max(elbow_range, knee_range, hip_range) / 25))
+        classifier_info = None
+        rep_segments = []
+        if settings.dtw_classifier_enabled:
+            match = get_classifier().classify(frames_data)
+            if match:
+                rep_segments = match.pop('rep_segments')
+                classifier_info = dict(match, threshold_label=exercise_type)
+                # Templates replace vague labels outright and only override a named
+                # label when they are both confident and more confident than the thresholds
+                vague = exercise_type not in ('pullup', 'squat', 'deadlift', 'pushup')
+                if match['confidence'] >= settings.dtw_min_confidence and (vague or match['confidence'] > confidence):
+                    exercise_type = match['label']
+                    confidence = match['confidence']
 
-        return {
+        estimated_reps = self.count_reps(frames_data, exercise_type, params=p)
+
+        result = {
             'exercise_type': exercise_type,
             'elbow_range': elbow_range,
             'knee_range': knee_range,
@@ -460,3 +921,145 @@ class VideoProcessor:
             'avg_right_knee_angle': float(np.mean(right_knee_angles)),
             'confidence': float(max(0.0, min(confidence, 1.0)))
         }
+        if classifier_info is not None:
+            result['classifier'] = classifier_info
+            result['rep_segments'] = rep_segments
+        return result
+
+    def analyze_hold(self, track: Dict, frames_data: List[Dict], exercise: str) -> Dict:
+        """Hold time, body-line alignment and drift of an isometric exercise.
+
+        The body line is the shoulder-hip-ankle angle (180 = straight). A sample
+        is in position when the shoulder-ankle line is near horizontal and the
+        line is not broken; consecutive in-position samples form a hold.
+        """
+        fps = track['fps']
+        landmarks = np.asarray(track['landmarks'], dtype=np.float64).reshape(-1, 33, 4)
+        times = np.asarray(track['frame_ids'], dtype=np.float64) / fps
+
+        def midpoint(left: int, right: int):
+            return (landmarks[:, left, :2] + landmarks[:, right, :2]) / 2.0
+
+        shoulder, hip, ankle = midpoint(11, 12), midpoint(23, 24), midpoint(27, 28)
+        visibility = landmarks[:, [11, 12, 23, 24, 27, 28], 3].mean(axis=1)
+        to_shoulder, to_ankle = shoulder - hip, ankle - hip
+        cosine = (to_shoulder * to_ankle).sum(axis=1) / (
+            np.linalg.norm(to_shoulder, axis=1) * np.linalg.norm(to_ankle, axis=1) + 1e-9
+        )
+        body_line = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+        body = ankle - shoulder
+        incline = np.degrees(np.arctan2(np.abs(body[:, 1]), np.abs(body[:, 0]) + 1e-9))
+        # Hip distance from the shoulder-ankle line per body length; image y points down, so + is sag
+        cross = body[:, 0] * (hip[:, 1] - shoulder[:, 1]) - body[:, 1] * (hip[:, 0] - shoulder[:, 0])
+        hip_offset = np.sign(body[:, 0]) * cross / (np.einsum('ij,ij->i', body, body) + 1e-9)
+
+        in_position = (
+            (visibility >= 0.5)
+            & (incline <= settings.hold_incline_max_degrees)
+            & (body_line >= settings.hold_body_line_min_degrees)
+        )
+        step = float(np.median(np.diff(times))) if len(times) > 1 else 1.0 / fps
+
+        holds = []
+        run_start = run_end = None
+        for t in times[in_position]:
+            if run_end is not None and t - run_end > max(settings.hold_gap_seconds, 1.5 * step):
+                holds.append((run_start, run_end))
+                run_start = None
+            if run_start is None:
+                run_start = t
+            run_end = t
+        if run_start is not None:
+            holds.append((run_start, run_end))
+        holds = [
+            {'start_time': round(a, 2), 'end_time': round(b + step, 2), 'duration': round(b - a + step, 2)}
+            for a, b in holds
+        ]
+        longest = max(holds, key=lambda h: h['duration']) if holds else None
+
+        hold = {
+            'hold_seconds': longest['duration'] if longest else 0.0,
+            'time_under_tension_seconds': round(sum(h['duration'] for h in holds), 2),
+            'holds': holds,
+            'samples': int(len(times)),
+            'samples_in_position': int(in_position.sum()),
+        }
+        if longest:
+            aligned = in_position & (times >= longest['start_time']) & (times < longest['end_time'])
+            line, offset, t = body_line[aligned], hip_offset[aligned], times[aligned]
+            hold['body_line'] = {
+                'mean_degrees': round(float(line.mean()), 1),
+                'min_degrees': round(float(line.min()), 1),
+                'std_degrees': round(float(line.std()), 1),
+                'aligned_ratio': round(float((line >= settings.hold_body_line_good_degrees).mean()), 3),
+                'hip_offset_mean': round(float(offset.mean()), 3),
+                'sag_ratio': round(float((offset > settings.hold_hip_offset_max).mean()), 3),
+                'pike_ratio': round(float((offset < -settings.hold_hip_offset_max).mean()), 3),
+            }
+            # Per-minute trends over the longest hold: form fading shows as a falling line / rising sag
+            if len(t) >= 3 and t[-1] > t[0]:
+                third = max(1, len(t) // 3)
+                hold['drift'] = {
+                    'body_line_degrees_per_minute': round(float(np.polyfit(t, line, 1)[0] * 60), 2),
+                    'hip_offset_per_minute': round(float(np.polyfit(t, offset, 1)[0] * 60), 4),
+                    'body_line_start_degrees': round(float(line[:third].mean()), 1),
+                    'body_line_end_degrees': round(float(line[-third:].mean()), 1),
+                }
+
+        def series(key: str) -> List[float]:
+            return [frame.get(key, 0.0) for frame in frames_data]
+
+        elbow_angles = series('left_elbow_angle') + series('right_elbow_angle')
+        knee_angles = series('left_knee_angle') + series('right_knee_angle')
+        visible = int((visibility >= 0.5).sum())
+        return {
+            'exercise_type': exercise if longest else 'unknown',
+            'mode': 'hold',
+            'estimated_reps': 0,
+            'confidence': round(float(in_position.sum() / visible), 3) if visible else 0.0,
+            'elbow_range': float(max(elbow_angles) - min(elbow_angles)) if elbow_angles else 0.0,
+            'knee_range': float(max(knee_angles) - min(knee_angles)) if knee_angles else 0.0,
+            'avg_left_elbow_angle': float(np.mean(series('left_elbow_angle'))),
+            'avg_right_elbow_angle': float(np.mean(series('right_elbow_angle'))),
+            'avg_left_knee_angle': float(np.mean(series('left_knee_angle'))),
+            'avg_right_knee_angle': float(np.mean(series('right_knee_angle'))),
+            'hold': hold,
+        }
+
+    def count_reps(self, frames_data: List[Dict], exercise_type: str, params: Optional[Dict[str, float]] = None) -> int:
+        """Counts repetitions of a known exercise type using hysteresis state machines"""
+        if not frames_data:
+            return 0
+        p = analysis_params(params)
+        window = int(p['smooth_window'])
+
+        def series(key: str) -> List[float]:
+            return [frame.get(key, 0.0) for frame in frames_data]
+
+        def mean_series(left: str, right: str) -> List[float]:
+            return [(l + r) / 2.0 for l, r in zip(series(left), series(right))]
+
+        if exercise_type == 'pullup':
+            return _count_reps_pullup(
+                _smooth(mean_series('left_shoulder_y', 'right_shoulder_y'), window),
+                p['pullup_rep_low'], p['pullup_rep_high'], p['pullup_rep_min_amp']
+            )
+        angle_series = {
+            'squat': ('left_knee_angle', 'right_knee_angle'),
+            'deadlift': ('left_hip_angle', 'right_hip_angle'),
+            'pushup': ('left_elbow_angle', 'right_elbow_angle'),
+        }
+        if exercise_type in angle_series:
+            angles = _smooth(mean_series(*angle_series[exercise_type]), window)
+            flex, extend = np.percentile(
+                angles, [p[f'{exercise_type}_rep_flex_pct'], p[f'{exercise_type}_rep_extend_pct']]
+            )
+            return _count_reps_angle(angles, flex, extend, min_amp=p[f'{exercise_type}_rep_min_amp'])
+
+        elbow_angles = series('left_elbow_angle') + series('right_elbow_angle')
+        knee_angles_s = _smooth(mean_series('left_knee_angle', 'right_knee_angle'), window)
+        hip_angles_s = _smooth(mean_series('left_hip_angle', 'right_hip_angle'), window)
+        elbow_range = max(elbow_angles) - min(elbow_angles)
+        knee_range = max(knee_angles_s) - min(knee_angles_s)
+        hip_range = max(hip_angles_s) - min(hip_angles_s)
+        return max(0, int(max(elbow_range, knee_range, hip_range) / 25))
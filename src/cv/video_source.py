@@ -0,0 +1,233 @@
+"""
+Video sources: in-memory decoding for small uploads, spooling for larger ones
+"""
+import io
+import os
+import shutil
+import tempfile
+from typing import Optional, Union
+
+try:
+    import cv2
+    CV_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    CV_AVAILABLE = False
+
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    av = None
+    AV_AVAILABLE = False
+
+from src.backend.core.config import settings
+
+# Every temp file the service creates starts with this, so the janitor never
+# touches anything else in a shared temp directory
+TEMP_PREFIX = "fitpose_"
+
+SHM_DIR = "/dev/shm"
+
+# A seek that lands further than this from its target frame counts as failed
+SEEK_TOLERANCE_FRAMES = 1
+
+VideoSource = Union[str, bytes]
+
+
+class MemoryVideoCapture:
+    """Decodes a video held in memory with PyAV behind the subset of the
+    cv2.VideoCapture interface that VideoProcessor and the probes use"""
+
+    def __init__(self, data: bytes):
+        self._container = None
+        self._stream = None
+        self._frames = None
+        self._pending = None
+        self._position = 0
+        self.fps = 0.0
+        self.frame_count = 0
+        self.width = 0
+        self.height = 0
+        try:
+            self._container = av.open(io.BytesIO(data), mode='r')
+            stream = self._stream = self._container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            if settings.decode_threads > 0:
+                stream.thread_count = settings.decode_threads
+            self.fps = float(stream.average_rate or stream.guessed_rate or 0.0)
+            self.width = stream.codec_context.width
+            self.height = stream.codec_context.height
+            self.frame_count = int(stream.frames or 0)
+            if not self.frame_count and stream.duration and stream.time_base and self.fps:
+                self.frame_count = int(round(float(stream.duration * stream.time_base) * self.fps))
+            self._frames = self._container.decode(stream)
+        except Exception as e:
+            print(f"Warning: in-memory decode failed to open video: {e}")
+            self.release()
+
+    def isOpened(self) -> bool:
+        return self._container is not None
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        """Seeks with CAP_PROP_POS_MSEC: to the keyframe before, then decodes up to the target"""
+        if prop != cv2.CAP_PROP_POS_MSEC or self._container is None:
+            return False
+        stream = self._stream
+        # Frame times count from the stream's first timestamp, which need not be 0
+        origin = float(stream.start_time * stream.time_base) if stream.start_time and stream.time_base else 0.0
+        target = origin + value / 1000.0
+        try:
+            if stream.time_base:
+                self._container.seek(int(target / stream.time_base), stream=stream, backward=True)
+            self._frames = self._container.decode(stream)
+            self._pending = None
+            half_frame = 0.5 / self.fps if self.fps else 0.0
+            self._position = self.frame_count
+            for frame in self._frames:
+                if frame.time is None or frame.time >= target - half_frame:
+                    self._pending = frame
+                    seconds = value / 1000.0 if frame.time is None else frame.time - origin
+                    self._position = int(round(seconds * self.fps))
+                    break
+        except Exception as e:
+            print(f"Warning: in-memory seek failed: {e}")
+            return False
+        return True
+
+    def read(self):
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+            self._position += 1
+            return True, frame.to_ndarray(format='bgr24')
+        if self._frames is None:
+            return False, None
+        try:
+            frame = next(self._frames)
+        except StopIteration:
+            return False, None
+        except Exception as e:
+            # Corrupt packet mid-stream: treat it as the end, like cv2 does
+            print(f"Warning: in-memory decode stopped: {e}")
+            return False, None
+        self._position += 1
+        return True, frame.to_ndarray(format='bgr24')
+
+    def grab(self) -> bool:
+        """Decodes the next frame without converting it (for skipped frames)"""
+        if self._pending is not None:
+            self._pending = None
+            self._position += 1
+            return True
+        if self._frames is None:
+            return False
+        try:
+            next(self._frames)
+        except Exception:
+            return False
+        self._position += 1
+        return True
+
+    def release(self) -> None:
+        if self._container is not None:
+            self._container.close()
+        self._container = None
+        self._frames = None
+        self._pending = None
+
+
+def open_capture(source: VideoSource):
+    """cv2.VideoCapture for a path, MemoryVideoCapture for raw bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return MemoryVideoCapture(bytes(source))
+    if settings.decode_threads > 0:
+        return cv2.VideoCapture(source, cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, settings.decode_threads])
+    return cv2.VideoCapture(source)
+
+
+def seek_frame(cap, frame: int, fps: float) -> bool:
+    """Seeks so the next read returns `frame`; False unless the capture
+    reports landing there (some containers and codecs seek to the wrong place)"""
+    if not cap.set(cv2.CAP_PROP_POS_MSEC, frame * 1000.0 / fps):
+        return False
+    return abs(cap.get(cv2.CAP_PROP_POS_FRAMES) - frame) <= SEEK_TOLERANCE_FRAMES
+
+
+def seek_or_reopen(cap, source: VideoSource, frame: int, fps: float):
+    """The capture positioned at `frame`: seeked when that works, else
+    reopened and decoded forward. None when the video ends before `frame`."""
+    if seek_frame(cap, frame, fps):
+        return cap
+    print(f"Warning: seek to frame {frame} failed; decoding forward from the start")
+    cap.release()
+    cap = open_capture(source)
+    if not cap.isOpened():
+        return None
+    for _ in range(frame):
+        if not cap.grab():
+            cap.release()
+            return None
+    return cap
+
+
+def describe_source(source: VideoSource) -> str:
+    """Short label for log lines (never the raw bytes)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<in-memory video, {len(source)} bytes>"
+    return str(source)
+
+
+def can_decode_in_memory(size_bytes: int) -> bool:
+    return AV_AVAILABLE and CV_AVAILABLE and size_bytes <= settings.in_memory_decode_max_mb * 1024 * 1024
+
+
+def spool_dir(size_bytes: int) -> str:
+    """Memory-backed /dev/shm when it has room to spare, else the configured temp dir"""
+    if settings.spool_dir:
+        return settings.spool_dir
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        free = shutil.disk_usage(SHM_DIR).free
+        if free - size_bytes > settings.spool_shm_reserve_mb * 1024 * 1024:
+            return SHM_DIR
+    return settings.temp_dir
+
+
+def spool_sparse(head: bytes, tail: bytes, tail_offset: int, suffix: str = '.mp4') -> str:
+    """Temp file with `head` at 0 and `tail` at `tail_offset`; the gap stays a hole.
+
+    Enough for a decoder to read the header at the end of a file and the first
+    frames at its start without the middle being uploaded.
+    """
+    if tail_offset < 0:
+        raise ValueError(f"tail_offset must not be negative: {tail_offset}")
+    directory = settings.temp_dir
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=suffix, dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(head)
+        f.seek(tail_offset)
+        f.write(tail)
+    return path
+
+
+def spool_video(content: bytes, suffix: str = '.mp4', directory: Optional[str] = None) -> str:
+    """Writes an upload to a prefixed temp file and returns its path"""
+    directory = directory or spool_dir(len(content))
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=suffix, dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    return path
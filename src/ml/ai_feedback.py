@@ -1,168 +1,212 @@
 import os
 import json
-import requests
-import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 from src.backend.core.config import settings
+from src.backend.core.deadline import Deadline
+from src.ml.llm_router import llm_router
+from src.ml.stream_parser import IncrementalJSONParser
+from src.ml.prompt_compiler import prompt_compiler
+from src.ml.rule_feedback import RuleFeedbackEngine
 
 load_dotenv()
 
+# How each feedback was produced, process-wide
+feedback_source_counts: Dict[str, int] = {
+    'rules': 0,
+    'llm': 0,
+    'rules_after_llm_error': 0,
+    'fallback': 0,
+    'llm_skipped_deadline': 0,
+}
+
+TECHNIQUE_FIELDS = ('form_quality', 'symmetry', 'range_of_motion', 'tempo')
+FEEDBACK_LISTS = ('positive', 'improvements', 'specific_tips')
+REP_COUNT_ACCURACY = ('accurate', 'approximate', 'inaccurate')
+
+
+def _is_text(value: Any) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def valid_field(path: List[Any], value: Any) -> bool:
+    """Whether a scalar at `path` of an LLM answer fits the feedback schema.
+
+    The single rule set for streamed `field` events and for the final
+    parse_ai_response, so a field that was streamed is never replaced later.
+    """
+    if path == ['overall_score']:
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and 1 <= value <= 10
+    if path == ['exercise_detected']:
+        return _is_text(value)
+    if path == ['rep_count_accuracy']:
+        return value in REP_COUNT_ACCURACY
+    if len(path) == 2 and path[0] == 'technique_analysis' and path[1] in TECHNIQUE_FIELDS:
+        return _is_text(value)
+    if len(path) == 3 and path[0] == 'feedback' and path[1] in FEEDBACK_LISTS and isinstance(path[2], int):
+        return _is_text(value)
+    if len(path) == 2 and path[0] == 'safety_concerns' and isinstance(path[1], int):
+        return _is_text(value)
+    return False
+
+
+class FieldValidator:
+    """Filters (path, value) events of a streamed answer down to the fields
+    parse_ai_response will keep, renumbering list items as invalid ones are dropped"""
+
+    def __init__(self):
+        self._list_lengths: Dict[tuple, int] = {}
+        self._seen: set = set()
+
+    def accept(self, path: List[Any], value: Any) -> Optional[List[Any]]:
+        """Path to emit the value under, None when it is dropped"""
+        if not valid_field(path, value):
+            return None
+        if isinstance(path[-1], int):
+            parent = tuple(path[:-1])
+            path = list(parent) + [self._list_lengths.get(parent, 0)]
+            self._list_lengths[parent] = path[-1] + 1
+        elif tuple(path) in self._seen:
+            # A repeated key: the final parse keeps the last one, which may differ
+            return None
+        self._seen.add(tuple(path))
+        return path
+
+
+def lookup(document: Any, path: List[Any]) -> Any:
+    for key in path:
+        try:
+            document = document[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return document
+
+
 class AIFeedbackService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.api_base = settings.openai_api_base
         self.api_url = f"{self.api_base}/chat/completions"
         self.model = settings.openai_model
+        self.rule_engine = RuleFeedbackEngine()
         
-        if not self.api_key:
+        if not llm_router.providers:
             print("Warning: OPENAI_API_KEY not found in environment variables")
     
-    async def analyze_exercise(self, vectors_data: Dict) -> Dict[str, Any]:
+    def use_rules(self, vectors_data: Dict) -> bool:
+        """Applies FEEDBACK_POLICY: rules, llm, or rules_first (rules when confident, else LLM)"""
+        policy = settings.feedback_policy
+        if policy == 'rules':
+            return self.rule_engine.supports(vectors_data)
+        if policy == 'rules_first':
+            return self.rule_engine.is_confident(vectors_data)
+        return False
+    
+    def fallback_feedback(self, vectors_data: Dict, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Rules when they are confident about the video (RuleFeedbackEngine.is_confident), generic fallback otherwise"""
+        if deadline is not None and deadline.remaining() < settings.deadline_ai_min_seconds:
+            # The LLM failed because the request ran out of time
+            deadline.truncate('ai_feedback', reason='LLM did not answer within the request deadline')
+        if self.rule_engine.is_confident(vectors_data):
+            feedback_source_counts['rules_after_llm_error'] += 1
+            return self.rule_engine.evaluate(vectors_data)
+        feedback_source_counts['fallback'] += 1
+        return self.get_fallback_response(vectors_data)
+    
+    def llm_timeout(self, deadline: Optional[Deadline]) -> Optional[float]:
+        """LLM time limit within the request deadline; None when too little is left to try"""
+        if deadline is None:
+            return settings.ai_timeout_seconds
+        remaining = deadline.remaining()
+        if remaining < settings.deadline_ai_min_seconds:
+            return None
+        return min(settings.ai_timeout_seconds, remaining)
+    
+    def skip_llm(self, vectors_data: Dict, deadline: Deadline) -> Dict[str, Any]:
+        """Feedback without the LLM once the request deadline is too close"""
+        feedback_source_counts['llm_skipped_deadline'] += 1
+        deadline.truncate('ai_feedback', reason='no time left for the LLM',
+                          remaining_ms=max(0, int(deadline.remaining() * 1000)))
+        if self.rule_engine.is_confident(vectors_data):
+            return self.rule_engine.evaluate(vectors_data)
+        return self.get_fallback_response(vectors_data)
+    
+    async def analyze_exercise(self, vectors_data: Dict, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
-        Sends motion vectors to OpenAI API for analysis
+        Sends motion vectors to OpenAI API for analysis, within what is left of `deadline`
         """
+        if self.use_rules(vectors_data):
+            feedback_source_counts['rules'] += 1
+            return self.rule_engine.evaluate(vectors_data)
+        
+        timeout = self.llm_timeout(deadline)
+        if timeout is None:
+            return self.skip_llm(vectors_data, deadline)
+        
         try:
-            # Prepare data for analysis
-            analysis_prompt = self.prepare_analysis_prompt(vectors_data)
+            # Compile compact prompt within the token budget
+            request = prompt_compiler.compile(vectors_data)
             
             # Send request to OpenAI
-            response = await self.call_openai_api(analysis_prompt)
+            response = await self.call_openai_api(request, timeout=timeout)
             
             # Parse response
             feedback = self.parse_ai_response(response)
+            feedback_source_counts['llm'] += 1
             
             return feedback
             
         except Exception as e:
             print(f"Error in AI analysis: {str(e)}")
-            return self.get_fallback_response(vectors_data)
+            return self.fallback_feedback(vectors_data, deadline)
     
-    def prepare_analysis_prompt(self, vectors_data: Dict) -> str:
-        """Prepares prompt for movement analysis with quality context"""
-        
-        movement_analysis = vectors_data.get('movement_analysis', {})
-        exercise_type = movement_analysis.get('exercise_type', 'unknown')
-        rep_count = vectors_data.get('rep_count', 0)
-        duration = vectors_data.get('duration', 0)
-        
-        # Average angles
-        avg_elbow_left = movement_analysis.get('avg_left_elbow_angle', 0)
-        avg_elbow_right = movement_analysis.get('avg_right_elbow_angle', 0)
-        avg_knee_left = movement_analysis.get('avg_left_knee_angle', 0)
-        avg_knee_right = movement_analysis.get('avg_right_knee_angle', 0)
-        
-        # Range of motion
-        elbow_range = movement_analysis.get('elbow_range', 0)
-        knee_range = movement_analysis.get('knee_range', 0)
-        
-        # Quality information
-        validation = vectors_data.get('validation', {})
-        quality_score = validation.get('quality_score', 1.0)
-        quality_warnings = validation.get('quality_warnings', [])
-        diagnostics = vectors_data.get('diagnostics', {})
-        
-        # Quality context for AI
-        quality_context = ""
-        if quality_score < 0.8 or quality_warnings:
-            quality_context = f"""
-VIDEO QUALITY CONTEXT:
-- Quality score: {quality_score:.2f}/1.0 {'(Limited quality)' if quality_score < 0.8 else '(Good quality)'}
-- Quality warnings: {', '.join(quality_warnings) if quality_warnings else 'None'}
-- Pose detection: {diagnostics.get('avg_visibility', 0):.2f} average visibility
-- Motion score: {diagnostics.get('motion_score', 0):.2f}
-
-IMPORTANT: Due to video quality limitations, focus on general advice rather than detailed biomechanical analysis. 
-Be more encouraging and provide foundational tips rather than precise technical corrections.
-"""
-        
-        prompt = f"""
-You are a professional fitness trainer and biomechanics expert. Analyze the user's movement data and provide detailed feedback.
-
-EXERCISE DATA:
-- Exercise type: {exercise_type}
-- Repetition count: {rep_count}
-- Duration: {duration:.1f} seconds
-- Average left elbow angle: {avg_elbow_left:.1f}°
-- Average right elbow angle: {avg_elbow_right:.1f}°
-- Average left knee angle: {avg_knee_left:.1f}°
-- Average right knee angle: {avg_knee_right:.1f}°
-- Elbow range of motion: {elbow_range:.1f}°
-- Knee range of motion: {knee_range:.1f}°
-{quality_context}
-TASK:
-Analyze the exercise technique and provide feedback in JSON format:
-
-{{
-  "overall_score": number from 1 to 10,
-  "exercise_detected": "exercise name",
-  "technique_analysis": {{
-    "form_quality": "excellent/good/fair/poor",
-    "symmetry": "left and right sides are symmetrical/imbalance detected",
-    "range_of_motion": "full/limited/excessive",
-    "tempo": "appropriate/too fast/too slow"
-  }},
-  "feedback": {{
-    "positive": ["what is being done well"],
-    "improvements": ["what needs improvement"],
-    "specific_tips": ["specific advice"]
-  }},
-  "rep_count_accuracy": "accurate/approximate/inaccurate",
-  "safety_concerns": ["safety issues if any"]
-}}
-
-Respond only with JSON, no additional text.
-"""
-        
-        return prompt
+    async def call_openai_api(self, request: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        """Asynchronous chat completion through the provider router"""
+        result = await llm_router.complete(request, timeout=timeout)
+        return result['content']
     
-    async def call_openai_api(self, prompt: str) -> str:
-        """Asynchronous OpenAI API call"""
-        
-        if not self.api_key:
-            raise Exception("OpenAI API key not configured")
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        # OpenRouter recommends these headers; harmless elsewhere
-        if "openrouter.ai" in self.api_base:
-            site = os.getenv("OPENROUTER_SITE_URL", "http://localhost")
-            app_title = os.getenv("OPENROUTER_APP_NAME", settings.app_name)
-            headers.update({
-                "HTTP-Referer": site,
-                "X-Title": app_title,
-            })
-        
-        data = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a professional fitness trainer and movement analysis expert. Respond only in JSON format."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.3
-        }
-        
-        # Use asyncio for non-blocking request
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, 
-            lambda: requests.post(self.api_url, headers=headers, json=data, timeout=settings.ai_timeout_seconds)
-        )
+    async def analyze_exercise_stream(self, vectors_data: Dict, deadline: Optional[Deadline] = None):
+        """
+        Streams the analysis: yields ('field', path, value) for every feedback
+        field as soon as it is complete and valid (`FieldValidator`), then
+        ('result', retracted_paths, feedback) with the same validated structure
+        as analyze_exercise; `retracted_paths` lists streamed fields the result
+        does not keep
+        """
+        if self.use_rules(vectors_data):
+            feedback_source_counts['rules'] += 1
+            yield 'result', None, self.rule_engine.evaluate(vectors_data)
+            return
         
-        if response.status_code != 200:
-            raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
+        timeout = self.llm_timeout(deadline)
+        if timeout is None:
+            yield 'result', None, self.skip_llm(vectors_data, deadline)
+            return
         
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        chunks = []
+        emitted = []
+        deltas = llm_router.stream(prompt_compiler.compile(vectors_data), timeout=timeout)
+        try:
+            parser = IncrementalJSONParser()
+            validator = FieldValidator()
+            async for delta in deltas:
+                chunks.append(delta)
+                for path, value in parser.feed(delta):
+                    path = validator.accept(path, value)
+                    if path is not None:
+                        emitted.append((path, value))
+                        yield 'field', path, value
+            feedback = self.parse_ai_response(''.join(chunks))
+            feedback_source_counts['llm'] += 1
+        except Exception as e:
+            print(f"Error in AI analysis: {str(e)}")
+            feedback = self.fallback_feedback(vectors_data, deadline)
+        finally:
+            # Closing the router stream stops the provider request when the client has gone
+            await deltas.aclose()
+        # Streamed fields the final answer does not keep (unparseable answer, LLM error)
+        retracted = [path for path, value in emitted if lookup(feedback, path) != value]
+        yield 'result', retracted, feedback
     
     def parse_ai_response(self, response_text: str) -> Dict[str, Any]:
         """Parses AI response"""
@@ -175,6 +219,8 @@ Respond only with JSON, no additional text.
                 clean_response = clean_response[:-3]
             
             feedback = json.loads(clean_response.strip())
+            if not isinstance(feedback, dict):
+                raise json.JSONDecodeError("Expected a JSON object", clean_response, 0)
             
             # Validate response structure
             required_fields = ['overall_score', 'exercise_detected', 'technique_analysis', 'feedback']
@@ -182,17 +228,49 @@ Respond only with JSON, no additional text.
                 if field not in feedback:
                     feedback[field] = self.get_default_field_value(field)
             
-            return feedback
+            return self.validate_feedback(feedback)
             
         except json.JSONDecodeError as e:
             print(f"Error parsing AI response: {e}")
             return self.get_default_feedback()
     
+    def validate_feedback(self, feedback: Dict[str, Any]) -> Dict[str, Any]:
+        """Replaces values that do not fit the schema (`valid_field`) with defaults
+        and drops invalid list items"""
+        for field in ('overall_score', 'exercise_detected', 'rep_count_accuracy'):
+            if field in feedback and not valid_field([field], feedback[field]):
+                feedback[field] = self.get_default_field_value(field)
+
+        defaults = self.get_default_field_value('technique_analysis')
+        technique = feedback.get('technique_analysis')
+        if not isinstance(technique, dict):
+            technique = feedback['technique_analysis'] = dict(defaults)
+        for key in TECHNIQUE_FIELDS:
+            if not valid_field(['technique_analysis', key], technique.get(key)):
+                technique[key] = defaults[key]
+
+        defaults = self.get_default_field_value('feedback')
+        lists = feedback.get('feedback')
+        if not isinstance(lists, dict):
+            lists = feedback['feedback'] = {}
+        for key in FEEDBACK_LISTS:
+            items = lists.get(key)
+            items = [item for item in items if valid_field(['feedback', key, 0], item)] if isinstance(items, list) else []
+            lists[key] = items or list(defaults[key])
+
+        if 'safety_concerns' in feedback:
+            concerns = feedback['safety_concerns']
+            feedback['safety_concerns'] = [
+                item for item in concerns if valid_field(['safety_concerns', 0], item)
+            ] if isinstance(concerns, list) else []
+        return feedback
+    
     def get_default_field_value(self, field: str) -> Any:
         """Returns default values for fields"""
         defaults = {
             'overall_score': 5,
             'exercise_detected': 'Unrecognized exercise',
+            'rep_count_accuracy': 'approximate',
             'technique_analysis': {
                 'form_quality': 'fair',
                 'symmetry': 'requires analysis',
@@ -212,6 +290,10 @@ Respond only with JSON, no additional text.
         movement_analysis = vectors_data.get('movement_analysis', {})
         exercise_type = movement_analysis.get('exercise_type', 'unknown')
         rep_count = vectors_data.get('rep_count', 0)
+        if movement_analysis.get('mode') == 'hold':
+            done = f"Held the position for {movement_analysis.get('hold', {}).get('hold_seconds', 0):.0f} seconds"
+        else:
+            done = f'Completed {rep_count} repetitions'
         
         exercise_names = {
             'upper_body': 'Upper body exercise',
@@ -230,7 +312,7 @@ Respond only with JSON, no additional text.
                 'tempo': 'analysis unavailable'
             },
             'feedback': {
-                'positive': [f'Completed {rep_count} repetitions', 'Movement detected'],
+                'positive': [done, 'Movement detected'],
                 'improvements': ['Detailed analysis requires AI connection'],
                 'specific_tips': ['Monitor your form', 'Maintain steady pace']
             },
@@ -0,0 +1,300 @@
+"""
+Exercise classification by dynamic time warping against reference rep templates
+"""
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.backend.core.config import settings
+
+
+# Channels of the normalized multi-joint sequence. Angles are scaled by 1/180,
+# vertical positions by Y_SCALE so a 0.15 shoulder travel weighs about as
+# much as a 70 degree joint excursion.
+CHANNELS = ['elbow', 'knee', 'hip', 'shoulder_y', 'wrist_y']
+Y_SCALE = 2.5
+TEMPLATE_LENGTH = 32
+
+# One repetition starting from the top position: per channel the excursion at
+# the bottom of the rep (degrees for angles, normalized image units for y).
+REFERENCE_EXCURSIONS = {
+    'squat': {'elbow': 5.0, 'knee': -90.0, 'hip': -80.0, 'shoulder_y': 0.15, 'wrist_y': 0.15},
+    'deadlift': {'elbow': 3.0, 'knee': -35.0, 'hip': -90.0, 'shoulder_y': 0.12, 'wrist_y': 0.25},
+    'pushup': {'elbow': -90.0, 'knee': 2.0, 'hip': 5.0, 'shoulder_y': 0.08, 'wrist_y': 0.0},
+    'pullup': {'elbow': -110.0, 'knee': 5.0, 'hip': 8.0, 'shoulder_y': -0.15, 'wrist_y': -0.01},
+}
+
+
+def frames_to_sequence(frames_data: List[Dict[str, Any]]):
+    """(T, C) normalized sequence from per-frame features"""
+    def mean_of(left: str, right: str):
+        return np.array([(f.get(left, 0.0) + f.get(right, 0.0)) / 2.0 for f in frames_data], dtype=float)
+
+    return np.stack([
+        mean_of('left_elbow_angle', 'right_elbow_angle') / 180.0,
+        mean_of('left_knee_angle', 'right_knee_angle') / 180.0,
+        mean_of('left_hip_angle', 'right_hip_angle') / 180.0,
+        mean_of('left_shoulder_y', 'right_shoulder_y') * Y_SCALE,
+        mean_of('left_wrist_y', 'right_wrist_y') * Y_SCALE,
+    ], axis=1)
+
+
+def resample(sequence, length: int = TEMPLATE_LENGTH):
+    """Linear resampling to a fixed length, then per-channel mean-centering"""
+    src = np.linspace(0.0, 1.0, len(sequence))
+    dst = np.linspace(0.0, 1.0, length)
+    out = np.stack([np.interp(dst, src, sequence[:, c]) for c in range(sequence.shape[1])], axis=1)
+    return out - out.mean(axis=0)
+
+
+def envelope(sequence, radius: int):
+    """Upper and lower LB_Keogh envelopes within the warping band"""
+    length = len(sequence)
+    upper = np.empty_like(sequence)
+    lower = np.empty_like(sequence)
+    for i in range(length):
+        window = sequence[max(0, i - radius):min(length, i + radius + 1)]
+        upper[i] = window.max(axis=0)
+        lower[i] = window.min(axis=0)
+    return upper, lower
+
+
+def dtw_batch(query, templates, radius: int, cutoffs):
+    """Banded multi-channel DTW (squared Euclidean) of one query against a stack
+    of templates. A template is abandoned (distance inf) as soon as a whole row
+    of its cost matrix reaches its cutoff.
+
+    Rows are computed for all templates at once: with m[j] = min(prev[j-1], prev[j])
+    the recurrence cur[j] = c[j] + min(m[j], cur[j-1]) unrolls to a prefix sum
+    plus a running minimum, so no per-cell Python loop is needed.
+    """
+    count, n = len(templates), len(query)
+    distances = np.full(count, np.inf)
+    alive = np.arange(count)
+    cutoffs = np.asarray(cutoffs, dtype=float)
+
+    prev = np.full((count, n + 1), np.inf)
+    prev[:, 0] = 0.0
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - radius), min(n, i + radius)
+        row_cost = ((templates[alive, lo - 1:hi] - query[i - 1]) ** 2).sum(axis=2)
+        prefix = np.cumsum(row_cost, axis=1)
+        step = np.minimum(prev[:, lo - 1:hi], prev[:, lo:hi + 1])
+        step[:, 1:] -= prefix[:, :-1]
+        cur = np.full_like(prev, np.inf)
+        cur[:, lo:hi + 1] = prefix + np.minimum.accumulate(step, axis=1)
+
+        keep = cur[:, lo:hi + 1].min(axis=1) < cutoffs
+        if not keep.all():
+            alive, cur, cutoffs = alive[keep], cur[keep], cutoffs[keep]
+            if not len(alive):
+                return distances
+        prev = cur
+    distances[alive] = prev[:, n]
+    return distances
+
+
+def lb_keogh(query, query_upper, query_lower, templates, template_upper, template_lower):
+    """Symmetric LB_Keogh per template: the larger of the two one-sided bounds"""
+    forward = (
+        np.clip(templates - query_upper, 0.0, None) ** 2
+        + np.clip(query_lower - templates, 0.0, None) ** 2
+    ).sum(axis=(1, 2))
+    reverse = (
+        np.clip(query - template_upper, 0.0, None) ** 2
+        + np.clip(template_lower - query, 0.0, None) ** 2
+    ).sum(axis=(1, 2))
+    return np.maximum(forward, reverse)
+
+
+def segment_reps(sequence, min_amplitude: float = 0.08) -> List[Tuple[int, int]]:
+    """Splits a (T, C) sequence into repetitions between consecutive top positions"""
+    centered = sequence - sequence.mean(axis=0)
+    channel = int(np.argmax(centered.std(axis=0)))
+    signal = centered[:, channel]
+    if len(signal) >= 5:
+        kernel = np.ones(5) / 5
+        signal = np.convolve(np.pad(signal, (2, 2), mode='edge'), kernel, mode='valid')
+    lo, hi = float(signal.min()), float(signal.max())
+    if hi - lo < min_amplitude:
+        return []
+    # The clip starts in the top position: orient the signal so "top" is high
+    if abs(signal[0] - lo) < abs(signal[0] - hi):
+        signal = -signal
+        lo, hi = -hi, -lo
+    top_threshold = lo + 0.7 * (hi - lo)
+    bottom_threshold = lo + 0.3 * (hi - lo)
+
+    tops: List[int] = []
+    state = 'top' if signal[0] >= top_threshold else 'unknown'
+    dwell_start = 0
+    for i, value in enumerate(signal):
+        if state != 'bottom' and value <= bottom_threshold:
+            if state == 'top':
+                tops.append(dwell_start + int(np.argmax(signal[dwell_start:i + 1])))
+            state = 'bottom'
+        elif state == 'bottom' and value >= top_threshold:
+            state = 'top'
+            dwell_start = i
+    if state == 'top':
+        tops.append(dwell_start + int(np.argmax(signal[dwell_start:])))
+    segments = [(tops[k], tops[k + 1]) for k in range(len(tops) - 1) if tops[k + 1] - tops[k] >= 3]
+    if len(segments) >= 3:
+        # A pause between sets shows up as one very long "rep"
+        typical = float(np.median([end - start for start, end in segments]))
+        segments = [(start, end) for start, end in segments if end - start <= 2.0 * typical]
+    return segments
+
+
+def _rep_curve(length: int, down_fraction: float, hold_fraction: float):
+    """0 at the top, 1 at the bottom: smooth descent, hold, smooth ascent"""
+    t = np.linspace(0.0, 1.0, length)
+    down_end = down_fraction
+    hold_end = min(0.95, down_fraction + hold_fraction)
+    curve = np.empty(length)
+    for i, x in enumerate(t):
+        if x < down_end:
+            curve[i] = 0.5 - 0.5 * np.cos(np.pi * x / down_end)
+        elif x < hold_end:
+            curve[i] = 1.0
+        else:
+            curve[i] = 0.5 + 0.5 * np.cos(np.pi * (x - hold_end) / (1.0 - hold_end))
+    return curve
+
+
+def build_reference_templates(variants_per_exercise: int = 60, seed: int = 7):
+    """Synthetic library: each exercise at varied depth, tempo split, bottom hold and coupling"""
+    rng = np.random.default_rng(seed)
+    templates, labels = [], []
+    for label, excursions in REFERENCE_EXCURSIONS.items():
+        for _ in range(variants_per_exercise):
+            curve = _rep_curve(TEMPLATE_LENGTH, rng.uniform(0.3, 0.6), rng.uniform(0.0, 0.2))
+            depth = rng.uniform(0.6, 1.3)
+            channels = []
+            for name in CHANNELS:
+                excursion = excursions[name] * depth * rng.uniform(0.8, 1.2)
+                scale = Y_SCALE if name.endswith('_y') else 1.0 / 180.0
+                channels.append(curve * excursion * scale)
+            template = np.stack(channels, axis=1)
+            templates.append(template - template.mean(axis=0))
+            labels.append(label)
+    return np.stack(templates), labels
+
+
+class DTWExerciseClassifier:
+    """Nearest-template classifier with LB_Keogh pruning and early-abandoning DTW.
+
+    Template envelopes are precomputed, so bounding a query against the whole
+    library is one vectorized pass. Exact DTW of the best-bound template per
+    label seeds the winner / runner-up distances; only templates whose bound
+    beats those go through the batched DTW, which abandons them row by row.
+    """
+
+    def __init__(self, templates, labels: List[str], radius: int = 4):
+        self.templates = np.asarray(templates, dtype=float)
+        self.labels = np.asarray(labels)
+        self.label_set = sorted(set(labels))
+        self.radius = radius
+        envelopes = [envelope(template, radius) for template in self.templates]
+        self.template_upper = np.stack([upper for upper, _ in envelopes])
+        self.template_lower = np.stack([lower for _, lower in envelopes])
+        self.last_dtw_calls = 0
+
+    def _nearest(self, query) -> Tuple[str, float, float]:
+        """Best label, its DTW distance and the distance to the closest other label"""
+        upper, lower = envelope(query, self.radius)
+        bounds = lb_keogh(query, upper, lower, self.templates, self.template_upper, self.template_lower)
+        order = np.argsort(bounds)
+
+        # Upper bounds: exact distance of the lowest-bound template of each label
+        seeds = [order[np.argmax(self.labels[order] == label)] for label in self.label_set]
+        seed_distances = dtw_batch(query, self.templates[seeds], self.radius, np.full(len(seeds), np.inf))
+        best = dict(zip(self.label_set, seed_distances))
+        winner, d_best, d_other = self._rank(best)
+
+        # A candidate matters only if it could beat the winner (same label) or the runner-up
+        cutoffs = np.where(self.labels == winner, d_best, d_other)
+        candidates = np.where(bounds < cutoffs)[0]
+        candidates = candidates[~np.isin(candidates, seeds)]
+        self.last_dtw_calls += len(seeds) + len(candidates)
+        if len(candidates):
+            distances = dtw_batch(query, self.templates[candidates], self.radius, cutoffs[candidates])
+            for k, distance in zip(candidates, distances):
+                label = self.labels[k]
+                if distance < best[label]:
+                    best[label] = distance
+            winner, d_best, d_other = self._rank(best)
+        return str(winner), float(d_best), float(d_other)
+
+    @staticmethod
+    def _rank(best: Dict[str, float]) -> Tuple[str, float, float]:
+        """Winner, its distance and the runner-up's (inf when only one label has templates)"""
+        ranked = sorted(best, key=best.get)
+        d_other = best[ranked[1]] if len(ranked) > 1 else float('inf')
+        return ranked[0], best[ranked[0]], d_other
+
+    def classify(self, frames_data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Label, confidence and per-rep boundaries for a clip.
+
+        Reps are resampled to the template length and reduced to their
+        per-step median, so one search covers the whole set and a single
+        odd rep does not flip the label.
+        """
+        if np is None or len(frames_data) < 6:
+            return None
+        self.last_dtw_calls = 0
+        sequence = frames_to_sequence(frames_data)
+        segments = segment_reps(sequence)
+
+        if segments:
+            query = np.median(np.stack([resample(sequence[start:end + 1]) for start, end in segments]), axis=0)
+        else:
+            query = resample(sequence)
+        label, distance, runner_up = self._nearest(query)
+        if runner_up in (0.0, float('inf')):
+            # No margin to measure (inf: a single label, nothing to tell it apart from)
+            confidence = 0.0
+        else:
+            confidence = max(0.0, 1.0 - distance / runner_up)
+
+        rep_segments = []
+        for start, end in segments:
+            segment = {
+                'start_frame': frames_data[start].get('frame_id', start),
+                'end_frame': frames_data[end].get('frame_id', end),
+            }
+            if 'timestamp' in frames_data[start]:
+                segment['start_time'] = round(float(frames_data[start]['timestamp']), 2)
+                segment['end_time'] = round(float(frames_data[end]['timestamp']), 2)
+            rep_segments.append(segment)
+
+        return {
+            'label': label,
+            'confidence': round(confidence, 3),
+            'distance': round(distance, 4),
+            'runner_up_distance': round(runner_up, 4) if runner_up != float('inf') else None,
+            'dtw_calls': self.last_dtw_calls,
+            'rep_segments': rep_segments,
+        }
+
+
+_classifier: Optional[DTWExerciseClassifier] = None
+
+
+def get_classifier() -> DTWExerciseClassifier:
+    """Process-wide classifier; templates from DTW_TEMPLATE_PATH (.npz with
+    `templates` (K, L, C) and `labels`) or the built-in synthetic library"""
+    global _classifier
+    if _classifier is None:
+        templates, labels = build_reference_templates()
+        path = settings.dtw_template_path
+        if path and os.path.exists(path):
+            data = np.load(path, allow_pickle=False)
+            templates = np.concatenate([templates, data['templates'].astype(float)])
+            labels = labels + [str(label) for label in data['labels']]
+        _classifier = DTWExerciseClassifier(templates, labels, radius=settings.dtw_band_radius)
+    return _classifier
@@ -0,0 +1,498 @@
+"""
+Routing of chat completions over several LLM providers with health tracking
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+import requests
+
+from src.backend.core.config import settings
+from src.ml.prompt_compiler import count_message_tokens, estimate_tokens
+
+
+# An attempt needs at least this much of the deadline left to be worth starting
+MIN_ATTEMPT_SECONDS = 0.5
+
+
+class LLMUnavailableError(Exception):
+    """Raised when no provider could produce a completion"""
+
+
+class LLMConfigError(ValueError):
+    """Raised at startup for an unusable LLM_PROVIDERS setting"""
+
+
+class ProviderConfig:
+    """OpenAI-compatible chat completions endpoint"""
+
+    def __init__(
+        self,
+        name: str,
+        api_base: str,
+        model: str,
+        api_key: str = "",
+        timeout: Optional[float] = None,
+        extra_headers: Optional[Dict[str, str]] = None,
+        json_mode: Optional[bool] = None,
+        stream_usage: bool = True,
+    ):
+        self.name = name
+        self.api_base = api_base.rstrip("/")
+        self.api_url = f"{self.api_base}/chat/completions"
+        self.model = model
+        self.api_key = api_key
+        self.timeout = float(timeout or settings.ai_timeout_seconds)
+        self.extra_headers = extra_headers or {}
+        if json_mode is None:
+            json_mode = settings.ai_json_mode == "true" or (
+                settings.ai_json_mode == "auto" and "api.openai.com" in self.api_base
+            )
+        self.json_mode = json_mode
+        # Ask for a final usage chunk on streams (OpenAI stream_options); off for servers that reject it
+        self.stream_usage = stream_usage
+
+    def body(self, payload: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        """Request body for this provider's model, with structured JSON output when supported"""
+        body = dict(payload, model=self.model, **extra)
+        if extra.get("stream") and self.stream_usage:
+            body["stream_options"] = {"include_usage": True}
+        if self.json_mode:
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        # OpenRouter recommends these headers; harmless elsewhere
+        if "openrouter.ai" in self.api_base:
+            headers.update({
+                "HTTP-Referer": os.getenv("OPENROUTER_SITE_URL", "http://localhost"),
+                "X-Title": os.getenv("OPENROUTER_APP_NAME", settings.app_name),
+            })
+        headers.update(self.extra_headers)
+        return headers
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one probe through after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def cancel_probe(self) -> None:
+        """A call that ended without an outcome (caller went away): let the next one probe"""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class ProviderStats:
+    """Latency samples and outcome counters of one provider"""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+        self.hedged = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "short_circuited": self.short_circuited,
+            "hedged_requests": self.hedged,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.successes, 1) if self.successes else None,
+            "avg_completion_tokens": round(self.completion_tokens / self.successes, 1) if self.successes else None,
+            "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+            "latency_p99": self.percentile(99),
+        }
+
+
+class LLMRouter:
+    """Sends a completion to the first healthy provider, failing over in order.
+
+    With hedging enabled, a second provider is raced once the primary has been
+    silent for longer than its own latency percentile; the first answer wins.
+    """
+
+    def __init__(
+        self,
+        providers: List[ProviderConfig],
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 2.0,
+        hedge_min_samples: int = 20,
+    ):
+        self.providers = providers
+        self.breakers = {p.name: CircuitBreaker(failure_threshold, reset_timeout) for p in providers}
+        self.stats = {p.name: ProviderStats() for p in providers}
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        # Recent successful requests, to relate latency to prompt/completion size
+        self.request_log = deque(maxlen=200)
+
+    def _record_success(
+        self,
+        provider: ProviderConfig,
+        payload: Dict[str, Any],
+        latency: float,
+        content: str,
+        usage: Dict[str, Any],
+        streamed: bool = False,
+    ) -> Dict[str, Any]:
+        stats = self.stats[provider.name]
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        measured = prompt_tokens is not None and completion_tokens is not None
+        if prompt_tokens is None:
+            prompt_tokens = count_message_tokens(payload.get("messages", []))
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(content)
+
+        stats.successes += 1
+        stats.latencies.append(round(latency, 3))
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        self.breakers[provider.name].record_success()
+        record = {
+            "provider": provider.name,
+            "model": provider.model,
+            "latency": round(latency, 3),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_measured": measured,
+            "streamed": streamed,
+            "at": time.time(),
+        }
+        self.request_log.append(record)
+        return record
+
+    def _post(self, provider: ProviderConfig, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        response = requests.post(provider.api_url, headers=provider.headers(), json=provider.body(payload),
+                                 timeout=timeout)
+        if response.status_code != 200:
+            raise Exception(f"{provider.name} API error: {response.status_code} - {response.text[:200]}")
+        result = response.json()
+        return {
+            "content": result["choices"][0]["message"]["content"],
+            "usage": result.get("usage") or {},
+        }
+
+    async def _attempt(self, provider: ProviderConfig, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        stats = self.stats[provider.name]
+        breaker = self.breakers[provider.name]
+        stats.requests += 1
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, lambda: self._post(provider, payload, timeout))
+        except Exception as e:
+            stats.errors += 1
+            if isinstance(e, requests.Timeout):
+                stats.timeouts += 1
+            breaker.record_failure()
+            raise
+        record = self._record_success(
+            provider, payload, time.monotonic() - started, result["content"], result["usage"]
+        )
+        result.update(record)
+        return result
+
+    def _hedge_delay(self, provider: ProviderConfig) -> float:
+        stats = self.stats[provider.name]
+        if len(stats.latencies) < self.hedge_min_samples:
+            return max(self.hedge_min_delay, provider.timeout / 2)
+        return max(self.hedge_min_delay, stats.percentile(self.hedge_percentile) or 0.0)
+
+    def _next_provider(self, queue: List[ProviderConfig], deadline: float) -> Optional[ProviderConfig]:
+        """Next provider whose breaker lets a request through, None when there is
+        none or too little time is left to start one (not counted as a failure)"""
+        if deadline - time.monotonic() < MIN_ATTEMPT_SECONDS:
+            return None
+        while queue:
+            provider = queue.pop(0)
+            if self.breakers[provider.name].allow():
+                return provider
+            self.stats[provider.name].short_circuited += 1
+        return None
+
+    def _start(self, provider: ProviderConfig, payload: Dict[str, Any], deadline: float) -> asyncio.Task:
+        timeout = min(provider.timeout, max(0.0, deadline - time.monotonic()))
+        return asyncio.ensure_future(self._attempt(provider, payload, timeout))
+
+    async def complete(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Runs a chat completion payload (without `model`) through the providers"""
+        if not self.providers:
+            raise LLMUnavailableError("No LLM provider configured")
+
+        queue = list(self.providers)
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.ai_timeout_seconds)
+        if deadline - time.monotonic() < MIN_ATTEMPT_SECONDS:
+            raise LLMUnavailableError("deadline exceeded")
+        provider = self._next_provider(queue, deadline)
+        if provider is None:
+            raise LLMUnavailableError("All LLM providers are unhealthy")
+
+        pending: Dict[asyncio.Task, ProviderConfig] = {self._start(provider, payload, deadline): provider}
+        errors = []
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    errors.append("deadline exceeded")
+                    break
+
+                hedging = self.hedge_enabled and queue and len(pending) == 1
+                wait_for = min(remaining, self._hedge_delay(next(iter(pending.values())))) if hedging else remaining
+                done, _ = await asyncio.wait(list(pending), timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if hedging:
+                        hedge = self._next_provider(queue, deadline)
+                        if hedge is not None:
+                            self.stats[hedge.name].hedged += 1
+                            pending[self._start(hedge, payload, deadline)] = hedge
+                    continue
+
+                for task in done:
+                    failed = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{failed.name}: {task.exception()}")
+
+                    # Fail over to the next healthy provider right away
+                    provider = self._next_provider(queue, deadline)
+                    if provider is not None:
+                        pending[self._start(provider, payload, deadline)] = provider
+        finally:
+            # Losing hedge requests finish in their executor thread; just detach them
+            for task in pending:
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        raise LLMUnavailableError("; ".join(errors) or "LLM request failed")
+
+    def _post_stream(self, provider: ProviderConfig, payload: Dict[str, Any], timeout: float, emit,
+                     stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Reads a server-sent-events completion and hands each text delta to
+        `emit`; closes the connection early once `stop` is set"""
+        usage: Dict[str, Any] = {}
+        with requests.post(provider.api_url, headers=provider.headers(), json=provider.body(payload, stream=True),
+                           timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"{provider.name} API error: {response.status_code} - {response.text[:200]}")
+            for line in response.iter_lines(decode_unicode=True):
+                if stop is not None and stop.is_set():
+                    break
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        emit(delta)
+        return usage
+
+    async def stream(self, payload: Dict[str, Any], timeout: Optional[float] = None):
+        """Yields completion text deltas from the first healthy provider.
+
+        Failover is only possible before the first delta arrives; a stream that
+        breaks afterwards raises LLMUnavailableError to the consumer.
+        """
+        if not self.providers:
+            raise LLMUnavailableError("No LLM provider configured")
+
+        queue = list(self.providers)
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.ai_timeout_seconds)
+        loop = asyncio.get_running_loop()
+        errors = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining < MIN_ATTEMPT_SECONDS:
+                raise LLMUnavailableError("; ".join(errors + ["deadline exceeded"]))
+            provider = self._next_provider(queue, deadline)
+            if provider is None:
+                raise LLMUnavailableError("; ".join(errors) or "All LLM providers are unhealthy")
+
+            stats = self.stats[provider.name]
+            breaker = self.breakers[provider.name]
+            stats.requests += 1
+            started = time.monotonic()
+            deltas: asyncio.Queue = asyncio.Queue()
+            _end = object()
+
+            def emit(item, _deltas=deltas):
+                loop.call_soon_threadsafe(_deltas.put_nowait, item)
+
+            usage: Dict[str, Any] = {}
+            stop = threading.Event()
+
+            def run(provider=provider, timeout=min(provider.timeout, remaining), emit=emit, usage=usage, stop=stop):
+                try:
+                    usage.update(self._post_stream(provider, payload, timeout, emit, stop))
+                    emit(_end)
+                except Exception as e:
+                    emit(e)
+
+            loop.run_in_executor(None, run)
+            received = []
+            settled = False
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(deltas.get(), timeout=max(0.0, deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        item = LLMUnavailableError(f"{provider.name}: deadline exceeded")
+                    if item is _end:
+                        settled = True
+                        self._record_success(
+                            provider, payload, time.monotonic() - started, "".join(received), usage, streamed=True
+                        )
+                        return
+                    if isinstance(item, Exception):
+                        settled = True
+                        stats.errors += 1
+                        if isinstance(item, requests.Timeout):
+                            stats.timeouts += 1
+                        breaker.record_failure()
+                        if received:
+                            raise LLMUnavailableError(f"{provider.name}: stream interrupted: {item}")
+                        errors.append(f"{provider.name}: {item}")
+                        break
+                    received.append(item)
+                    yield item
+            finally:
+                # Also runs when the consumer stops early (client gone): the worker thread quits reading
+                stop.set()
+                if not settled:
+                    # No outcome to record; a half-open breaker must not wait for this probe forever
+                    breaker.cancel_probe()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-provider health, latency and error metrics"""
+        return {
+            provider.name: {
+                "model": provider.model,
+                "api_base": provider.api_base,
+                "circuit": self.breakers[provider.name].state,
+                **self.stats[provider.name].snapshot(),
+            }
+            for provider in self.providers
+        }
+
+
+def load_providers() -> List[ProviderConfig]:
+    """Providers from LLM_PROVIDERS (JSON list), else the single OPENAI_* provider.
+
+    A malformed LLM_PROVIDERS raises LLMConfigError: falling back to no
+    providers would silently turn every analysis into rule-based feedback.
+    """
+    if settings.llm_providers:
+        try:
+            entries = json.loads(settings.llm_providers)
+        except json.JSONDecodeError as e:
+            raise LLMConfigError(f"LLM_PROVIDERS is not valid JSON: {e}") from e
+        if not isinstance(entries, list) or not entries:
+            raise LLMConfigError("LLM_PROVIDERS must be a non-empty JSON list of provider objects")
+        providers = []
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                raise LLMConfigError(f"LLM_PROVIDERS[{i}] must be an object, got {type(entry).__name__}")
+            missing = [key for key in ("api_base", "model") if not isinstance(entry.get(key), str) or not entry[key]]
+            if missing:
+                raise LLMConfigError(f"LLM_PROVIDERS[{i}] ({entry.get('name', 'unnamed')}) is missing {', '.join(missing)}")
+            timeout = entry.get("timeout")
+            if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+                raise LLMConfigError(f"LLM_PROVIDERS[{i}].timeout must be a positive number of seconds")
+            api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""), "")
+            providers.append(ProviderConfig(
+                name=entry.get("name", f"provider{i}"),
+                api_base=entry["api_base"],
+                model=entry["model"],
+                api_key=api_key,
+                timeout=entry.get("timeout"),
+                extra_headers=entry.get("headers"),
+                json_mode=entry.get("json_mode"),
+                stream_usage=entry.get("stream_usage", True),
+            ))
+        return providers
+
+    if not settings.openai_api_key:
+        return []
+    return [ProviderConfig(
+        name="primary",
+        api_base=settings.openai_api_base,
+        model=settings.openai_model,
+        api_key=settings.openai_api_key,
+    )]
+
+
+# Shared so health state survives across requests
+llm_router = LLMRouter(
+    load_providers(),
+    failure_threshold=settings.llm_circuit_failure_threshold,
+    reset_timeout=settings.llm_circuit_reset_seconds,
+    hedge_enabled=settings.llm_hedge_enabled,
+    hedge_percentile=settings.llm_hedge_percentile,
+    hedge_min_delay=settings.llm_hedge_min_delay_seconds,
+)
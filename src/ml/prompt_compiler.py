@@ -0,0 +1,168 @@
+"""
+Compact, token-budgeted prompts for movement analysis
+"""
+import json
+import math
+from typing import Dict, Any, List, Optional
+
+from src.backend.core.config import settings
+
+# Exact counts need tiktoken (requirements.txt) and its encoding file, which it downloads
+# on first use; offline or without the package the estimate is ~4 characters per token
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+TOKEN_COUNTER = "tiktoken" if _ENCODING is not None else "chars/4"
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, else the ~4 chars/token rule"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    # ~4 tokens of chat framing per message
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+_ROLE = "You are a professional fitness trainer and biomechanics expert."
+
+_SCHEMA = (
+    '{"overall_score":1-10,"exercise_detected":str,'
+    '"technique_analysis":{"form_quality":"excellent|good|fair|poor",'
+    '"symmetry":"symmetrical|imbalance detected","range_of_motion":"full|limited|excessive",'
+    '"tempo":"appropriate|too fast|too slow"},'
+    '"feedback":{"positive":[str],"improvements":[str],"specific_tips":[str]},'
+    '"rep_count_accuracy":"accurate|approximate|inaccurate","safety_concerns":[str]}'
+)
+
+_LEGEND = (
+    "Data keys: ex=detected exercise, reps=repetitions, dur=seconds, "
+    "ang=average joint angles in degrees [left,right] (el=elbow, kn=knee), "
+    "rom=range of motion in degrees, sets=reps per set, q=video quality 0-1, warn=quality warnings."
+)
+
+_HOLD_LEGEND = (
+    "hold: s=longest hold seconds, tut=total seconds in position, "
+    "line=[mean,min] shoulder-hip-ankle angle (180=straight), sag/pike=share of the hold with hips "
+    "below/above the line, drift=body line change in degrees per minute."
+)
+
+_QUALITY_RULE = (
+    "If q<0.8 or warn is present, keep advice general and encouraging "
+    "instead of precise biomechanical corrections."
+)
+
+EXERCISE_FOCUS = {
+    "pullup": "Judge full hang at the bottom, chin over bar, controlled descent and no kipping.",
+    "squat": "Judge depth from knee angle, knee tracking, torso angle and left/right balance.",
+    "deadlift": "Judge the hip hinge pattern, neutral spine, bar path and full lockout.",
+    "pushup": "Judge elbow depth, straight body line and full lockout.",
+    "plank": "Static hold, reps are not counted. " + _HOLD_LEGEND
+             + " Judge the body line, sagging or piked hips and whether form fades over the hold.",
+}
+
+_GENERIC_FOCUS = "Infer the exercise from the joint ranges if ex is generic or unknown."
+
+
+class PromptCompiler:
+    """Builds chat payloads from precompiled per-exercise system templates.
+
+    The static part (role, schema, per-exercise focus) is compiled once; each
+    request only serializes the movement data as compact JSON.
+    """
+
+    def __init__(self, prompt_budget: int, max_output_tokens: int):
+        self.prompt_budget = prompt_budget
+        self.max_output_tokens = max_output_tokens
+        self.templates = {
+            exercise: self._compile_template(focus)
+            for exercise, focus in list(EXERCISE_FOCUS.items()) + [("generic", _GENERIC_FOCUS)]
+        }
+        self.minimal_template = self._compile_template(None)
+        # Prompts sent although even the minimal form exceeded the budget
+        self.over_budget = 0
+        self.last_over_budget: Optional[Dict[str, int]] = None
+
+    def _compile_template(self, focus: Optional[str]) -> str:
+        parts = [_ROLE, "Analyze the movement data and reply with JSON only, matching:", _SCHEMA,
+                 "Max 3 items per list, each under 15 words.", _LEGEND, _QUALITY_RULE]
+        if focus:
+            parts.append(focus)
+        return "\n".join(parts)
+
+    def encode_data(self, vectors_data: Dict[str, Any], detail: int = 2) -> Dict[str, Any]:
+        """Movement data with short keys and rounded values; lower detail drops optional fields"""
+        movement = vectors_data.get('movement_analysis', {})
+        validation = vectors_data.get('validation', {})
+
+        data: Dict[str, Any] = {
+            "ex": movement.get('exercise_type', 'unknown'),
+            "reps": int(vectors_data.get('rep_count', 0) or 0),
+            "dur": round(float(vectors_data.get('duration', 0) or 0), 1),
+            "ang": {
+                "el": [round(movement.get('avg_left_elbow_angle', 0)), round(movement.get('avg_right_elbow_angle', 0))],
+                "kn": [round(movement.get('avg_left_knee_angle', 0)), round(movement.get('avg_right_knee_angle', 0))],
+            },
+            "rom": {"el": round(movement.get('elbow_range', 0)), "kn": round(movement.get('knee_range', 0))},
+        }
+        quality = validation.get('quality_score', 1.0)
+        if quality < 1.0:
+            data["q"] = round(quality, 2)
+        if detail >= 1 and validation.get('quality_warnings'):
+            data["warn"] = validation['quality_warnings']
+        if movement.get('mode') == 'hold':
+            hold = movement.get('hold', {})
+            line = hold.get('body_line', {})
+            data["hold"] = {"s": round(hold.get('hold_seconds', 0), 1), "tut": round(hold.get('time_under_tension_seconds', 0), 1)}
+            if line:
+                data["hold"].update({
+                    "line": [round(line['mean_degrees']), round(line['min_degrees'])],
+                    "sag": round(line['sag_ratio'], 2),
+                    "pike": round(line['pike_ratio'], 2),
+                })
+            if detail >= 1 and hold.get('drift'):
+                data["hold"]["drift"] = round(hold['drift']['body_line_degrees_per_minute'], 1)
+        if detail >= 2 and vectors_data.get('sets') and len(vectors_data['sets']) > 1:
+            data["sets"] = [s.get('rep_count', 0) for s in vectors_data['sets']]
+        return data
+
+    def compile(self, vectors_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat completion payload within the input token budget"""
+        exercise = vectors_data.get('movement_analysis', {}).get('exercise_type', 'unknown')
+        system = self.templates.get(exercise, self.templates["generic"])
+
+        for detail, template in ((2, system), (1, system), (0, system), (0, self.minimal_template)):
+            data = json.dumps(self.encode_data(vectors_data, detail), separators=(",", ":"))
+            messages = [
+                {"role": "system", "content": template},
+                {"role": "user", "content": data},
+            ]
+            prompt_tokens = count_message_tokens(messages)
+            if prompt_tokens <= self.prompt_budget:
+                break
+        else:
+            # Nothing left to drop: the minimal prompt goes out anyway, but visibly
+            self.over_budget += 1
+            self.last_over_budget = {"prompt_tokens": prompt_tokens, "budget": self.prompt_budget}
+            print(f"Warning: minimal prompt is {prompt_tokens} tokens, over AI_PROMPT_TOKEN_BUDGET "
+                  f"({self.prompt_budget}); sending it anyway")
+
+        return {
+            "messages": messages,
+            "max_tokens": self.max_output_tokens,
+            "temperature": 0.3,
+        }
+
+
+# Templates are compiled once per process
+prompt_compiler = PromptCompiler(
+    prompt_budget=settings.ai_prompt_token_budget,
+    max_output_tokens=settings.ai_max_output_tokens,
+)
@@ -0,0 +1,297 @@
+"""
+Deterministic rule-based feedback for well-classified common exercises
+"""
+from typing import Dict, Any, List, Optional
+
+from src.backend.core.config import settings
+
+
+# Per exercise: the joint whose range drives the rep, ROM limits (degrees)
+# below which the range is limited / above which it is excessive, and
+# seconds-per-rep limits for the tempo.
+EXERCISE_RULES = {
+    'squat': {
+        'name': 'Squat', 'joint': 'knee', 'rom_limited': 60.0, 'rom_excessive': 130.0,
+        'tempo_fast': 1.2, 'tempo_slow': 6.0,
+    },
+    'deadlift': {
+        'name': 'Deadlift', 'joint': 'knee', 'rom_limited': 20.0, 'rom_excessive': 75.0,
+        'tempo_fast': 1.5, 'tempo_slow': 8.0,
+    },
+    'pushup': {
+        'name': 'Push-up', 'joint': 'elbow', 'rom_limited': 50.0, 'rom_excessive': 130.0,
+        'tempo_fast': 1.0, 'tempo_slow': 6.0,
+    },
+    'pullup': {
+        'name': 'Pull-up', 'joint': 'elbow', 'rom_limited': 60.0, 'rom_excessive': 160.0,
+        'tempo_fast': 1.2, 'tempo_slow': 8.0,
+    },
+}
+
+TIPS = {
+    'squat': {
+        'limited': 'Sit down until your thighs are at least parallel to the floor',
+        'excessive': 'Stop the descent before your lower back starts to round',
+        'imbalance': 'Push the floor evenly through both feet',
+        'fast': 'Take about two seconds on the way down',
+        'slow': 'Drive up out of the bottom with intent',
+        'good': 'Keep your knees tracking over your toes',
+    },
+    'deadlift': {
+        'limited': 'Hinge at the hips and let the bar travel to mid-shin',
+        'excessive': 'Keep the hips higher; this is a hinge, not a squat',
+        'imbalance': 'Grip the bar evenly and keep both sides level',
+        'fast': 'Lower the bar under control instead of dropping it',
+        'slow': 'Lock out the hips promptly at the top',
+        'good': 'Keep the bar close to your legs through the whole pull',
+    },
+    'pushup': {
+        'limited': 'Lower your chest until the elbows reach about 90 degrees',
+        'excessive': 'Keep the shoulders from sagging past the elbows at the bottom',
+        'imbalance': 'Keep both hands equally loaded and the shoulders level',
+        'fast': 'Lower yourself for about two seconds on each rep',
+        'slow': 'Press back up smoothly without pausing at the bottom',
+        'good': 'Keep a straight line from head to heels',
+    },
+    'pullup': {
+        'limited': 'Start each rep from a full hang and finish with the chin over the bar',
+        'excessive': 'Avoid swinging past the bar; keep the movement vertical',
+        'imbalance': 'Pull evenly with both arms and keep the shoulders level',
+        'fast': 'Control the descent instead of dropping into the hang',
+        'slow': 'Pull up with a strong, continuous effort',
+        'good': 'Engage the shoulder blades before bending the elbows',
+    },
+}
+
+# Isometric holds: judged on hold time and the shoulder-hip-ankle line
+# instead of range and tempo
+HOLD_RULES = {
+    'plank': {'name': 'Plank', 'short_seconds': 20.0, 'drift_degrees_per_minute': 6.0},
+}
+
+# Without a single counted rep the rest of the analysis says little about form
+NO_REPS_MAX_SCORE = 3.0
+
+HOLD_TIPS = {
+    'plank': {
+        'sag': 'Squeeze the glutes and brace the abs to lift sagging hips',
+        'pike': 'Lower the hips until they line up with shoulders and ankles',
+        'drift': 'End the hold when the hips start to drop instead of pushing on',
+        'short': 'Build up the hold time in sets of 20-30 seconds',
+        'good': 'Keep the neck neutral and look at the floor between your hands',
+    },
+}
+
+
+class RuleFeedbackEngine:
+    """Builds the AI feedback structure from movement analysis alone"""
+
+    def supports(self, vectors_data: Dict[str, Any]) -> bool:
+        """Whether the detected exercise has rules"""
+        movement = vectors_data.get('movement_analysis', {})
+        if movement.get('mode') == 'hold':
+            return movement.get('exercise_type') in HOLD_RULES
+        return movement.get('exercise_type') in EXERCISE_RULES
+
+    def is_confident(self, vectors_data: Dict[str, Any]) -> bool:
+        """Whether classification and video quality are good enough to skip the LLM"""
+        movement = vectors_data.get('movement_analysis', {})
+        validation = vectors_data.get('validation', {})
+        quality = validation.get('quality_score', 1.0)
+        if movement.get('mode') == 'hold':
+            done = float(movement.get('hold', {}).get('hold_seconds', 0.0)) > 0
+        else:
+            done = int(vectors_data.get('rep_count', 0) or 0) > 0
+        return (
+            self.supports(vectors_data)
+            and float(movement.get('confidence', 0.0)) >= settings.rules_min_confidence
+            and float(quality) >= settings.rules_min_quality
+            and done
+        )
+
+    def _asymmetry(self, vectors_data: Dict[str, Any], joint: str) -> float:
+        """Mean absolute left/right angle difference, per frame when frames are available"""
+        left_key, right_key = f'left_{joint}_angle', f'right_{joint}_angle'
+        frames = [f for f in vectors_data.get('frames_data') or [] if left_key in f and right_key in f]
+        if frames:
+            return sum(abs(f[left_key] - f[right_key]) for f in frames) / len(frames)
+        movement = vectors_data.get('movement_analysis', {})
+        return abs(movement.get(f'avg_left_{joint}_angle', 0.0) - movement.get(f'avg_right_{joint}_angle', 0.0))
+
+    def _seconds_per_rep(self, vectors_data: Dict[str, Any]) -> Optional[float]:
+        reps = int(vectors_data.get('rep_count', 0) or 0)
+        if reps <= 0:
+            return None
+        sets = vectors_data.get('sets') or []
+        active = sum(s['end_time'] - s['start_time'] for s in sets) if sets else 0.0
+        return (active or float(vectors_data.get('duration', 0) or 0)) / reps
+
+    def evaluate(self, vectors_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Feedback with the same structure as the LLM response"""
+        movement = vectors_data.get('movement_analysis', {})
+        if movement.get('mode') == 'hold':
+            return self.evaluate_hold(vectors_data)
+        exercise = movement.get('exercise_type')
+        rules = EXERCISE_RULES[exercise]
+        tips = TIPS[exercise]
+        reps = int(vectors_data.get('rep_count', 0) or 0)
+
+        positive: List[str] = []
+        improvements: List[str] = []
+        specific_tips: List[str] = []
+        safety: List[str] = []
+        score = 10.0
+
+        rom = float(movement.get(f"{rules['joint']}_range", 0.0))
+        if rom < rules['rom_limited']:
+            range_of_motion = 'limited'
+            score -= 2.0
+            improvements.append(f"Range of motion is limited ({rom:.0f}° at the {rules['joint']})")
+            specific_tips.append(tips['limited'])
+        elif rom > rules['rom_excessive']:
+            range_of_motion = 'excessive'
+            score -= 1.0
+            improvements.append(f"Range of motion is larger than needed ({rom:.0f}° at the {rules['joint']})")
+            specific_tips.append(tips['excessive'])
+        else:
+            range_of_motion = 'full'
+            positive.append('Consistent full range of motion')
+
+        asymmetry = self._asymmetry(vectors_data, rules['joint'])
+        if asymmetry > settings.rules_asymmetry_degrees:
+            symmetry = 'imbalance detected'
+            score -= min(2.0, asymmetry / settings.rules_asymmetry_degrees)
+            improvements.append(f"Left and right {rules['joint']}s differ by {asymmetry:.0f}° on average")
+            specific_tips.append(tips['imbalance'])
+            if asymmetry > 2 * settings.rules_asymmetry_degrees:
+                safety.append('Noticeable left/right imbalance; reduce the load until both sides move evenly')
+        else:
+            symmetry = 'symmetrical'
+            positive.append('Balanced left and right sides')
+
+        seconds_per_rep = self._seconds_per_rep(vectors_data)
+        if seconds_per_rep is None:
+            tempo = 'not measured'
+        elif seconds_per_rep < rules['tempo_fast']:
+            tempo = 'too fast'
+            score -= 1.0
+            improvements.append(f'Reps are fast ({seconds_per_rep:.1f}s each)')
+            specific_tips.append(tips['fast'])
+            if seconds_per_rep < 0.6 * rules['tempo_fast']:
+                safety.append('Very fast reps increase injury risk; control the lowering phase')
+        elif seconds_per_rep > rules['tempo_slow']:
+            tempo = 'too slow'
+            score -= 0.5
+            improvements.append(f'Reps are slow ({seconds_per_rep:.1f}s each)')
+            specific_tips.append(tips['slow'])
+        else:
+            tempo = 'appropriate'
+            positive.append('Controlled, steady tempo')
+
+        if reps > 0:
+            positive.insert(0, f"Completed {reps} repetition{'s' if reps != 1 else ''}")
+        else:
+            score = min(score, NO_REPS_MAX_SCORE)
+            improvements.insert(0, 'No complete repetition was detected')
+            specific_tips.insert(0, 'Record at least one full repetition with your whole body in frame')
+        if not improvements:
+            improvements.append('Add load or reps gradually while keeping this form')
+        specific_tips.append(tips['good'])
+
+        return self._response(vectors_data, rules['name'], score, symmetry, range_of_motion, tempo,
+                              positive, improvements, specific_tips, safety)
+
+    def evaluate_hold(self, vectors_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Feedback for an isometric hold: hold time, body line, sag/pike and drift"""
+        movement = vectors_data.get('movement_analysis', {})
+        exercise = movement.get('exercise_type')
+        rules = HOLD_RULES[exercise]
+        tips = HOLD_TIPS[exercise]
+        hold = movement.get('hold', {})
+        line = hold.get('body_line', {})
+        drift = hold.get('drift', {})
+        seconds = float(hold.get('hold_seconds', 0.0))
+
+        positive: List[str] = [f"Held the position for {seconds:.0f} seconds"]
+        improvements: List[str] = []
+        specific_tips: List[str] = []
+        safety: List[str] = []
+        score = 10.0
+
+        if line.get('sag_ratio', 0.0) > 0.3:
+            body_line = 'hips sagging'
+            score -= 1.0 + 2.0 * line['sag_ratio']
+            improvements.append(f"Hips sag below the body line for {line['sag_ratio']:.0%} of the hold")
+            specific_tips.append(tips['sag'])
+            if line['sag_ratio'] > 0.6:
+                safety.append('Sagging hips load the lower back; shorten the hold and keep the line')
+        elif line.get('pike_ratio', 0.0) > 0.3:
+            body_line = 'hips piked'
+            score -= 1.0 + line['pike_ratio']
+            improvements.append(f"Hips are raised above the body line for {line['pike_ratio']:.0%} of the hold")
+            specific_tips.append(tips['pike'])
+        else:
+            body_line = 'straight'
+            positive.append(f"Straight body line (average {line.get('mean_degrees', 0):.0f}°)")
+
+        degrees_per_minute = drift.get('body_line_degrees_per_minute', 0.0)
+        if -degrees_per_minute > rules['drift_degrees_per_minute']:
+            stability = 'form fades over the hold'
+            score -= 1.0
+            improvements.append(
+                f"Body line drops from {drift['body_line_start_degrees']:.0f}° "
+                f"to {drift['body_line_end_degrees']:.0f}° by the end"
+            )
+            specific_tips.append(tips['drift'])
+        else:
+            stability = 'steady'
+            positive.append('Position stays steady through the hold')
+
+        if seconds < rules['short_seconds']:
+            score -= 1.0
+            improvements.append(f'Hold is short ({seconds:.0f}s)')
+            specific_tips.append(tips['short'])
+
+        if not improvements:
+            improvements.append('Extend the hold gradually while keeping this line')
+        specific_tips.append(tips['good'])
+
+        return self._response(vectors_data, rules['name'], score, f'body line {body_line}',
+                              'not applicable (static hold)', stability,
+                              positive, improvements, specific_tips, safety)
+
+    def _response(self, vectors_data: Dict[str, Any], name: str, score: float, symmetry: str,
+                  range_of_motion: str, tempo: str, positive: List[str], improvements: List[str],
+                  specific_tips: List[str], safety: List[str]) -> Dict[str, Any]:
+        movement = vectors_data.get('movement_analysis', {})
+        validation = vectors_data.get('validation', {})
+        overall = int(round(max(1.0, min(10.0, score))))
+        if overall >= 9:
+            form_quality = 'excellent'
+        elif overall >= 7:
+            form_quality = 'good'
+        elif overall >= 5:
+            form_quality = 'fair'
+        else:
+            form_quality = 'poor'
+
+        confident = (float(movement.get('confidence', 0.0)) >= 0.8
+                     and float(validation.get('quality_score', 1.0)) >= 0.9)
+
+        return {
+            'overall_score': overall,
+            'exercise_detected': name,
+            'technique_analysis': {
+                'form_quality': form_quality,
+                'symmetry': symmetry,
+                'range_of_motion': range_of_motion,
+                'tempo': tempo
+            },
+            'feedback': {
+                'positive': positive[:3],
+                'improvements': improvements[:3],
+                'specific_tips': specific_tips[:3]
+            },
+            'rep_count_accuracy': 'accurate' if confident else 'approximate',
+            'safety_concerns': safety
+        }
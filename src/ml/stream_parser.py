@@ -0,0 +1,113 @@
+"""
+Incremental parser for a JSON object that arrives in arbitrary text chunks
+"""
+import json
+from typing import Any, List, Tuple, Union
+
+PathItem = Union[str, int]
+
+_WHITESPACE = " \t\r\n"
+_LITERAL_END = ",}]" + _WHITESPACE
+
+
+class _Frame:
+    __slots__ = ('kind', 'key', 'index', 'state')
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key = None
+        self.index = 0
+        # object: key -> colon -> value -> comma; array: value -> comma
+        self.state = 'key' if kind == 'object' else 'value'
+
+
+class IncrementalJSONParser:
+    """Emits `(path, value)` for every scalar as soon as it is complete.
+
+    Text before the first `{` (e.g. a markdown fence) and after the closing `}`
+    is ignored. The final document should still be parsed as a whole; this
+    parser only exists to surface fields early.
+    """
+
+    def __init__(self):
+        self._stack: List[_Frame] = []
+        self._started = False
+        self.done = False
+        self._token_kind = None
+        self._token: List[str] = []
+        self._token_is_key = False
+        self._escape = False
+
+    def _path(self) -> List[PathItem]:
+        return [frame.key if frame.kind == 'object' else frame.index for frame in self._stack]
+
+    def _value_done(self, events: List[Tuple[List[PathItem], Any]], value: Any = None, scalar: bool = False) -> None:
+        if scalar:
+            events.append((self._path(), value))
+        if self._stack:
+            self._stack[-1].state = 'comma'
+
+    def feed(self, text: str) -> List[Tuple[List[PathItem], Any]]:
+        events: List[Tuple[List[PathItem], Any]] = []
+        for ch in text:
+            if self.done:
+                break
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._stack.append(_Frame('object'))
+                continue
+
+            if self._token_kind == 'string':
+                self._token.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    value = json.loads(''.join(self._token))
+                    self._token_kind = None
+                    if self._token_is_key:
+                        self._stack[-1].key = value
+                        self._stack[-1].state = 'colon'
+                    else:
+                        self._value_done(events, value, scalar=True)
+                continue
+
+            if self._token_kind == 'literal':
+                if ch not in _LITERAL_END:
+                    self._token.append(ch)
+                    continue
+                self._token_kind = None
+                try:
+                    self._value_done(events, json.loads(''.join(self._token)), scalar=True)
+                except json.JSONDecodeError:
+                    self._value_done(events)
+
+            if ch in _WHITESPACE:
+                continue
+            frame = self._stack[-1]
+            if ch == '"':
+                self._token_kind = 'string'
+                self._token = [ch]
+                self._token_is_key = frame.kind == 'object' and frame.state == 'key'
+            elif ch == ':':
+                frame.state = 'value'
+            elif ch == ',':
+                if frame.kind == 'object':
+                    frame.state = 'key'
+                else:
+                    frame.index += 1
+                    frame.state = 'value'
+            elif ch in '{[':
+                self._stack.append(_Frame('object' if ch == '{' else 'array'))
+            elif ch in '}]':
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._value_done(events)
+            else:
+                self._token_kind = 'literal'
+                self._token = [ch]
+        return events
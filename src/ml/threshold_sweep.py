@@ -0,0 +1,285 @@
+"""
+Offline threshold sweep: replays stored pose tracks through classification,
+rep counting and quality gates for a whole grid of parameter combinations.
+
+Per track, everything that does not depend on the swept parameters (features,
+joint ranges, DTW match, pose statistics) is computed once; the decisions are
+then evaluated for all combinations at once with numpy. Rep counters run
+once per distinct set of hysteresis parameters, not once per combination.
+"""
+import itertools
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from src.backend.core.config import settings
+from src.cv.quality_gates import (
+    GATE_PARAMS, PASS, evaluate_gates, gate_thresholds, motion_amplitude, motion_score, person_stats
+)
+from src.cv.video_processor import ANALYSIS_DEFAULTS, _smooth
+
+NAMED_EXERCISES = ('pullup', 'squat', 'deadlift', 'pushup')
+# Joint whose smoothed angle drives each exercise's rep counter
+ANGLE_SERIES = {'squat': 'knee', 'deadlift': 'hip', 'pushup': 'elbow'}
+SWEEP_PARAMS = tuple(ANALYSIS_DEFAULTS) + GATE_PARAMS + ('dtw_min_confidence',)
+
+
+def current_params() -> Dict[str, float]:
+    """Values in effect today for every sweepable parameter"""
+    return {**ANALYSIS_DEFAULTS, **gate_thresholds(), 'dtw_min_confidence': settings.dtw_min_confidence}
+
+
+def parse_grid(specs: List[str]) -> Dict[str, List[float]]:
+    """`name=v1,v2,...` or `name=start:stop:step` (stop inclusive) -> values per parameter"""
+    grid: Dict[str, List[float]] = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip().lower()
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Unknown parameter '{name}'. Sweepable: {', '.join(SWEEP_PARAMS)}")
+        if ':' in values:
+            start, stop, step = (float(v) for v in values.split(':'))
+            if step <= 0:
+                raise ValueError(f"Step must be positive in '{spec}'")
+            grid[name] = [round(v, 10) for v in np.arange(start, stop + step / 2, step)]
+        else:
+            grid[name] = [float(v) for v in values.split(',') if v.strip()]
+        if not grid[name]:
+            raise ValueError(f"No values in '{spec}'")
+    return grid
+
+
+def expand_grid(grid: Dict[str, List[float]]) -> Dict[str, np.ndarray]:
+    """Cartesian product as one array per parameter. Combination 0 is always the
+    current configuration, so every report has its baseline."""
+    base = current_params()
+    names = list(grid)
+    rows = [base] + [{**base, **dict(zip(names, values))} for values in itertools.product(*grid.values())]
+    return {name: np.array([row[name] for row in rows], dtype=float) for name in SWEEP_PARAMS}
+
+
+def _count_reps_angle_batch(angles: np.ndarray, flex: np.ndarray, extend: np.ndarray, min_amp: np.ndarray) -> np.ndarray:
+    """_count_reps_angle for K threshold sets at once"""
+    flexed = np.zeros(len(flex), dtype=bool)
+    reps = np.zeros(len(flex), dtype=int)
+    for a in angles:
+        to_flexed = ~flexed & (a <= flex)
+        to_extended = flexed & (a >= extend)
+        reps += to_extended
+        flexed = (flexed | to_flexed) & ~to_extended
+    return np.where(angles.max() - angles.min() < min_amp, 0, reps)
+
+
+def _count_reps_pullup_batch(y: np.ndarray, low_frac: np.ndarray, high_frac: np.ndarray, min_amp: np.ndarray) -> np.ndarray:
+    """_count_reps_pullup for K threshold sets at once"""
+    y_min = y.min()
+    amp = y.max() - y_min
+    low = y_min + low_frac * amp
+    high = y_min + high_frac * amp
+    up = np.zeros(len(low), dtype=bool)
+    reps = np.zeros(len(low), dtype=int)
+    for value in y:
+        to_up = ~up & (value <= low)
+        to_down = up & (value >= high)
+        reps += to_down
+        up = (up | to_up) & ~to_down
+    return np.where(amp < min_amp, 0, reps)
+
+
+def _unique_runs(columns: List[np.ndarray]):
+    """Distinct rows of the stacked columns and the index of each combination's row"""
+    stacked = np.stack(columns, axis=1)
+    return np.unique(stacked, axis=0, return_inverse=True)
+
+
+def _norm(v: float, lo: float, hi: float) -> float:
+    return max(0.0, min(1.0, (v - lo) / (hi - lo)))
+
+
+def _threshold_confidence(label: str, r: Dict[str, float]) -> float:
+    """Confidence formulas of analyze_movement_patterns for a threshold label"""
+    motion = max(r['wrist_y'], r['shoulder_y'])
+    if label == 'pullup':
+        return 0.4 + 0.3 * _norm(motion, 0.05, 0.12) + 0.3 * _norm(r['elbow'], 30, 80)
+    if label == 'squat':
+        return 0.4 + 0.4 * _norm(r['knee'], 50, 100) + 0.2 * _norm(motion, 0.03, 0.10)
+    if label == 'deadlift':
+        return 0.4 + 0.3 * _norm(r['hip'], 15, 60) + 0.3 * _norm(r['knee'], 20, 55)
+    if label == 'pushup':
+        return 0.4 + 0.3 * _norm(r['elbow'], 40, 90) + 0.3 * _norm(motion, 0.0, 0.03)
+    return 0.3
+
+
+def _vague_label(r: Dict[str, float]) -> str:
+    if r['elbow'] > 60 and r['knee'] < 30:
+        return 'upper_body'
+    if r['knee'] > 30 and r['elbow'] < 60:
+        return 'lower_body'
+    if r['elbow'] > 30 and r['knee'] > 30:
+        return 'full_body'
+    return 'unknown'
+
+
+class TrackReplay:
+    """Threshold-independent data of one analyzed track"""
+
+    def __init__(self, result: Dict[str, Any]):
+        frames = result['frames_data']
+        self.fps = result.get('fps') or 30.0
+        self.stats = person_stats(frames, int(result.get('source_total_frames') or len(frames)))
+        classifier = result['movement_analysis'].get('classifier')
+        self.dtw = (classifier['label'], classifier['confidence']) if classifier else None
+
+        def mean_series(left: str, right: str) -> np.ndarray:
+            return np.array([(f.get(left, 0.0) + f.get(right, 0.0)) / 2.0 for f in frames], dtype=float)
+
+        self.elbow_range = float(
+            max(max(f.get('left_elbow_angle', 0.0), f.get('right_elbow_angle', 0.0)) for f in frames)
+            - min(min(f.get('left_elbow_angle', 0.0), f.get('right_elbow_angle', 0.0)) for f in frames)
+        )
+        self.series = {
+            'wrist_y': mean_series('left_wrist_y', 'right_wrist_y'),
+            'shoulder_y': mean_series('left_shoulder_y', 'right_shoulder_y'),
+            'knee': mean_series('left_knee_angle', 'right_knee_angle'),
+            'hip': mean_series('left_hip_angle', 'right_hip_angle'),
+            'elbow': mean_series('left_elbow_angle', 'right_elbow_angle'),
+        }
+        self._smoothed: Dict[Any, np.ndarray] = {}
+
+    def smoothed(self, name: str, window: int) -> np.ndarray:
+        key = (name, window)
+        if key not in self._smoothed:
+            self._smoothed[key] = np.asarray(_smooth(self.series[name].tolist(), window), dtype=float)
+        return self._smoothed[key]
+
+    def ranges(self, window: int) -> Dict[str, float]:
+        r = {
+            name: float(self.smoothed(name, window).max() - self.smoothed(name, window).min())
+            for name in ('wrist_y', 'shoulder_y', 'knee', 'hip')
+        }
+        r['elbow'] = self.elbow_range
+        return r
+
+    def evaluate(self, combos: Dict[str, np.ndarray], truth: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Label, confidence, reps and gate code for every combination"""
+        count = len(combos['smooth_window'])
+        labels = np.empty(count, dtype=object)
+        confidence = np.zeros(count)
+        motion = np.zeros(count)
+        windows = combos['smooth_window'].astype(int)
+
+        for window in np.unique(windows):
+            idx = np.flatnonzero(windows == window)
+            c = {name: values[idx] for name, values in combos.items()}
+            r = self.ranges(int(window))
+            move = max(r['wrist_y'], r['shoulder_y'])
+            named = [
+                (move > c['pullup_motion_min']) & (r['elbow'] > c['pullup_elbow_min']) & (r['knee'] < c['pullup_knee_max']),
+                (r['knee'] > c['squat_knee_min']) & (move > c['squat_motion_min']),
+                (c['deadlift_knee_min'] <= r['knee']) & (r['knee'] <= c['deadlift_knee_max'])
+                & (r['hip'] > c['deadlift_hip_min']) & (move <= c['deadlift_motion_max']),
+                (r['elbow'] > c['pushup_elbow_min']) & (move <= c['pushup_motion_max']) & (r['knee'] < c['pushup_knee_max']),
+            ]
+            label = np.select(named, NAMED_EXERCISES, default=_vague_label(r)).astype(object)
+            conf = np.array([_threshold_confidence(name, r) for name in label])
+
+            if self.dtw is not None:
+                dtw_label, dtw_conf = self.dtw
+                vague = ~np.isin(label, NAMED_EXERCISES)
+                override = (dtw_conf >= c['dtw_min_confidence']) & (vague | (dtw_conf > conf))
+                label = np.where(override, dtw_label, label)
+                conf = np.where(override, dtw_conf, conf)
+
+            labels[idx] = label
+            confidence[idx] = np.clip(conf, 0.0, 1.0)
+            amp = motion_amplitude({
+                'elbow_range': r['elbow'], 'knee_range': r['knee'],
+                'shoulder_y_range': r['shoulder_y'], 'wrist_y_range': r['wrist_y'],
+            })
+            motion[idx] = motion_score(amp)
+
+        reps = self._reps(combos, windows, labels)
+        gate = evaluate_gates(
+            self.stats['frames_with_pose_ratio'], self.stats['avg_visibility'],
+            self.stats['min_keypoints_per_frame'], motion, self.fps, reps, combos,
+        )
+        out = {'label': labels, 'confidence': confidence, 'reps': reps, 'gate': gate}
+        if truth:
+            # Strict requests fail on a confident mismatch
+            out['strict_reject'] = (
+                (labels != truth) & (labels != 'unknown') & (confidence >= combos['exercise_confidence_min'])
+            )
+        return out
+
+    def _reps(self, combos: Dict[str, np.ndarray], windows: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        reps = np.zeros(len(labels), dtype=int)
+        for label in np.unique(labels):
+            idx = np.flatnonzero(labels == label)
+            if label == 'pullup':
+                keys = ['pullup_rep_low', 'pullup_rep_high', 'pullup_rep_min_amp']
+            elif label in ANGLE_SERIES:
+                keys = [f'{label}_rep_flex_pct', f'{label}_rep_extend_pct', f'{label}_rep_min_amp']
+            else:
+                # Generic estimate: largest joint range / 25 degrees
+                for window in np.unique(windows[idx]):
+                    r = self.ranges(int(window))
+                    sub = idx[windows[idx] == window]
+                    reps[sub] = max(0, int(max(r['elbow'], r['knee'], r['hip']) / 25))
+                continue
+
+            runs, inverse = _unique_runs([windows[idx].astype(float)] + [combos[k][idx] for k in keys])
+            run_reps = np.zeros(len(runs), dtype=int)
+            for window in np.unique(runs[:, 0]):
+                rows = np.flatnonzero(runs[:, 0] == window)
+                a, b, min_amp = runs[rows, 1], runs[rows, 2], runs[rows, 3]
+                if label == 'pullup':
+                    y = self.smoothed('shoulder_y', int(window))
+                    run_reps[rows] = _count_reps_pullup_batch(y, a, b, min_amp)
+                else:
+                    series = self.smoothed(ANGLE_SERIES[label], int(window))
+                    flex, extend = np.percentile(series, a), np.percentile(series, b)
+                    run_reps[rows] = _count_reps_angle_batch(series, flex, extend, min_amp)
+            reps[idx] = run_reps[inverse.reshape(-1)]
+        return np.minimum(reps, 200)
+
+
+def summarize(combos: Dict[str, np.ndarray], outcomes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-combination metrics over labeled tracks.
+
+    Each outcome holds the arrays from `TrackReplay.evaluate` plus the labels
+    `exercise` and `truth_reps` (either may be None) and `valid` (whether the
+    service should accept the clip).
+    """
+    count = len(combos['smooth_window'])
+
+    def stack(key: str, select) -> np.ndarray:
+        rows = [o[key] for o in outcomes if select(o)]
+        return np.stack(rows).astype(float) if rows else np.zeros((0, count))
+
+    valid = [o for o in outcomes if o['valid']]
+    rejected_valid = stack('gate', lambda o: o['valid']) != PASS
+    accepted_invalid = stack('gate', lambda o: not o['valid']) == PASS
+    correct = np.stack([o['label'] == o['exercise'] for o in valid if o['exercise']]) \
+        if any(o['exercise'] for o in valid) else np.zeros((0, count))
+    rep_error = np.stack([np.abs(o['reps'] - o['truth_reps']) for o in valid if o['truth_reps'] is not None]) \
+        if any(o['truth_reps'] is not None for o in valid) else np.zeros((0, count))
+    strict = stack('strict_reject', lambda o: o['valid'] and o['exercise'])
+
+    def mean(values: np.ndarray) -> np.ndarray:
+        return values.mean(axis=0) if len(values) else np.full(count, np.nan)
+
+    metrics = {
+        'false_reject_rate': mean(rejected_valid),
+        'false_accept_rate': mean(accepted_invalid),
+        'accuracy': mean(correct),
+        'rep_mae': mean(rep_error),
+        'rep_exact_rate': mean(rep_error == 0) if len(rep_error) else np.full(count, np.nan),
+        'strict_reject_rate': mean(strict),
+    }
+    rows = []
+    for i in range(count):
+        row = {'baseline': i == 0}
+        row.update({name: float(values[i]) for name, values in combos.items()})
+        row.update({name: float(values[i]) for name, values in metrics.items()})
+        rows.append(row)
+    return rows
@@ -0,0 +1,219 @@
+"""
+FitPose threshold sweep - evaluate analysis and gate thresholds on labeled pose tracks
+
+Usage:
+    python sweep.py labels.csv --grid motion_score_min=0.2:0.6:0.1 --grid squat_knee_min=45,55,65
+    python sweep.py labels.jsonl --grid-file grid.json --workers 8 --output sweep.csv
+
+The labels file (.csv or .jsonl) has one row per clip: `track_id` (or `video`,
+a file whose sha256 is looked up in the landmark store) and optionally
+`exercise`, `reps` and `valid` (false for clips the service should reject).
+Tracks are read from LANDMARK_STORE_DIR (or --tracks); the API saves them for
+every analyzed video and `batch.py --store-tracks` saves them for an archive.
+
+Every parameter combination is scored by false-reject rate (valid clips
+blocked by the gates), false-accept rate, classification accuracy, rep-count
+error and strict-mode mismatch rate. The first row is the current configuration.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print(f"Missing dependencies: {e}")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+from src.backend.core.config import settings
+from src.ml.threshold_sweep import SWEEP_PARAMS, expand_grid, parse_grid, summarize
+
+UNPROCESSABLE = -1
+METRICS = ['false_reject_rate', 'false_accept_rate', 'accuracy', 'rep_mae', 'rep_exact_rate', 'strict_reject_rate']
+
+# Per-process state, created once by the pool initializer
+_processor = None
+_store = None
+_combos: Dict[str, 'np.ndarray'] = {}
+
+
+def _init_worker(tracks_dir: str, combos: Dict[str, 'np.ndarray']) -> None:
+    global _processor, _store, _combos
+    from src.cv.landmark_store import LandmarkStore
+    from src.cv.video_processor import VideoProcessor
+
+    _processor = VideoProcessor()
+    _store = LandmarkStore(tracks_dir)
+    _combos = combos
+
+
+def _optional(value: Any) -> Any:
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) or value == '' else value
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    """Label rows with `track_id` or `video`, `exercise`, `truth_reps` and `valid`"""
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+    else:
+        raw = pd.read_csv(path).to_dict('records')
+
+    rows = []
+    for item in raw:
+        track_id, video = _optional(item.get('track_id')), _optional(item.get('video'))
+        if not track_id and not video:
+            print(f"Warning: label row without track_id or video skipped: {item}")
+            continue
+        exercise = _optional(item.get('exercise'))
+        reps = _optional(item.get('reps'))
+        valid = _optional(item.get('valid'))
+        rows.append({
+            'track_id': track_id,
+            'video': video,
+            'exercise': str(exercise).strip().lower() if exercise else None,
+            'truth_reps': int(reps) if reps is not None else None,
+            'valid': True if valid is None else str(valid).strip().lower() not in ('false', '0', 'no'),
+        })
+    return rows
+
+
+def evaluate_one(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs in a worker: replays one track over every combination"""
+    from src.cv.landmark_store import content_sha256
+    from src.ml.threshold_sweep import TrackReplay
+
+    started = time.perf_counter()
+    outcome = dict(row)
+    try:
+        track_id = row['track_id'] or content_sha256(row['video'])
+        outcome['track_id'] = track_id
+        track = _store.load(track_id)
+        if track is None:
+            outcome['error'] = 'track not found'
+            return outcome
+        result = _processor.analyze_track(track)
+    except Exception as e:
+        outcome['error'] = str(e)
+        return outcome
+
+    count = len(_combos['smooth_window'])
+    if not result:
+        # The service answers 422 regardless of thresholds
+        outcome.update(
+            label=np.full(count, 'unknown', dtype=object), confidence=np.zeros(count),
+            reps=np.zeros(count, dtype=int), gate=np.full(count, UNPROCESSABLE),
+        )
+        if row['exercise']:
+            outcome['strict_reject'] = np.zeros(count, dtype=bool)
+    else:
+        outcome.update(TrackReplay(result).evaluate(_combos, truth=row['exercise']))
+    outcome['seconds'] = time.perf_counter() - started
+    return outcome
+
+
+def parse_sort(order: str) -> List[str]:
+    """`order` is a comma list of metric or parameter names; a leading '-' sorts descending"""
+    keys = [key.strip() for key in order.split(',') if key.strip()]
+    unknown = [key.lstrip('-') for key in keys if key.lstrip('-') not in METRICS + list(SWEEP_PARAMS)]
+    if unknown:
+        raise ValueError(f"Unknown sort column(s): {', '.join(unknown)}")
+    return keys
+
+
+def sort_results(frame: 'pd.DataFrame', keys: List[str]) -> 'pd.DataFrame':
+    return frame.sort_values(
+        [key.lstrip('-') for key in keys],
+        ascending=[not key.startswith('-') for key in keys],
+        na_position='last',
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sweep analysis and gate thresholds over labeled pose tracks")
+    parser.add_argument('labels', nargs='?', help="labels file (.csv or .jsonl): track_id or video, exercise, reps, valid")
+    parser.add_argument('--grid', '-g', action='append', default=[],
+                        help="name=v1,v2,... or name=start:stop:step (repeatable)")
+    parser.add_argument('--grid-file', help="JSON object of name -> list of values or 'start:stop:step'")
+    parser.add_argument('--tracks', default=settings.landmark_store_dir, help="landmark store directory")
+    parser.add_argument('--workers', '-w', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="worker processes (default: CPU count - 1)")
+    parser.add_argument('--output', '-o', default='sweep_results.csv', help="results file (.csv or .parquet)")
+    parser.add_argument('--sort', default='false_reject_rate,-accuracy,rep_mae',
+                        help="ranking, comma-separated metrics; prefix '-' for descending")
+    parser.add_argument('--top', type=int, default=10, help="rows to print")
+    parser.add_argument('--list-params', action='store_true', help="print sweepable parameters and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.list_params:
+        from src.ml.threshold_sweep import current_params
+        for name, value in current_params().items():
+            print(f"{name} = {value}")
+        return 0
+    if not args.labels:
+        print("Error: a labels file is required")
+        return 2
+
+    specs = list(args.grid)
+    if args.grid_file:
+        with open(args.grid_file, encoding='utf-8') as f:
+            for name, values in json.load(f).items():
+                specs.append(f"{name}={values if isinstance(values, str) else ','.join(map(str, values))}")
+    try:
+        grid = parse_grid(specs)
+        sort_keys = parse_sort(args.sort)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    combos = expand_grid(grid)
+    labels = load_labels(args.labels)
+    count = len(combos['smooth_window'])
+    print(f"{len(labels)} labeled clips x {count} combinations with {args.workers} workers")
+
+    started = time.perf_counter()
+    outcomes, missing = [], 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=_init_worker, initargs=(args.tracks, combos)) as executor:
+        futures = [executor.submit(evaluate_one, row) for row in labels]
+        for future in as_completed(futures):
+            outcome = future.result()
+            if 'error' in outcome:
+                missing += 1
+                print(f"Warning: {outcome.get('track_id') or outcome.get('video')}: {outcome['error']}")
+            else:
+                outcomes.append(outcome)
+    if not outcomes:
+        print("No tracks could be evaluated")
+        return 2
+
+    frame = pd.DataFrame(summarize(combos, outcomes))
+    elapsed = time.perf_counter() - started
+    frame = sort_results(frame, sort_keys)
+    if args.output.endswith('.parquet'):
+        frame.to_parquet(args.output, index=False)
+    else:
+        frame.to_csv(args.output, index=False)
+
+    shown = ['baseline'] + [name for name in SWEEP_PARAMS if name in grid] + METRICS
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(frame[shown].head(args.top).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        print("\nCurrent configuration:")
+        print(frame[frame['baseline']][shown].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"\nEvaluated {len(outcomes)} tracks x {count} combinations in {elapsed:.1f}s "
+          f"({missing} skipped); results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
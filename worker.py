@@ -0,0 +1,165 @@
+"""
+FitPose worker - processes queued analysis jobs (POST /api/v1/jobs)
+
+Usage:
+    python worker.py
+    python worker.py --worker-id node2-a --max-jobs 500
+
+Leases jobs from the broker (JOB_BROKER_DB), reads each video from
+JOB_STORAGE_DIR, runs the same video processing and AI feedback as
+/api/v1/analyze-exercise and writes the result back to the broker. Start as
+many workers as there are cores to spare; they only share the broker database
+and the storage directory with the API. A job whose worker dies is delivered
+again after JOB_VISIBILITY_TIMEOUT_SECONDS.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+try:
+    from fastapi import HTTPException
+    from fastapi.concurrency import run_in_threadpool
+except ImportError as e:
+    print(f"Missing dependencies: {e}")
+    print("Run: pip install -r requirements.txt")
+    sys.exit(1)
+
+from src.backend.core.config import settings
+from src.backend.services.job_broker import FAILED, JobBroker, get_job_broker, job_video_path
+
+
+async def _keep_lease(broker: JobBroker, job: Dict[str, Any], visibility_timeout: float) -> None:
+    """Extends the lease while the job runs"""
+    while True:
+        await asyncio.sleep(visibility_timeout / 3)
+        if not broker.extend(job['job_id'], job['lease_token'], visibility_timeout):
+            print(f"Warning: lease on job {job['job_id']} lost; another worker may write its result")
+            return
+
+
+def _remove_video(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not delete job video {path}: {e}")
+
+
+async def run_job(job: Dict[str, Any], broker: JobBroker, video_service, analysis_service,
+                  visibility_timeout: float) -> str:
+    """Processes one leased job; returns 'done', 'failed', 'duplicate', 'queued' (retry later) or 'lost'"""
+    job_id, payload = job['job_id'], job['payload']
+    path = job_video_path(payload['video'])
+    lease = asyncio.create_task(_keep_lease(broker, job, visibility_timeout))
+    try:
+        if not os.path.exists(path):
+            broker.reject(job_id, {'status_code': 410, 'detail': 'Video is no longer in job storage'})
+            return FAILED
+        vectors_data = await video_service.process_source(
+            path,
+            expected_exercise=payload.get('exercise_type'),
+            strict=bool(payload.get('strict')),
+            client_id=payload.get('client_id') or 'anonymous',
+            start=payload.get('start'),
+            end=payload.get('end'),
+        )
+        # History is recorded below, once this delivery's result is the one kept
+        result = await analysis_service.analyze_exercise_data(vectors_data)
+    except HTTPException as e:
+        if e.status_code < 500:
+            # The video itself is unusable (no person, mismatch, ...); retrying cannot help
+            broker.reject(job_id, {'status_code': e.status_code, 'detail': e.detail})
+            _remove_video(path)
+            return FAILED
+        status = broker.release(job_id, job['lease_token'], f"{e.status_code}: {e.detail}",
+                                retry_delay=settings.job_retry_delay_seconds * job['attempt'])
+        if status == FAILED:
+            _remove_video(path)
+        return status
+    except Exception as e:
+        status = broker.release(job_id, job['lease_token'], str(e),
+                                retry_delay=settings.job_retry_delay_seconds * job['attempt'])
+        if status == FAILED:
+            _remove_video(path)
+        return status
+    finally:
+        lease.cancel()
+
+    if not broker.complete(job_id, result):
+        # An earlier delivery already finished this job
+        return 'duplicate'
+    user_id = payload.get('user_id')
+    if user_id and settings.history_enabled:
+        history_id = await run_in_threadpool(analysis_service.record_history, user_id, vectors_data, result['analysis'])
+        broker.annotate(job_id, {'history_id': history_id})
+    _remove_video(path)
+    return 'done'
+
+
+async def work(args: argparse.Namespace) -> int:
+    from src.backend.services.video_service import VideoService
+    from src.backend.services.analysis_service import AnalysisService
+
+    broker = get_job_broker()
+    video_service = VideoService()
+    analysis_service = AnalysisService()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # Finish the current job, then exit
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass
+
+    print(f"Worker {args.worker_id} polling {settings.job_broker_db}")
+    counts: Dict[str, int] = {}
+    handled = 0
+    while not stopping.is_set() and (not args.max_jobs or handled < args.max_jobs):
+        job = broker.lease(args.worker_id, args.visibility_timeout)
+        if job is None:
+            if args.exit_when_idle:
+                break
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=args.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        started = time.perf_counter()
+        outcome = await run_job(job, broker, video_service, analysis_service, args.visibility_timeout)
+        handled += 1
+        counts[outcome] = counts.get(outcome, 0) + 1
+        print(f"[{handled}] {outcome:9} {time.perf_counter() - started:7.2f}s job {job['job_id']} "
+              f"(attempt {job['attempt']})")
+
+    print(f"Worker {args.worker_id} stopped after {handled} jobs: {counts}")
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Process queued FitPose analysis jobs")
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="name recorded on leased jobs (default: host-pid)")
+    parser.add_argument('--visibility-timeout', type=float, default=settings.job_visibility_timeout_seconds,
+                        help="seconds a lease lasts without renewal")
+    parser.add_argument('--poll-interval', type=float, default=settings.job_poll_interval_seconds,
+                        help="seconds between polls of an empty queue")
+    parser.add_argument('--max-jobs', type=int, default=0, help="exit after this many jobs (0 = no limit)")
+    parser.add_argument('--exit-when-idle', action='store_true', help="exit once the queue is empty")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(work(parse_args(argv)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())